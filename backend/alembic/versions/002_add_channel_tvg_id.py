@@ -0,0 +1,26 @@
+"""Add tvg_id to live TV channels
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('live_tv_channels', sa.Column('tvg_id', sa.String(), nullable=True))
+    op.create_index(op.f('ix_live_tv_channels_tvg_id'), 'live_tv_channels', ['tvg_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_live_tv_channels_tvg_id'), table_name='live_tv_channels')
+    op.drop_column('live_tv_channels', 'tvg_id')
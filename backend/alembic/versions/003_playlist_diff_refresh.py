@@ -0,0 +1,30 @@
+"""Track channel identity and playlist content hash for diff refreshes
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('live_tv_channels', sa.Column('identity', sa.String(), nullable=True))
+    op.create_index('ix_live_tv_channels_playlist_identity', 'live_tv_channels', ['playlist_id', 'identity'], unique=False)
+    op.add_column('playlists', sa.Column('content_hash', sa.String(), nullable=True))
+    op.add_column('playlists', sa.Column('last_refreshed_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('playlists', 'last_refreshed_at')
+    op.drop_column('playlists', 'content_hash')
+    op.drop_index('ix_live_tv_channels_playlist_identity', table_name='live_tv_channels')
+    op.drop_column('live_tv_channels', 'identity')
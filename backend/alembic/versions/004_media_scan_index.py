@@ -0,0 +1,30 @@
+"""Add media scan index columns
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.alter_column('media', 'file_size', type_=sa.BigInteger(), existing_type=sa.Integer(), existing_nullable=True)
+    op.add_column('media', sa.Column('file_mtime', sa.Float(), nullable=True))
+    op.add_column('media', sa.Column('file_inode', sa.BigInteger(), nullable=True))
+    op.create_index(op.f('ix_media_file_path'), 'media', ['file_path'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_media_file_path'), table_name='media')
+    op.drop_column('media', 'file_inode')
+    op.drop_column('media', 'file_mtime')
+    op.alter_column('media', 'file_size', type_=sa.Integer(), existing_type=sa.BigInteger(), existing_nullable=True)
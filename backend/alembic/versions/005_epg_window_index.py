@@ -0,0 +1,24 @@
+"""Add EPG time window index
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_epg_data_channel_window', 'epg_data', ['channel_id', 'start_time', 'end_time'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_epg_data_channel_window', table_name='epg_data')
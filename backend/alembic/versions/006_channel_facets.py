@@ -0,0 +1,46 @@
+"""Add channel facet counts
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('channel_facets',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('playlist_id', sa.Integer(), nullable=False),
+    sa.Column('facet', sa.String(), nullable=False),
+    sa.Column('value', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['playlist_id'], ['playlists.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('playlist_id', 'facet', 'value', name='uq_channel_facets_playlist_facet_value')
+    )
+    op.create_index(op.f('ix_channel_facets_id'), 'channel_facets', ['id'], unique=False)
+    op.create_index('ix_channel_facets_facet_value', 'channel_facets', ['facet', 'value'], unique=False)
+
+    # Backfill from the channels already imported
+    for facet in ('category', 'language', 'country'):
+        op.execute(
+            f"INSERT INTO channel_facets (playlist_id, facet, value, count) "
+            f"SELECT playlist_id, '{facet}', {facet}, COUNT(*) FROM live_tv_channels "
+            f"WHERE is_active AND playlist_id IS NOT NULL AND {facet} IS NOT NULL "
+            f"GROUP BY playlist_id, {facet}"
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_channel_facets_facet_value', table_name='channel_facets')
+    op.drop_index(op.f('ix_channel_facets_id'), table_name='channel_facets')
+    op.drop_table('channel_facets')
@@ -0,0 +1,30 @@
+"""Add keyset pagination indexes
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_live_tv_channels_filter_keyset', 'live_tv_channels', ['is_active', 'category', 'language', 'country', 'id'], unique=False)
+    op.create_index('ix_live_tv_channels_category_keyset', 'live_tv_channels', ['is_active', 'category', 'id'], unique=False)
+    op.create_index('ix_live_tv_channels_active_keyset', 'live_tv_channels', ['is_active', 'id'], unique=False)
+    op.create_index('ix_media_type_keyset', 'media', ['media_type', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_media_type_keyset', table_name='media')
+    op.drop_index('ix_live_tv_channels_active_keyset', table_name='live_tv_channels')
+    op.drop_index('ix_live_tv_channels_category_keyset', table_name='live_tv_channels')
+    op.drop_index('ix_live_tv_channels_filter_keyset', table_name='live_tv_channels')
@@ -0,0 +1,44 @@
+"""Add trigram and full-text search indexes
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Other databases search through the in-process fallback index instead
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE INDEX ix_live_tv_channels_name_trgm ON live_tv_channels USING gin (name gin_trgm_ops)")
+    op.execute(
+        "CREATE INDEX ix_live_tv_channels_search ON live_tv_channels USING gin "
+        "(to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(category, '')))"
+    )
+    op.execute("CREATE INDEX ix_media_title_trgm ON media USING gin (title gin_trgm_ops)")
+    op.execute(
+        "CREATE INDEX ix_media_search ON media USING gin "
+        "(to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, '')))"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute("DROP INDEX IF EXISTS ix_media_search")
+    op.execute("DROP INDEX IF EXISTS ix_media_title_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_live_tv_channels_search")
+    op.execute("DROP INDEX IF EXISTS ix_live_tv_channels_name_trgm")
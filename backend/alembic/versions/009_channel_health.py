@@ -0,0 +1,36 @@
+"""Add channel health columns
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('live_tv_channels', sa.Column('health_checked_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('live_tv_channels', sa.Column('last_alive_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('live_tv_channels', sa.Column('latency_ms', sa.Integer(), nullable=True))
+    op.add_column('live_tv_channels', sa.Column('bitrate_kbps', sa.Integer(), nullable=True))
+    op.add_column('live_tv_channels', sa.Column('health_failures', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('live_tv_channels', sa.Column('health_rank', sa.Integer(), nullable=False, server_default='60000'))
+    op.create_index('ix_live_tv_channels_health_keyset', 'live_tv_channels', ['is_active', 'health_rank', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_live_tv_channels_health_keyset', table_name='live_tv_channels')
+    op.drop_column('live_tv_channels', 'health_rank')
+    op.drop_column('live_tv_channels', 'health_failures')
+    op.drop_column('live_tv_channels', 'bitrate_kbps')
+    op.drop_column('live_tv_channels', 'latency_ms')
+    op.drop_column('live_tv_channels', 'last_alive_at')
+    op.drop_column('live_tv_channels', 'health_checked_at')
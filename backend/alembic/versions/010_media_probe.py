@@ -0,0 +1,38 @@
+"""Add media probe columns
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('media', sa.Column('container', sa.String(), nullable=True))
+    op.add_column('media', sa.Column('video_codec', sa.String(), nullable=True))
+    op.add_column('media', sa.Column('audio_codec', sa.String(), nullable=True))
+    op.add_column('media', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('media', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('media', sa.Column('bitrate_kbps', sa.Integer(), nullable=True))
+    op.add_column('media', sa.Column('probed_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index('ix_media_probe_pending', 'media', ['probed_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_media_probe_pending', table_name='media')
+    op.drop_column('media', 'probed_at')
+    op.drop_column('media', 'bitrate_kbps')
+    op.drop_column('media', 'height')
+    op.drop_column('media', 'width')
+    op.drop_column('media', 'audio_codec')
+    op.drop_column('media', 'video_codec')
+    op.drop_column('media', 'container')
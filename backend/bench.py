@@ -0,0 +1,953 @@
+"""Benchmarks for the LiveTV backend hot paths.
+
+Run from the backend directory, e.g.:
+
+    python bench.py m3u --entries 150000
+    python bench.py media-stream --size-mb 128
+    python bench.py epg-grid --channels 2000 --days 7
+    python bench.py load --requests 2000 --concurrency 50
+    python bench.py auth --requests 20000
+    python bench.py paginate --channels 500000 --page 5000
+    python bench.py search --channels 1000000
+    python bench.py health --channels 50000 --hosts 20 --latency-ms 300
+    python bench.py probe --files 2000
+    python bench.py transcode --seconds 60
+    python bench.py metrics --requests 5000
+    python bench.py cluster --workers 3 --channels 4 --viewers 24 --failover
+
+Benchmarks that need a database default to a scratch SQLite file; pass
+--database-url (or set DATABASE_URL) to measure against PostgreSQL.
+"""
+import argparse
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _write_playlist(path: str, entries: int):
+    groups = ["News", "Sports", "Movies", "Kids", "Music", "Documentary"]
+    countries = ["US", "UK", "DE", "FR", "ES", "IT"]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("#EXTM3U\n")
+        for i in range(entries):
+            f.write(
+                f'#EXTINF:-1 tvg-id="ch{i}.tv" tvg-logo="http://logos.example/{i}.png" '
+                f'group-title="{random.choice(groups)}" tvg-language="English" '
+                f'tvg-country="{random.choice(countries)}",Channel {i}\n'
+                f"http://provider.example/live/{i}.ts\n"
+            )
+
+
+def bench_m3u(args):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from models import LiveTVChannel, Playlist
+    from services.channels import bulk_insert_channels
+    from services.m3u import iter_m3u_file
+    from services.perf import peak_rss_mb
+
+    workdir = tempfile.mkdtemp(prefix="livetv-bench-")
+    playlist_path = os.path.join(workdir, "bench.m3u")
+    _write_playlist(playlist_path, args.entries)
+
+    engine = create_engine(args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    db = Session()
+    playlist = Playlist(name="bench", file_path=playlist_path, playlist_type="m3u")
+    db.add(playlist)
+    db.commit()
+
+    if args.legacy:
+        # The previous implementation: readlines() plus one ORM object per entry
+        started = time.perf_counter()
+        with open(playlist_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        name = None
+        rows = 0
+        for line in lines:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                parts = line.split(",", 1)
+                name = parts[1] if len(parts) > 1 else None
+            elif line and not line.startswith("#") and name:
+                db.add(LiveTVChannel(name=name, url=line, category="General",
+                                     language="Unknown", country="Unknown",
+                                     playlist_id=playlist.id))
+                rows += 1
+                name = None
+        db.commit()
+        elapsed = time.perf_counter() - started
+        print(f"legacy: {rows} rows in {elapsed:.2f}s "
+              f"({rows / elapsed:.0f} rows/sec, peak RSS {peak_rss_mb():.0f} MB)")
+    else:
+        stats = bulk_insert_channels(db, playlist.id, iter_m3u_file(playlist_path), args.batch_size)
+        db.commit()
+        print(f"streaming: {stats.rows} rows in {stats.elapsed:.2f}s "
+              f"({stats.rows_per_sec:.0f} rows/sec, peak RSS {peak_rss_mb():.0f} MB)")
+    db.close()
+
+
+def _run_asgi_response(response, scope_extensions=None):
+    """Drive an ASGI response into a sink, returning (bytes sent, wall secs, cpu secs)"""
+    import asyncio
+
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    sent = 0
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal sent
+        if message["type"] == "http.response.body":
+            sent += len(message.get("body", b""))
+        elif message["type"] == "http.response.zerocopysend":
+            offset, count = message["offset"], message["count"]
+            fd = message["file"].fileno()
+            while count:
+                written = os.sendfile(devnull, fd, offset, count)
+                offset += written
+                count -= written
+                sent += written
+
+    scope = {"type": "http", "method": "GET", "headers": [], "extensions": scope_extensions or {}}
+    wall, cpu = time.perf_counter(), time.process_time()
+    asyncio.run(response(scope, receive, send))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    os.close(devnull)
+    return sent, wall, cpu
+
+
+def bench_media_stream(args):
+    from starlette.datastructures import Headers
+    from starlette.responses import StreamingResponse
+    from services.file_response import RangeFileResponse
+
+    path = os.path.join(tempfile.mkdtemp(prefix="livetv-bench-"), "bench.bin")
+    with open(path, "wb") as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(args.size_mb):
+            f.write(block)
+
+    def legacy():
+        # The previous implementation: iterate the binary file "line by line"
+        def iterfile():
+            with open(path, mode="rb") as file_like:
+                yield from file_like
+        return StreamingResponse(iterfile(), media_type="video/mp4")
+
+    strategies = {
+        "legacy": (legacy, None),
+        "chunked": (lambda: RangeFileResponse(path, Headers(), "video/mp4"), None),
+        "sendfile": (lambda: RangeFileResponse(path, Headers(), "video/mp4"), {"http.response.zerocopysend": {}}),
+    }
+    for name, (make_response, extensions) in strategies.items():
+        sent, wall, cpu = _run_asgi_response(make_response(), extensions)
+        print(f"{name:>8}: {sent / wall / 1e6:8.1f} MB/s, "
+              f"{cpu / (sent / 1e9):6.2f} CPU-s per GB ({sent // (1024 * 1024)} MB in {wall:.2f}s)")
+    os.remove(path)
+
+
+def bench_epg_grid(args):
+    from datetime import datetime, timedelta, timezone
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from models import EPGData, LiveTVChannel
+    from services.epg import guide_grid, now_next
+
+    workdir = tempfile.mkdtemp(prefix="livetv-bench-")
+    engine = create_engine(args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    db.execute(insert(LiveTVChannel), [
+        {"name": f"Channel {i}", "url": f"http://provider.example/live/{i}.ts", "is_active": True}
+        for i in range(args.channels)
+    ])
+    channel_ids = [row[0] for row in db.query(LiveTVChannel.id).order_by(LiveTVChannel.id)]
+
+    # Half-hour slots from a day ago through --days ahead, with jittered edges
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    first = now - timedelta(days=1)
+    slots = (args.days + 1) * 48
+    rows = 0
+    for channel_id in channel_ids:
+        batch = []
+        start = first + timedelta(minutes=random.randint(0, 29))
+        for _ in range(slots):
+            end = start + timedelta(minutes=random.choice((15, 30, 30, 60, 90)))
+            batch.append({"channel_id": channel_id, "title": "Programme", "start_time": start, "end_time": end})
+            start = end
+        db.execute(insert(EPGData), batch)
+        rows += len(batch)
+    db.commit()
+    print(f"seeded {rows} programmes for {len(channel_ids)} channels")
+
+    for name, run in {
+        "grid (3h)": lambda: guide_grid(db, channel_ids, now, now + timedelta(hours=3)),
+        "now/next": lambda: now_next(db, channel_ids, now + timedelta(minutes=7)),
+    }.items():
+        run()
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            result = run()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(f"{name:>10}: median {timings[len(timings) // 2] * 1000:.1f} ms, "
+              f"best {timings[0] * 1000:.1f} ms ({len(result)} channels)")
+    db.close()
+
+
+def _legacy_app():
+    """The previous /channels and /epg handlers: a sync Session inside async def"""
+    from fastapi import Depends, FastAPI, Query
+    from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+    from jose import jwt
+    from config import settings
+    from database import get_db
+    from models import EPGData, LiveTVChannel, User
+
+    app = FastAPI()
+    security = HTTPBearer()
+
+    def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db=Depends(get_db)):
+        payload = jwt.decode(credentials.credentials, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
+        return db.query(User).filter(User.username == payload["sub"]).first()
+
+    @app.get("/api/live-tv/channels")
+    async def get_channels(skip: int = 0, limit: int = 100, db=Depends(get_db), user=Depends(get_current_user)):
+        channels = db.query(LiveTVChannel).filter(LiveTVChannel.is_active == True).offset(skip).limit(limit).all()
+        return [{"id": c.id, "name": c.name, "logo_url": c.logo_url, "category": c.category,
+                 "language": c.language, "country": c.country, "is_active": c.is_active} for c in channels]
+
+    @app.get("/api/live-tv/epg")
+    async def get_epg(channel_id: int = Query(None), db=Depends(get_db), user=Depends(get_current_user)):
+        rows = db.query(EPGData).filter(EPGData.channel_id == channel_id).all()
+        return [{"id": e.id, "channel_id": e.channel_id, "title": e.title, "description": e.description,
+                 "start_time": e.start_time, "end_time": e.end_time} for e in rows]
+
+    return app
+
+
+def bench_load(args):
+    import asyncio
+    from datetime import datetime, timedelta, timezone
+    import httpx
+    from sqlalchemy import insert
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    elif "DATABASE_URL" not in os.environ:
+        workdir = tempfile.mkdtemp(prefix="livetv-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    from database import Base, SessionLocal, engine
+    from models import EPGData, LiveTVChannel, User
+    from routers.auth import create_access_token
+    import main
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if not db.query(User).filter(User.username == "bench").first():
+        db.add(User(username="bench", email="bench@example.com", hashed_password="!", is_admin=True))
+        db.execute(insert(LiveTVChannel), [
+            {"name": f"Channel {i}", "url": f"http://provider.example/live/{i}.ts",
+             "category": "General", "is_active": True}
+            for i in range(args.channels)
+        ])
+        start = datetime.now(timezone.utc) - timedelta(hours=12)
+        db.execute(insert(EPGData), [
+            {"channel_id": channel_id, "title": "Programme",
+             "start_time": start + timedelta(minutes=30 * slot),
+             "end_time": start + timedelta(minutes=30 * (slot + 1))}
+            for channel_id in range(1, args.channels + 1)
+            for slot in range(48)
+        ])
+        db.commit()
+    db.close()
+
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench'})}"}
+    paths = [
+        lambda i: f"/api/live-tv/channels?skip={(i * 100) % args.channels}&limit=100",
+        lambda i: f"/api/live-tv/epg?channel_id={i % args.channels + 1}",
+    ]
+
+    async def run(app):
+        semaphore = asyncio.Semaphore(args.concurrency)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+            async def one(i):
+                async with semaphore:
+                    response = await client.get(paths[i % len(paths)](i))
+                    response.raise_for_status()
+
+            await one(0)
+            started = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.requests)))
+            return time.perf_counter() - started
+
+    for name, app in (("legacy", _legacy_app()), ("async", main.app)):
+        elapsed = asyncio.run(run(app))
+        print(f"{name:>7}: {args.requests / elapsed:8.1f} req/s "
+              f"({args.requests} requests, concurrency {args.concurrency}, {elapsed:.2f}s)")
+
+
+def bench_auth(args):
+    import asyncio
+    from fastapi.security import HTTPAuthorizationCredentials
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    elif "DATABASE_URL" not in os.environ:
+        workdir = tempfile.mkdtemp(prefix="livetv-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    from config import settings
+    from database import AsyncSessionLocal, Base, SessionLocal, engine
+    from models import User
+    from routers.auth import create_access_token, get_current_user
+    from services.auth_cache import user_cache
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    if not db.query(User).filter(User.username == "bench").first():
+        db.add(User(username="bench", email="bench@example.com", hashed_password="!"))
+        db.commit()
+    db.close()
+
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=create_access_token({"sub": "bench"}))
+
+    async def run() -> float:
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            # One session per call, as the request-scoped dependency would open
+            async with AsyncSessionLocal() as session:
+                await get_current_user(credentials, session)
+        return time.perf_counter() - started
+
+    for name, enabled in (("uncached", False), ("cached", True)):
+        settings.auth_cache_enabled = enabled
+        elapsed = asyncio.run(run())
+        print(f"{name:>9}: {elapsed / args.requests * 1e6:7.1f} us per request ({args.requests} requests)")
+    print(f"hit ratio: tokens {user_cache.tokens.stats()['hit_ratio']:.4f}, "
+          f"users {user_cache.users.stats()['hit_ratio']:.4f}, db loads {user_cache.db_loads}")
+
+
+def bench_paginate(args):
+    from sqlalchemy import create_engine, func, insert, select
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+    from models import LiveTVChannel
+    from services.pagination import keyset
+
+    workdir = tempfile.mkdtemp(prefix="livetv-bench-")
+    engine = create_engine(args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    groups = ["News", "Sports", "Movies", "Kids", "Music", "Documentary"]
+    for start in range(0, args.channels, 50000):
+        db.execute(insert(LiveTVChannel), [
+            {"name": f"Channel {i}", "url": f"http://provider.example/live/{i}.ts", "is_active": True,
+             "category": groups[i % len(groups)], "language": "English", "country": "US"}
+            for i in range(start, min(start + 50000, args.channels))
+        ])
+    db.commit()
+    print(f"seeded {args.channels} channels")
+
+    def timed(query) -> float:
+        db.execute(query).all()
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            rows = db.execute(query).all()
+            timings.append(time.perf_counter() - started)
+        assert len(rows) == args.limit, "not enough rows for that page; raise --channels"
+        return sorted(timings)[len(timings) // 2] * 1000
+
+    for label, filters in (("all", []), ("category", [LiveTVChannel.category == "Sports"])):
+        base = select(LiveTVChannel.id, LiveTVChannel.name).where(LiveTVChannel.is_active == True, *filters)
+        # The cursor a client would hold after walking to the requested page,
+        # or to the last full page when the filter matches fewer rows
+        total = db.execute(select(func.count()).select_from(base.subquery())).scalar()
+        page = min(args.page, total // args.limit)
+        offset = (page - 1) * args.limit
+        last_id = db.execute(base.order_by(LiveTVChannel.id).offset(offset - 1).limit(1)).scalar()
+
+        results = {
+            "offset p1": timed(base.order_by(LiveTVChannel.id).limit(args.limit)),
+            f"offset p{page}": timed(base.order_by(LiveTVChannel.id).offset(offset).limit(args.limit)),
+            "cursor p1": timed(keyset(base, [LiveTVChannel.id]).limit(args.limit)),
+            f"cursor p{page}": timed(keyset(base, [LiveTVChannel.id], [last_id]).limit(args.limit)),
+        }
+        print(f"{label:>9}: " + ", ".join(f"{name} {ms:.2f} ms" for name, ms in results.items()))
+    db.close()
+
+
+def bench_search(args):
+    from services.search import NgramIndex
+
+    words = ["news", "sports", "movies", "kids", "music", "discovery", "history", "cinema",
+             "premium", "action", "comedy", "nature", "world", "classic", "family", "science"]
+    groups = ["News", "Sports", "Movies", "Kids", "Music", "Documentary"]
+    rng = random.Random(1)
+
+    started = time.perf_counter()
+    index = NgramIndex()
+    for i in range(args.channels):
+        name = f"{rng.choice(words).title()} {rng.choice(words).title()} {i}"
+        index.add(i + 1, name, groups[i % len(groups)])
+    print(f"indexed {len(index)} channels in {time.perf_counter() - started:.1f}s")
+
+    queries = {
+        "word": "discovery",
+        "two words": "discovery science",
+        "typo": "discovry",
+        "prefix": "disc",
+        "name + number": f"history {args.channels // 2}",
+    }
+    for label, query in queries.items():
+        prefix = label == "prefix"
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            hits = index.search(query, args.limit, prefix)
+            timings.append(time.perf_counter() - started)
+        ms = sorted(timings)[len(timings) // 2] * 1000
+        print(f"{label:>14}: {ms:7.2f} ms, {len(hits)} hits for {query!r}")
+    print("(in-process fallback index; on PostgreSQL the same queries use the migration 008 GIN indexes)")
+
+
+def _ts_sample(bitrate: int, packets: int) -> bytes:
+    """MPEG-TS packets with a PCR on PID 0x100 every tenth packet, paced for `bitrate`"""
+    out = bytearray()
+    for i in range(packets):
+        header = bytes([0x47, 0x01, 0x00, 0x30])
+        if i % 10 == 0:
+            pcr_base = i * 188 * 8 * 90000 // bitrate
+            adaptation = bytes([
+                7, 0x10, (pcr_base >> 25) & 0xFF, (pcr_base >> 17) & 0xFF,
+                (pcr_base >> 9) & 0xFF, (pcr_base >> 1) & 0xFF, ((pcr_base & 1) << 7) | 0x7E, 0,
+            ])
+        else:
+            adaptation = bytes([0])
+        out += header + adaptation + b"\xff" * (184 - len(adaptation))
+    return bytes(out)
+
+
+def bench_health(args):
+    import asyncio
+    import httpx
+    from sqlalchemy import func, insert, select
+
+    workdir = tempfile.mkdtemp(prefix="livetv-bench-")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    from config import settings
+    from database import Base, SessionLocal, engine
+    from models import LiveTVChannel
+    from services.health import check_channels
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.execute(insert(LiveTVChannel), [
+        {"name": f"Channel {i}", "url": f"http://host{i % args.hosts}.example/live/{i}.ts",
+         "category": "General", "is_active": True}
+        for i in range(args.channels)
+    ])
+    db.commit()
+    print(f"seeded {args.channels} channels on {args.hosts} hosts, {args.dead_percent}% dead")
+
+    sample = _ts_sample(4_000_000, settings.health_probe_bytes // 188)
+
+    async def upstream(request):
+        # Simulated provider: fixed latency, a share of channels answering with an error page
+        await asyncio.sleep(args.latency_ms / 1000)
+        channel = int(request.url.path.rsplit("/", 1)[1].split(".")[0])
+        if channel % 100 < args.dead_percent:
+            return httpx.Response(200, headers={"content-type": "text/html"}, content=b"<html>Not found</html>")
+        return httpx.Response(200, headers={"content-type": "video/mp2t"}, content=sample)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(upstream)) as client:
+            return await check_channels(client=client)
+
+    result = asyncio.run(run())
+    print(f"{result['channels_per_sec']:.0f} channels/sec, {result['elapsed_seconds']:.1f}s "
+          f"(concurrency {settings.health_concurrency}, {settings.health_per_host_concurrency} per host)")
+    bitrates = db.execute(select(func.avg(LiveTVChannel.bitrate_kbps))).scalar()
+    print(f"estimated bitrate {bitrates:.0f} kbps (stream is 4000 kbps)")
+    db.close()
+
+
+def _box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def _mp4_sample(seconds: float, width: int, height: int, mdat: int) -> bytes:
+    """An MP4 with its moov box after the media data, as cameras and most encoders write it"""
+    def trak(handler, sample_format, w=0, h=0):
+        tkhd = _box(b"tkhd", bytes(76) + struct.pack(">II", w << 16, h << 16))
+        hdlr = _box(b"hdlr", bytes(8) + handler + bytes(13))
+        stsd = _box(b"stsd", struct.pack(">II", 0, 1) + _box(sample_format, bytes(8)))
+        return _box(b"trak", tkhd + _box(b"mdia", hdlr + _box(b"minf", _box(b"stbl", stsd))))
+
+    mvhd = _box(b"mvhd", bytes(12) + struct.pack(">II", 1000, int(seconds * 1000)) + bytes(80))
+    moov = _box(b"moov", mvhd + trak(b"vide", b"avc1", width, height) + trak(b"soun", b"mp4a"))
+    return _box(b"ftyp", b"isom" + bytes(4) + b"isomavc1") + _box(b"mdat", bytes(mdat)) + moov
+
+
+def _ebml(element_id: int, payload: bytes) -> bytes:
+    # 8-byte size field, as muxers that patch sizes in afterwards write it
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, "big") + ((1 << 56) | len(payload)).to_bytes(8, "big") + payload
+
+
+def _mkv_sample(seconds: float, width: int, height: int, cluster: int) -> bytes:
+    def track(track_type, codec, video=b""):
+        return _ebml(0xAE, _ebml(0x83, bytes([track_type])) + _ebml(0x86, codec) + video)
+
+    info = _ebml(0x1549A966, _ebml(0x2AD7B1, (1_000_000).to_bytes(3, "big")) + _ebml(0x4489, struct.pack(">d", seconds * 1000)))
+    video = _ebml(0xE0, _ebml(0xB0, width.to_bytes(2, "big")) + _ebml(0xBA, height.to_bytes(2, "big")))
+    tracks = _ebml(0x1654AE6B, track(1, b"V_MPEG4/ISO/AVC", video) + track(2, b"A_AAC"))
+    return _ebml(0x1A45DFA3, _ebml(0x4282, b"matroska")) + _ebml(0x18538067, info + tracks + _ebml(0x1F43B675, bytes(cluster)))
+
+
+def _mp3_sample(frames: int) -> bytes:
+    # ID3v2 tag, then MPEG-1 layer III frames at 128 kbps / 44.1 kHz (417 bytes each)
+    tag = b"ID3\x03\x00\x00" + bytes([0, 0, 8, 0]) + bytes(1024)
+    return tag + (b"\xff\xfb\x90\x00" + bytes(413)) * frames
+
+
+def _flac_sample(seconds: float, audio: int) -> bytes:
+    packed = (44100 << 44) | (1 << 41) | (15 << 36) | int(seconds * 44100)
+    streaminfo = bytes(10) + packed.to_bytes(8, "big") + bytes(16)
+    return b"fLaC" + bytes([0x80]) + len(streaminfo).to_bytes(3, "big") + streaminfo + bytes(audio)
+
+
+def bench_probe(args):
+    from sqlalchemy import func, select
+
+    workdir = tempfile.mkdtemp(prefix="livetv-bench-")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["MEDIA_PATH"] = os.path.join(workdir, "library")
+    if args.no_ffprobe:
+        os.environ["FFPROBE_PATH"] = ""
+
+    from config import settings
+    from database import Base, SessionLocal, engine
+    from models import Media
+    from services.media_probe import probe_media_library
+    from services.scanner import scan_media_library
+
+    size = args.size_kb * 1024
+    samples = {
+        "mp4": _mp4_sample(5400.0, 1920, 1080, size),
+        "mkv": _mkv_sample(2700.0, 1280, 720, size),
+        "mp3": _mp3_sample(size // 417),
+        "flac": _flac_sample(240.0, size),
+    }
+    for i in range(args.files):
+        extension = list(samples)[i % len(samples)]
+        directory = os.path.join(settings.media_path, f"dir{i // 500}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file{i}.{extension}"), "wb") as f:
+            f.write(samples[extension])
+
+    Base.metadata.create_all(bind=engine)
+    scan_media_library()
+    print(f"{args.files} files of ~{args.size_kb} KB, ffprobe: {bool(settings.ffprobe_path and shutil.which(settings.ffprobe_path))}, "
+          f"{args.workers or settings.media_probe_workers} workers")
+
+    first = probe_media_library(workers=args.workers)
+    second = probe_media_library(workers=args.workers)
+    print(f"first run: {first['files_per_sec']:.0f} files/sec ({first['failed']} failed); "
+          f"rerun: {second['files']} files in {second['elapsed_seconds']:.2f}s")
+
+    db = SessionLocal()
+    rows = db.execute(
+        select(Media.container, Media.video_codec, Media.audio_codec, Media.width, Media.height, func.avg(Media.duration))
+        .group_by(Media.container, Media.video_codec, Media.audio_codec, Media.width, Media.height)
+    ).all()
+    for row in rows:
+        print("  ", tuple(row))
+    db.close()
+
+
+def bench_transcode(args):
+    import asyncio
+    import subprocess
+
+    from config import settings
+    from services.transcode import plan, transcode_manager, transcode_slots
+
+    if shutil.which(settings.ffmpeg_path) is None:
+        sys.exit("ffmpeg is required for this benchmark")
+
+    # Generated test pattern with a tone: H.264/AAC (remuxable) and MPEG-4 Part 2 (needs a transcode)
+    workdir = tempfile.mkdtemp(prefix="livetv-bench-")
+    sources = {}
+    for name, codec in (("h264", "libx264"), ("mpeg4", "mpeg4")):
+        sources[name] = os.path.join(workdir, f"pattern-{name}.mkv")
+        subprocess.run([
+            settings.ffmpeg_path, "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc2=size=1920x1080:rate=25:duration={args.seconds}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={args.seconds}",
+            "-c:v", codec, "-c:a", "aac", sources[name],
+        ], check=True)
+
+    async def run(name, codec, quality):
+        started = time.perf_counter()
+        session = await transcode_manager.open(sources[name], plan(codec, "aac", quality), "bench")
+        first_segment = time.perf_counter() - started
+        await session.process.wait()
+        total = time.perf_counter() - started
+        print(f"{session.steps['mode']:9} {name:5} {quality:8}: first segment {first_segment:.2f}s, "
+              f"{args.seconds / total:.1f}x realtime")
+
+    async def main():
+        print(f"{transcode_slots()} transcode slots ({os.cpu_count()} cores, {settings.transcode_threads} threads each)")
+        await run("h264", "h264", "original")
+        await run("mpeg4", "mpeg4", "original")
+        await run("h264", "h264", "720p")
+        await transcode_manager.close()
+
+    asyncio.run(main())
+
+
+def bench_metrics(args):
+    import asyncio
+    from fastapi import Depends, FastAPI
+    from sqlalchemy import select
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    elif "DATABASE_URL" not in os.environ:
+        workdir = tempfile.mkdtemp(prefix="livetv-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    from database import Base, async_engine, engine, get_async_db
+    from models import LiveTVChannel
+    from services.metrics import MetricsMiddleware, instrument_engine, render_metrics, uninstrument_engine
+
+    Base.metadata.create_all(bind=engine)
+
+    def build(instrumented: bool) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/static/{item_id}")
+        async def static(item_id: int):
+            return {"id": item_id}
+
+        @app.get("/query/{item_id}")
+        async def query(item_id: int, db=Depends(get_async_db)):
+            for _ in range(args.queries):
+                await db.execute(select(LiveTVChannel.id).where(LiveTVChannel.id == item_id))
+            return {"id": item_id}
+
+        if instrumented:
+            app.add_middleware(MetricsMiddleware)
+        return app
+
+    async def call(app, path: str):
+        # Straight through the ASGI interface, so client overhead doesn't hide the middleware's
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+            "query_string": b"", "headers": [], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            pass
+
+        await app(scope, receive, send)
+
+    async def run(app, path: str) -> float:
+        await call(app, path.format(0))
+        started = time.perf_counter()
+        for i in range(args.requests):
+            await call(app, path.format(i % 1000))
+        return time.perf_counter() - started
+
+    async def main():
+        plain, instrumented = build(False), build(True)
+        for name, path in (("no db", "/static/{}"), (f"{args.queries} queries", "/query/{}")):
+            # Alternated, best of each, so warm-up and GC pauses don't all land on one side
+            baseline = measured = float("inf")
+            for _ in range(args.repeat):
+                uninstrument_engine(async_engine.sync_engine)
+                baseline = min(baseline, await run(plain, path))
+                instrument_engine(async_engine.sync_engine)
+                measured = min(measured, await run(instrumented, path))
+            per_plain = baseline / args.requests * 1e6
+            per_instrumented = measured / args.requests * 1e6
+            print(f"{name:>10}: {per_plain:7.1f} us plain, {per_instrumented:7.1f} us instrumented, "
+                  f"overhead {per_instrumented - per_plain:+6.1f} us ({(measured / baseline - 1) * 100:+.1f}%)")
+
+        started = time.perf_counter()
+        body, _ = await render_metrics()
+        print(f"    scrape: {(time.perf_counter() - started) * 1000:.1f} ms, {len(body) / 1024:.0f} KiB")
+        await async_engine.dispose()
+
+    asyncio.run(main())
+
+
+def bench_cluster(args):
+    """Several API workers sharing Redis, with viewers spread over them.
+
+    A fake provider counts its connections: however many workers carry
+    viewers of a channel, it should only ever see one at a time per channel.
+    """
+    import asyncio
+    import signal
+    import subprocess
+    import httpx
+
+    workdir = tempfile.mkdtemp(prefix="livetv-cluster-")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'cluster.db')}",
+        REDIS_URL=args.redis_url,
+        MEDIA_PATH=workdir,
+        RELAY_OWNER_TTL=str(args.owner_ttl),
+        JOB_BACKEND="redis",
+    )
+    os.environ.update(env)
+    backend = os.path.dirname(os.path.abspath(__file__))
+
+    import redis as sync_redis
+    try:
+        sync_redis.Redis.from_url(args.redis_url).ping()
+    except Exception as e:
+        sys.exit(f"Redis is required for this benchmark ({args.redis_url}): {e}")
+
+    # The single migration step the workers rely on
+    subprocess.run([sys.executable, os.path.join(backend, "migrate.py")], env=env, check=True, capture_output=True)
+
+    from sqlalchemy import insert
+    from database import SessionLocal
+    from models import LiveTVChannel, User
+    from routers.auth import create_access_token
+
+    upstream = {"active": {}, "peak": {}, "opened": {}}
+
+    async def provider(reader, writer):
+        request = await reader.readuntil(b"\r\n\r\n")
+        path = request.split(b" ", 2)[1].decode()
+        upstream["active"][path] = upstream["active"].get(path, 0) + 1
+        upstream["opened"][path] = upstream["opened"].get(path, 0) + 1
+        upstream["peak"][path] = max(upstream["peak"].get(path, 0), upstream["active"][path])
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: video/mp2t\r\nConnection: close\r\n\r\n")
+            packet = b"\x47" + bytes(187)
+            while True:
+                writer.write(packet * 100)  # about 1 Mbit/s at this pace
+                await writer.drain()
+                await asyncio.sleep(0.15)
+        except (ConnectionError, OSError, asyncio.CancelledError):
+            pass
+        finally:
+            upstream["active"][path] -= 1
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(provider, "127.0.0.1", 0)
+        provider_port = server.sockets[0].getsockname()[1]
+
+        db = SessionLocal()
+        db.add(User(username="bench", email="bench@example.com", hashed_password="!", is_admin=True))
+        db.execute(insert(LiveTVChannel), [
+            {"name": f"Channel {i}", "url": f"http://127.0.0.1:{provider_port}/live/{i}.ts", "is_active": True}
+            for i in range(args.channels)
+        ])
+        db.commit()
+        db.close()
+        sync_redis.Redis.from_url(args.redis_url).flushdb()
+
+        # One port per worker, so the harness decides which worker each viewer lands on
+        workers = [
+            subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port + i), "--workers", "1", "--log-level", "warning"],
+                cwd=backend, env=env,
+            )
+            for i in range(args.workers)
+        ]
+        headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench'})}"}
+        received = {}
+        try:
+            async with httpx.AsyncClient(headers=headers, timeout=None) as client:
+                for i in range(args.workers):
+                    for _ in range(100):
+                        try:
+                            if (await client.get(f"http://127.0.0.1:{args.port + i}/health/live")).status_code == 200:
+                                break
+                        except httpx.TransportError:
+                            pass
+                        await asyncio.sleep(0.2)
+                    else:
+                        sys.exit(f"worker {i} did not start")
+
+                async def viewer(number: int, deadline: float):
+                    # Every channel gets viewers on every worker
+                    channel = number % args.channels + 1
+                    worker = (number // args.channels) % args.workers
+                    url = f"http://127.0.0.1:{args.port + worker}/api/live-tv/channels/{channel}/stream"
+                    received[number] = [worker, 0, 0.0]  # worker, bytes, time of the last chunk
+                    try:
+                        async with client.stream("GET", url) as response:
+                            response.raise_for_status()
+                            async for chunk in response.aiter_bytes():
+                                received[number][1] += len(chunk)
+                                received[number][2] = time.monotonic()
+                                if time.monotonic() > deadline:
+                                    return
+                    except httpx.HTTPError:
+                        pass  # its worker was killed
+
+                deadline = time.monotonic() + args.seconds
+                viewers = [asyncio.create_task(viewer(n, deadline)) for n in range(args.viewers)]
+
+                killed = None
+                if args.failover:
+                    await asyncio.sleep(args.seconds / 3)
+                    # Kill the worker that owns channel 1 and check another takes over
+                    r = sync_redis.Redis.from_url(args.redis_url)
+                    owner = next(r.scan_iter("relay:owner:1:*"), None)
+                    pid = int(r.get(owner).decode().split(":")[1]) if owner else None
+                    killed = next((i for i, p in enumerate(workers) if p.pid == pid), None)
+                    if killed is not None:
+                        workers[killed].send_signal(signal.SIGKILL)
+                        killed_at = time.monotonic()
+                        print(f"killed worker {killed}, owner of channel 1")
+
+                await asyncio.gather(*viewers)
+        finally:
+            for process in workers:
+                if process.poll() is None:
+                    process.terminate()
+            for process in workers:
+                process.wait()
+            server.close()
+
+        peak = max(upstream["peak"].values(), default=0)
+        opened = sum(upstream["opened"].values())
+        alive = [value for value in received.values() if value[0] != killed]
+        print(f"{args.workers} workers, {args.channels} channels, {args.viewers} viewers for {args.seconds}s")
+        print(f"upstream connections: {opened} opened, at most {peak} at a time per channel")
+        print(f"viewer throughput: {sum(v[1] for v in alive) / len(alive) / args.seconds / 1024:.0f} KiB/s on average")
+        if killed is not None:
+            recovered = sum(1 for value in alive if value[2] > killed_at + args.owner_ttl)
+            print(f"failover: {recovered}/{len(alive)} viewers on surviving workers still receiving after the owner died")
+        ok = peak == 1 and all(value[1] > 0 for value in alive)
+        print("PASS" if ok else "FAIL")
+        if not ok:
+            sys.exit(1)
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    m3u = subparsers.add_parser("m3u", help="M3U playlist import throughput and peak memory")
+    m3u.add_argument("--entries", type=int, default=150000)
+    m3u.add_argument("--batch-size", type=int, default=None)
+    m3u.add_argument("--database-url", default=None, help="defaults to a scratch SQLite file")
+    m3u.add_argument("--legacy", action="store_true", help="run the old readlines/ORM import instead")
+    m3u.set_defaults(func=bench_m3u)
+
+    media = subparsers.add_parser("media-stream", help="media file streaming throughput and CPU per stream")
+    media.add_argument("--size-mb", type=int, default=128)
+    media.set_defaults(func=bench_media_stream)
+
+    epg = subparsers.add_parser("epg-grid", help="guide grid and now/next query latency")
+    epg.add_argument("--channels", type=int, default=2000)
+    epg.add_argument("--days", type=int, default=7)
+    epg.add_argument("--repeat", type=int, default=10)
+    epg.add_argument("--database-url", default=None, help="defaults to a scratch SQLite file")
+    epg.set_defaults(func=bench_epg_grid)
+
+    load = subparsers.add_parser("load", help="requests/sec on /channels and /epg, sync vs async sessions")
+    load.add_argument("--channels", type=int, default=2000)
+    load.add_argument("--requests", type=int, default=2000)
+    load.add_argument("--concurrency", type=int, default=50)
+    load.add_argument("--database-url", default=None, help="defaults to DATABASE_URL, then a scratch SQLite file")
+    load.set_defaults(func=bench_load)
+
+    auth = subparsers.add_parser("auth", help="per-request cost of get_current_user with and without the cache")
+    auth.add_argument("--requests", type=int, default=20000)
+    auth.add_argument("--database-url", default=None, help="defaults to DATABASE_URL, then a scratch SQLite file")
+    auth.set_defaults(func=bench_auth)
+
+    paginate = subparsers.add_parser("paginate", help="channel page latency, offset vs cursor, first vs deep page")
+    paginate.add_argument("--channels", type=int, default=500000)
+    paginate.add_argument("--page", type=int, default=5000)
+    paginate.add_argument("--limit", type=int, default=100)
+    paginate.add_argument("--repeat", type=int, default=10)
+    paginate.add_argument("--database-url", default=None, help="defaults to a scratch SQLite file")
+    paginate.set_defaults(func=bench_paginate)
+
+    search = subparsers.add_parser("search", help="ranked search latency: whole words, typos and prefixes")
+    search.add_argument("--channels", type=int, default=1000000)
+    search.add_argument("--limit", type=int, default=50)
+    search.add_argument("--repeat", type=int, default=10)
+    search.set_defaults(func=bench_search)
+
+    health = subparsers.add_parser("health", help="channel health probe throughput against a simulated provider")
+    health.add_argument("--channels", type=int, default=50000)
+    health.add_argument("--hosts", type=int, default=20)
+    health.add_argument("--latency-ms", type=int, default=300)
+    health.add_argument("--dead-percent", type=int, default=30)
+    health.add_argument("--database-url", default=None, help="defaults to a scratch SQLite file")
+    health.set_defaults(func=bench_health)
+
+    probe = subparsers.add_parser("probe", help="media header probe throughput (files/sec) and rerun cost")
+    probe.add_argument("--files", type=int, default=2000)
+    probe.add_argument("--size-kb", type=int, default=64)
+    probe.add_argument("--workers", type=int, default=None)
+    probe.add_argument("--no-ffprobe", action="store_true", help="use the built-in header parser only")
+    probe.add_argument("--database-url", default=None, help="defaults to a scratch SQLite file")
+    probe.set_defaults(func=bench_probe)
+
+    transcode = subparsers.add_parser("transcode", help="time to first HLS segment and encode speed, remux vs transcode")
+    transcode.add_argument("--seconds", type=int, default=60, help="length of the generated test pattern")
+    transcode.set_defaults(func=bench_transcode)
+
+    metrics = subparsers.add_parser("metrics", help="per-request cost of the metrics middleware and DB query hooks")
+    metrics.add_argument("--requests", type=int, default=5000)
+    metrics.add_argument("--queries", type=int, default=3, help="queries per request on the DB route")
+    metrics.add_argument("--repeat", type=int, default=5)
+    metrics.add_argument("--database-url", default=None, help="defaults to DATABASE_URL, then a scratch SQLite file")
+    metrics.set_defaults(func=bench_metrics)
+
+    cluster = subparsers.add_parser("cluster", help="several workers sharing Redis: upstream connections per channel and failover")
+    cluster.add_argument("--workers", type=int, default=3)
+    cluster.add_argument("--channels", type=int, default=4)
+    cluster.add_argument("--viewers", type=int, default=24)
+    cluster.add_argument("--seconds", type=int, default=30)
+    cluster.add_argument("--port", type=int, default=8100, help="first worker port; one per worker")
+    cluster.add_argument("--owner-ttl", type=float, default=3.0, help="relay owner lease, i.e. failover delay")
+    cluster.add_argument("--failover", action="store_true", help="kill the owner of channel 1 partway through")
+    cluster.add_argument("--redis-url", default=os.environ.get("REDIS_URL", "redis://localhost:6379"))
+    cluster.set_defaults(func=bench_cluster)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
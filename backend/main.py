@@ -1,16 +1,26 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from fastapi.security import HTTPBearer
 from sqlalchemy.orm import Session
+import os
 import uvicorn
 
-from database import get_db, engine, Base
+from database import get_db, engine, async_engine
 from models import User, Media, LiveTVChannel, Playlist
-from routers import auth, media, live_tv, playlists
+from routers import auth, media, live_tv, playlists, jobs, search, images, transcode
 from config import settings
+from services.http_clients import http_clients
+from services.jobs import job_manager
+from services.metrics import MetricsMiddleware, component_publisher, instrument_engine, render_metrics
+from services.readiness import liveness, readiness
+from services.redis_pool import close_redis, get_redis
+from services.relay import relay_manager
+from services.thumbnails import image_cache
+from services.transcode import transcode_manager
+import services.job_handlers  # registers job types
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# The schema is managed by `python migrate.py`, run once before the workers start
 
 app = FastAPI(
     title="LiveTV API",
@@ -25,21 +35,68 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
+# Added last so it is outermost and times everything below it
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(engine)
+    instrument_engine(async_engine.sync_engine)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
 app.include_router(media.router, prefix="/api/media", tags=["media"])
 app.include_router(live_tv.router, prefix="/api/live-tv", tags=["live-tv"])
 app.include_router(playlists.router, prefix="/api/playlists", tags=["playlists"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(search.router, prefix="/api/search", tags=["search"])
+app.include_router(images.router, prefix="/api/images", tags=["images"])
+app.include_router(transcode.router, prefix="/api/transcode", tags=["transcode"])
+
+@app.on_event("startup")
+async def startup():
+    await http_clients.start()
+    await job_manager.start()
+    if settings.metrics_enabled:
+        await component_publisher.start()
+    if int(os.environ.get("WEB_CONCURRENCY") or 1) > 1 and await get_redis() is None:
+        print("Warning: running several workers without Redis; relays, jobs and caches won't be shared between them")
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_manager.stop()
+    await component_publisher.close()
+    await http_clients.close()
+    await image_cache.close()
+    await transcode_manager.close()
+    await relay_manager.close()
+    await close_redis()
+    await async_engine.dispose()
 
 @app.get("/")
 async def root():
     return {"message": "LiveTV API is running"}
 
 @app.get("/health")
+@app.get("/health/live")
 async def health_check():
-    return {"status": "healthy"}
+    return liveness()
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Per-dependency status and latency; 503 when the database or media path is down"""
+    result = await readiness.get()
+    return JSONResponse(result, status_code=503 if result["status"] == "unready" else 200)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if settings.metrics_token and request.headers.get("authorization") != f"Bearer {settings.metrics_token}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body, content_type = await render_metrics()
+    return Response(body, media_type=content_type)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,87 @@
+"""Bring the database schema up to date.
+
+Run once per deployment before the API workers start (the Docker images
+do this in their start script):
+
+    python migrate.py
+
+The workers never create or alter tables themselves, so any number of
+them can start at once. Several nodes running this at the same time is
+safe too: on PostgreSQL the upgrade runs under an advisory lock, and
+whoever comes second finds the schema already at head.
+"""
+import os
+import sys
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import Base, engine
+import models  # noqa: F401  registers the tables on Base.metadata
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Arbitrary, but fixed: every node must use the same advisory lock key
+LOCK_KEY = 0x4C495654
+
+
+def alembic_config() -> Config:
+    config = Config(os.path.join(HERE, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(HERE, "alembic"))
+    return config
+
+
+def _missing_columns(conn) -> list:
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing += [f"{table.name}.{column.name}" for column in table.columns if column.name not in existing]
+    return missing
+
+
+def migrate():
+    config = alembic_config()
+    with engine.connect() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+            conn.commit()
+        try:
+            tables = set(inspect(conn).get_table_names())
+            if not postgres:
+                # The migrations are written for PostgreSQL; SQLite (development,
+                # benchmarks) gets its tables straight from the models, which
+                # can add tables but not columns to the ones already there
+                missing = _missing_columns(conn)
+                if missing:
+                    sys.exit(
+                        f"The SQLite database {engine.url.database} predates columns the models need: "
+                        + ", ".join(missing)
+                        + ". Delete it and run this again to recreate it."
+                    )
+                Base.metadata.create_all(conn)
+                conn.commit()
+                if "alembic_version" not in tables:
+                    command.stamp(config, "head")
+                print("Schema created from the models")
+            else:
+                if "alembic_version" not in tables and "users" in tables:
+                    # Created by the create_all older versions ran at startup,
+                    # which is the schema of the first revision
+                    command.stamp(config, "001")
+                    print("Existing schema adopted at revision 001")
+                command.upgrade(config, "head")
+                print("Schema migrated to head")
+        finally:
+            if postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+                conn.commit()
+
+if __name__ == "__main__":
+    migrate()
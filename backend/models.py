@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Float
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, Boolean, ForeignKey, Float, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -20,8 +20,10 @@ class Media(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
-    file_path = Column(String, nullable=False)
-    file_size = Column(Integer)
+    file_path = Column(String, nullable=False, index=True)
+    file_size = Column(BigInteger)
+    file_mtime = Column(Float)  # scan index: (file_size, file_mtime, file_inode) detect changes
+    file_inode = Column(BigInteger)
     duration = Column(Float)  # in seconds
     media_type = Column(String, nullable=False)  # movie, tv_show, music
     genre = Column(String)
@@ -29,8 +31,21 @@ class Media(Base):
     rating = Column(Float)
     description = Column(Text)
     thumbnail_path = Column(String)
+    # Container header probe (services/media_probe.py); cleared by the scanner when the file changes
+    container = Column(String)
+    video_codec = Column(String)
+    audio_codec = Column(String)
+    width = Column(Integer)
+    height = Column(Integer)
+    bitrate_kbps = Column(Integer)
+    probed_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_media_type_keyset", "media_type", "id"),
+        Index("ix_media_probe_pending", "probed_at", "id"),
+    )
 
 class LiveTVChannel(Base):
     __tablename__ = "live_tv_channels"
@@ -38,6 +53,8 @@ class LiveTVChannel(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     url = Column(String, nullable=False)
+    identity = Column(String)  # stable key used to diff playlist refreshes
+    tvg_id = Column(String, index=True)
     logo_url = Column(String)
     category = Column(String)
     language = Column(String)
@@ -45,6 +62,26 @@ class LiveTVChannel(Base):
     is_active = Column(Boolean, default=True)
     playlist_id = Column(Integer, ForeignKey("playlists.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Stream health, written by the health prober (services/health.py)
+    health_checked_at = Column(DateTime(timezone=True))
+    last_alive_at = Column(DateTime(timezone=True))
+    latency_ms = Column(Integer)  # time to first byte of the last successful probe
+    bitrate_kbps = Column(Integer)  # estimated from PCRs (MPEG-TS) or BANDWIDTH (HLS)
+    health_failures = Column(Integer, nullable=False, default=0, server_default="0")  # consecutive
+    health_rank = Column(Integer, nullable=False, default=60000, server_default="60000")  # lower sorts first
+    
+    playlist = relationship("Playlist", back_populates="channels")
+    
+    __table_args__ = (
+        Index("ix_live_tv_channels_playlist_identity", "playlist_id", "identity"),
+        # Equality filters then id, so cursor pages are an index seek. The id
+        # only comes out in order when every column before it is constrained,
+        # hence one index per common filter combination.
+        Index("ix_live_tv_channels_filter_keyset", "is_active", "category", "language", "country", "id"),
+        Index("ix_live_tv_channels_category_keyset", "is_active", "category", "id"),
+        Index("ix_live_tv_channels_active_keyset", "is_active", "id"),
+        Index("ix_live_tv_channels_health_keyset", "is_active", "health_rank", "id"),
+    )
 
 class Playlist(Base):
     __tablename__ = "playlists"
@@ -54,11 +91,32 @@ class Playlist(Base):
     file_path = Column(String, nullable=False)
     playlist_type = Column(String, nullable=False)  # m3u, xtream
     is_active = Column(Boolean, default=True)
+    content_hash = Column(String)  # SHA-256 of the source at the last import
+    last_refreshed_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     channels = relationship("LiveTVChannel", back_populates="playlist")
 
+class ChannelFacet(Base):
+    """Active channel count per playlist for each category, language and country value.
+
+    Maintained incrementally by the channel import/sync code, so facet lists
+    never scan live_tv_channels.
+    """
+    __tablename__ = "channel_facets"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    playlist_id = Column(Integer, ForeignKey("playlists.id"), nullable=False)
+    facet = Column(String, nullable=False)  # category, language, country
+    value = Column(String, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        UniqueConstraint("playlist_id", "facet", "value", name="uq_channel_facets_playlist_facet_value"),
+        Index("ix_channel_facets_facet_value", "facet", "value"),
+    )
+
 class EPGData(Base):
     __tablename__ = "epg_data"
     
@@ -69,3 +127,7 @@ class EPGData(Base):
     start_time = Column(DateTime(timezone=True), nullable=False)
     end_time = Column(DateTime(timezone=True), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_epg_data_channel_window", "channel_id", "start_time", "end_time"),
+    )
@@ -1,15 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel
 from typing import Optional
 
-from database import get_db
+from database import get_async_db
 from models import User
 from config import settings
+from services.auth_cache import user_cache
 
 router = APIRouter()
 security = HTTPBearer()
@@ -28,6 +30,10 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
+class UserUpdate(BaseModel):
+    is_active: Optional[bool] = None
+    is_admin: Optional[bool] = None
+
 class UserResponse(BaseModel):
     id: int
     username: str
@@ -51,31 +57,39 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.jwt_secret, algorithm=settings.jwt_algorithm)
     return encoded_jwt
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(credentials.credentials, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
-        username: str = payload.get("sub")
-        if username is None:
+    token = credentials.credentials
+    # Tokens already verified are trusted until their exp, skipping the signature check
+    username = user_cache.verified_subject(token)
+    if username is None:
+        try:
+            payload = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        user_cache.remember_token(token, username, payload.get("exp"))
     
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
+    async def load_user():
+        return await db.scalar(select(User).where(User.username == username))
+    
+    user = await user_cache.get_user(username, load_user)
+    if user is None or not user.is_active:
         raise credentials_exception
     return user
 
 @router.post("/register", response_model=UserResponse)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if user already exists
-    if db.query(User).filter(User.username == user.username).first():
+    if await db.scalar(select(User.id).where(User.username == user.username)):
         raise HTTPException(status_code=400, detail="Username already registered")
-    if db.query(User).filter(User.email == user.email).first():
+    if await db.scalar(select(User.id).where(User.email == user.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
@@ -86,8 +100,8 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
         hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return UserResponse(
         id=db_user.id,
@@ -98,8 +112,8 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     )
 
 @router.post("/login", response_model=Token)
-async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == user_credentials.username).first()
+async def login(user_credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(User).where(User.username == user_credentials.username))
     if not user or not verify_password(user_credentials.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -114,7 +128,7 @@ async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
     
     # Update last login
     user.last_login = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -127,3 +141,41 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
         is_admin=current_user.is_admin,
         created_at=current_user.created_at
     )
+
+@router.patch("/users/{user_id}", response_model=UserResponse)
+async def update_user(
+    user_id: int,
+    update: UserUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    user = await db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    if update.is_active is not None:
+        user.is_active = update.is_active
+    if update.is_admin is not None:
+        user.is_admin = update.is_admin
+    await db.commit()
+    
+    # Cached snapshots would otherwise keep the old flags until they expire
+    await user_cache.invalidate(user.username)
+    
+    return UserResponse(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        is_admin=user.is_admin,
+        created_at=user.created_at
+    )
+
+@router.get("/cache")
+async def get_auth_cache_stats(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return user_cache.stats()
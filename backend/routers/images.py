@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db
+from models import LiveTVChannel, Media
+from services.thumbnails import (
+    SIZES,
+    ImageUnavailable,
+    image_response,
+    logo_digest,
+    thumbnail_digest,
+    verify_image_signature,
+)
+
+router = APIRouter()
+
+# Authorized by the signature in the URL (see services.thumbnails.image_url),
+# since <img> tags can't attach bearer tokens
+@router.get("/{kind}/{entity_id}/{size}.webp")
+async def get_image(
+    kind: str,
+    entity_id: int,
+    size: str,
+    request: Request,
+    sig: str = Query(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if size not in SIZES.get(kind, {}):
+        raise HTTPException(status_code=404, detail="Image not found")
+    if not verify_image_signature(kind, entity_id, size, sig):
+        raise HTTPException(status_code=403, detail="Invalid image URL")
+    
+    if kind == "logo":
+        logo_url = (await db.execute(select(LiveTVChannel.logo_url).where(LiveTVChannel.id == entity_id))).scalar()
+        await db.close()
+        if not logo_url:
+            raise HTTPException(status_code=404, detail="Channel has no logo")
+        generate = logo_digest(logo_url, size)
+    else:
+        media = await db.get(Media, entity_id)
+        await db.close()
+        if not media:
+            raise HTTPException(status_code=404, detail="Media not found")
+        generate = thumbnail_digest(media, size)
+    
+    try:
+        digest = await generate
+    except ImageUnavailable:
+        raise HTTPException(status_code=404, detail="Image not available")
+    
+    return image_response(request, digest)
@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+
+from models import User
+from routers.auth import get_current_user
+from services.jobs import job_manager
+
+router = APIRouter()
+
+@router.get("/")
+async def get_jobs(
+    limit: int = Query(100, ge=1, le=1000),
+    job_type: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    jobs = await job_manager.list(limit)
+    if job_type:
+        jobs = [job for job in jobs if job.type == job_type]
+    if status:
+        jobs = [job for job in jobs if job.status == status]
+    
+    return {
+        "backend": job_manager.backend.name,
+        "queue_depths": await job_manager.queue_depths(),
+        "jobs": [job.as_dict() for job in jobs]
+    }
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    job = await job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job.as_dict()
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    job = await job_manager.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return job.as_dict()
@@ -1,14 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
 import httpx
 import asyncio
+import os
 
-from database import get_db
-from models import LiveTVChannel, EPGData, User
+from database import get_async_db
+from models import LiveTVChannel, EPGData, Playlist, User
 from routers.auth import get_current_user
+from config import settings
+from services.hls import (
+    fetch_manifest,
+    fetch_segment,
+    manifest_cache,
+    rewrite_manifest,
+    segment_cache,
+    verify_upstream_url,
+)
+from services.cache import CHANNELS, EPG, Payload, response_cache
+from services.epg import guide_grid, now_next, overlapping, to_utc
+from services.export import export_cache, export_key, export_response, render_m3u, render_xmltv, verify_export_key
+from services.facets import FACET_NAMES, facet_counts
+from services.http_clients import http_clients
+from services.jobs import job_manager
+from services.pagination import cursor_values, keyset, next_cursor
+from services.relay import relay_manager
+from services.search import search_channels
+from services.thumbnails import image_cache, image_url
+from services.transcode import QUALITIES, TranscodeBusy, TranscodeError, plan, transcode_manager
+from services.xtream import XtreamClient, parse_xtream_path, stream_id_from_url
 
 router = APIRouter()
 
@@ -30,111 +54,386 @@ class EPGResponse:
         self.start_time = epg.start_time
         self.end_time = epg.end_time
 
+def _channel_dict(channel: LiveTVChannel) -> dict:
+    return {
+        "id": channel.id,
+        "name": channel.name,
+        "logo_url": channel.logo_url,
+        "logo_proxy_url": image_url("logo", channel.id, "md") if channel.logo_url else None,
+        "category": channel.category,
+        "language": channel.language,
+        "country": channel.country,
+        "is_active": channel.is_active,
+        "latency_ms": channel.latency_ms,
+        "bitrate_kbps": channel.bitrate_kbps,
+        "last_alive_at": channel.last_alive_at
+    }
+
+def _channel_filters(category: Optional[str], language: Optional[str], country: Optional[str]) -> list:
+    filters = []
+    if category:
+        filters.append(LiveTVChannel.category == category)
+    if language:
+        filters.append(LiveTVChannel.language == language)
+    if country:
+        filters.append(LiveTVChannel.country == country)
+    return filters
+
+# Keyset columns for each channel list ordering
+CHANNEL_SORTS = {
+    "id": [LiveTVChannel.id],
+    "health": [LiveTVChannel.health_rank, LiveTVChannel.id],
+}
+
 @router.get("/channels", response_model=List[dict])
 async def get_channels(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page; replaces skip"),
+    search: Optional[str] = Query(None, description="Ranked, typo tolerant match on name and category"),
+    sort: str = Query("id", pattern="^(id|health)$", description="health: responsive channels first"),
     category: Optional[str] = Query(None),
     language: Optional[str] = Query(None),
     country: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    query = db.query(LiveTVChannel).filter(LiveTVChannel.is_active == True)
-    
-    if category:
-        query = query.filter(LiveTVChannel.category == category)
-    if language:
-        query = query.filter(LiveTVChannel.language == language)
-    if country:
-        query = query.filter(LiveTVChannel.country == country)
+    if search and cursor:
+        raise HTTPException(status_code=400, detail="Search results are paged with skip, not cursor")
+    columns = CHANNEL_SORTS[sort]
+    after = cursor_values(cursor, sort, columns)
+    filters = _channel_filters(category, language, country)
     
-    channels = query.offset(skip).limit(limit).all()
+    async def compute(db: AsyncSession):
+        if search:
+            hits = await search_channels(db, search, skip, limit, filters)
+            return [_channel_dict(channel) for channel, _ in hits]
+        
+        query = select(LiveTVChannel).where(LiveTVChannel.is_active == True, *filters)
+        query = keyset(query, columns, after)
+        if after is None:
+            query = query.offset(skip)
+        channels = (await db.scalars(query.limit(limit))).all()
+        
+        next_page = next_cursor(sort, channels, limit, lambda channel: [getattr(channel, column.key) for column in columns])
+        return Payload([_channel_dict(channel) for channel in channels], {"X-Next-Cursor": next_page} if next_page else None)
     
-    return [
-        {
-            "id": channel.id,
-            "name": channel.name,
-            "logo_url": channel.logo_url,
-            "category": channel.category,
-            "language": channel.language,
-            "country": channel.country,
-            "is_active": channel.is_active
-        }
-        for channel in channels
-    ]
+    # Channels only change through playlist jobs, which bump the cache version
+    return await response_cache.respond(request, CHANNELS, compute, db)
 
 @router.get("/channels/{channel_id}")
 async def get_channel(
     channel_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    channel = db.query(LiveTVChannel).filter(LiveTVChannel.id == channel_id).first()
+    channel = await db.get(LiveTVChannel, channel_id)
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
     
-    return {
-        "id": channel.id,
-        "name": channel.name,
-        "logo_url": channel.logo_url,
-        "category": channel.category,
-        "language": channel.language,
-        "country": channel.country,
-        "is_active": channel.is_active
-    }
+    return _channel_dict(channel)
+
+@router.get("/channels/{channel_id}/epg/short")
+async def get_channel_short_epg(
+    channel_id: int,
+    limit: int = Query(4, ge=1, le=20),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Upcoming programmes straight from the channel's Xtream panel, for channels without XMLTV data"""
+    row = (await db.execute(
+        select(LiveTVChannel.url, Playlist.file_path)
+        .join(Playlist, LiveTVChannel.playlist_id == Playlist.id)
+        .where(LiveTVChannel.id == channel_id, Playlist.playlist_type == "xtream")
+    )).first()
+    await db.close()
+    credentials = parse_xtream_path(row.file_path) if row else None
+    stream_id = stream_id_from_url(row.url) if row else None
+    if not credentials or stream_id is None:
+        raise HTTPException(status_code=404, detail="No Xtream EPG for this channel")
+    
+    try:
+        programmes = await XtreamClient(*credentials).short_epg(stream_id, limit)
+    except (httpx.HTTPError, ValueError) as e:
+        raise HTTPException(status_code=502, detail=f"Xtream panel unavailable: {e}")
+    
+    return {"channel_id": channel_id, "programmes": programmes}
 
 @router.get("/channels/{channel_id}/stream")
 async def stream_channel(
     channel_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    channel = db.query(LiveTVChannel).filter(LiveTVChannel.id == channel_id).first()
+    channel = await db.get(LiveTVChannel, channel_id)
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
     
     if not channel.is_active:
         raise HTTPException(status_code=400, detail="Channel is not active")
     
-    # For live streaming, we would typically proxy the stream
-    # This is a simplified version that redirects to the stream URL
-    async def stream_generator():
-        async with httpx.AsyncClient() as client:
-            async with client.stream("GET", channel.url) as response:
-                async for chunk in response.aiter_bytes():
-                    yield chunk
+    # Give the connection back to the pool now; the session dependency would
+    # otherwise hold it for as long as the viewer keeps watching
+    await db.close()
     
+    return await _channel_stream(request, channel)
+
+@router.get("/channels/{channel_id}/transcode")
+async def transcode_channel(
+    channel_id: int,
+    quality: str = Query("original", description=f"One of: {', '.join(QUALITIES)}"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Browser playable HLS of a channel (MPEG-TS streams don't play in browsers as is)"""
+    if quality not in QUALITIES:
+        raise HTTPException(status_code=400, detail=f"Unknown quality: {quality}")
+    channel = await db.get(LiveTVChannel, channel_id)
+    if not channel or not channel.is_active:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    await db.close()
+    
+    steps = plan(None, None, quality, assume_h264=True)
+    # Continuous streams are fed from the relay, sharing its upstream connection
+    feed = None if channel.url.endswith('.m3u8') else lambda: relay_manager.subscribe(channel.id, channel.url)
+    try:
+        session = await transcode_manager.open(channel.url, steps, str(current_user.id), live=True, feed=feed)
+    except TranscodeBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except TranscodeError as e:
+        print(f"Error transcoding channel {channel_id}: {e}")
+        raise HTTPException(status_code=502, detail="Transcoding failed")
+    
+    return session.as_dict()
+
+async def _channel_stream(request: Request, channel: LiveTVChannel) -> Response:
+    # HLS playlists are rewritten so segments are fetched (and cached) through us
+    if channel.url.endswith('.m3u8'):
+        return await _proxied_manifest(request, channel.id, channel.url)
+    
+    # Continuous streams share one upstream connection per channel across all viewers
     return StreamingResponse(
-        stream_generator(),
-        media_type="application/vnd.apple.mpegurl" if channel.url.endswith('.m3u8') else "video/mp2t"
+        relay_manager.subscribe(channel.id, channel.url),
+        media_type="video/mp2t"
+    )
+
+async def _proxied_manifest(request: Request, channel_id: int, url: str) -> Response:
+    try:
+        text, final_url = await manifest_cache.get(url, fetch_manifest)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Upstream playlist unavailable: {e}")
+    
+    rewritten = rewrite_manifest(
+        text,
+        final_url,
+        channel_id,
+        request.url_for("proxy_hls_playlist", channel_id=channel_id).path,
+        request.url_for("proxy_hls_segment", channel_id=channel_id).path,
+    )
+    return Response(
+        content=rewritten,
+        media_type="application/vnd.apple.mpegurl",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+def _verified_upstream(channel_id: int, kind: str, u: str, exp: int, sig: str) -> str:
+    url = verify_upstream_url(channel_id, kind, u, exp, sig)
+    if url is None:
+        raise HTTPException(status_code=403, detail="Invalid or expired stream URL")
+    return url
+
+# Playlists and segments referenced from a rewritten manifest are authorized by
+# their signed query string, since players can't attach bearer tokens to them.
+@router.get("/channels/{channel_id}/hls/playlist.m3u8")
+async def proxy_hls_playlist(
+    channel_id: int,
+    request: Request,
+    u: str = Query(...),
+    exp: int = Query(...),
+    sig: str = Query(...)
+):
+    url = _verified_upstream(channel_id, "playlist", u, exp, sig)
+    return await _proxied_manifest(request, channel_id, url)
+
+@router.get("/channels/{channel_id}/hls/segment")
+async def proxy_hls_segment(
+    channel_id: int,
+    u: str = Query(...),
+    exp: int = Query(...),
+    sig: str = Query(...)
+):
+    url = _verified_upstream(channel_id, "segment", u, exp, sig)
+    try:
+        body, content_type = await segment_cache.get(url, fetch_segment)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Upstream segment unavailable: {e}")
+    
+    return Response(
+        content=body,
+        media_type=content_type,
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
+
+async def _export_user(db: AsyncSession, user_id: int, key: str) -> User:
+    if not verify_export_key(user_id, key):
+        raise HTTPException(status_code=403, detail="Invalid export key")
+    user = await db.get(User, user_id)
+    if not user or not user.is_active:
+        raise HTTPException(status_code=403, detail="Export link revoked")
+    return user
+
+@router.get("/export/links")
+async def get_export_links(
+    request: Request,
+    category: Optional[str] = Query(None),
+    language: Optional[str] = Query(None),
+    country: Optional[str] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
+    """Playlist and guide URLs to paste into an IPTV player (Kodi, TiviMate, Jellyfin)"""
+    params = {"user": current_user.id, "key": export_key(current_user.id)}
+    params.update({name: value for name, value in (("category", category), ("language", language), ("country", country)) if value})
+    return {
+        "playlist": f"{request.url_for('export_playlist')}?{urlencode(params)}",
+        "epg": f"{request.url_for('export_epg')}?{urlencode(params)}",
+    }
+
+# Exports and the stream URLs inside them are authorized by the user's export
+# key, since players are configured with a URL and can't attach bearer tokens
+@router.get("/playlist.m3u")
+async def export_playlist(
+    request: Request,
+    user: int = Query(...),
+    key: str = Query(...),
+    category: Optional[str] = Query(None),
+    language: Optional[str] = Query(None),
+    country: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    await _export_user(db, user, key)
+    filters = _channel_filters(category, language, country)
+    
+    base = str(request.base_url).rstrip("/")
+    prefix = str(request.url_for("export_playlist")).rsplit("/", 1)[0]
+    credentials = urlencode({"user": user, "key": key})
+    epg_params = {name: value for name, value in request.query_params.items()}
+    epg_url = f"{request.url_for('export_epg')}?{urlencode(epg_params)}"
+    
+    # Output embeds the caller's key and our host, so both are part of the key
+    cache_key = ("m3u", user, base, category, language, country, await response_cache.version(CHANNELS))
+    digest = await export_cache.get(cache_key, lambda: render_m3u(
+        db,
+        filters,
+        lambda channel_id: f"{prefix}/channels/{channel_id}/live?{credentials}",
+        lambda channel_id: base + image_url("logo", channel_id, "md"),
+        epg_url,
+    ))
+    return export_response(request, digest, "audio/x-mpegurl", "playlist.m3u")
+
+@router.get("/epg.xml")
+async def export_epg(
+    request: Request,
+    user: int = Query(...),
+    key: str = Query(...),
+    category: Optional[str] = Query(None),
+    language: Optional[str] = Query(None),
+    country: Optional[str] = Query(None),
+    days: int = Query(settings.export_epg_days, ge=1, le=14),
+    db: AsyncSession = Depends(get_async_db)
+):
+    await _export_user(db, user, key)
+    filters = _channel_filters(category, language, country)
+    base = str(request.base_url).rstrip("/")
+    
+    cache_key = (
+        "xmltv", base, category, language, country, days,
+        await response_cache.version(CHANNELS), await response_cache.version(EPG),
     )
+    digest = await export_cache.get(cache_key, lambda: render_xmltv(
+        db,
+        filters,
+        lambda channel_id: base + image_url("logo", channel_id, "md"),
+        days,
+    ))
+    return export_response(request, digest, "application/xml", "epg.xml")
+
+@router.api_route("/channels/{channel_id}/live", methods=["GET", "HEAD"])
+async def play_exported_channel(
+    channel_id: int,
+    request: Request,
+    user: int = Query(...),
+    key: str = Query(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    await _export_user(db, user, key)
+    channel = await db.get(LiveTVChannel, channel_id)
+    if not channel or not channel.is_active:
+        raise HTTPException(status_code=404, detail="Channel not found")
+    await db.close()
+    
+    return await _channel_stream(request, channel)
+
+@router.get("/export/cache")
+async def get_export_cache_stats(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return export_cache.stats()
+
+@router.get("/hls/cache")
+async def get_hls_cache_stats(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return segment_cache.stats()
+
+@router.get("/relays")
+async def get_relays(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return relay_manager.stats()
+
+@router.get("/images/cache")
+async def get_image_cache_stats(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return image_cache.stats()
+
+@router.get("/upstreams")
+async def get_upstream_stats(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    # Connection slot usage per provider host; saturation near 1 means requests queue
+    return http_clients.stats()
 
 @router.get("/epg")
 async def get_epg(
     channel_id: Optional[int] = Query(None),
     date: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    query = db.query(EPGData)
+    query = select(EPGData)
     
     if channel_id:
-        query = query.filter(EPGData.channel_id == channel_id)
+        query = query.where(EPGData.channel_id == channel_id)
     
     if date:
         try:
             target_date = datetime.fromisoformat(date)
             start_of_day = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
             end_of_day = start_of_day + timedelta(days=1)
-            query = query.filter(
-                EPGData.start_time >= start_of_day,
-                EPGData.start_time < end_of_day
-            )
+            query = query.where(overlapping(to_utc(start_of_day), to_utc(end_of_day)))
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid date format")
     
-    epg_data = query.all()
+    epg_data = (await db.scalars(query.order_by(EPGData.start_time).limit(limit))).all()
     
     return [
         {
@@ -148,26 +447,200 @@ async def get_epg(
         for epg in epg_data
     ]
 
+def _parse_channel_ids(channel_ids: str) -> List[int]:
+    try:
+        ids = [int(part) for part in channel_ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="channel_ids must be a comma separated list of ids")
+    if len(ids) > settings.epg_grid_max_channels:
+        raise HTTPException(status_code=400, detail=f"At most {settings.epg_grid_max_channels} channels per request")
+    return ids
+
+async def _channel_page(db: AsyncSession, skip: int, limit: int, category: Optional[str]):
+    query = select(LiveTVChannel.id, LiveTVChannel.name, LiveTVChannel.logo_url).where(LiveTVChannel.is_active == True)
+    if category:
+        query = query.where(LiveTVChannel.category == category)
+    result = await db.execute(query.order_by(LiveTVChannel.name, LiveTVChannel.id).offset(skip).limit(limit))
+    return result.all()
+
+@router.get("/epg/now-next")
+async def get_epg_now_next(
+    channel_ids: str = Query(..., description="Comma separated channel ids"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """What is on now and next for many channels at once"""
+    at = datetime.now(timezone.utc)
+    slots = await db.run_sync(now_next, _parse_channel_ids(channel_ids), at)
+    return {
+        "at": at,
+        "channels": [{"channel_id": channel_id, **slot} for channel_id, slot in slots.items()]
+    }
+
+@router.get("/epg/grid")
+async def get_epg_grid(
+    start: Optional[datetime] = Query(None, description="Window start, defaults to now"),
+    hours: float = Query(3, gt=0),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    category: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Programmes overlapping a time window for a page of channels"""
+    if hours > settings.epg_grid_max_hours:
+        raise HTTPException(status_code=400, detail=f"Window can be at most {settings.epg_grid_max_hours} hours")
+    limit = min(limit, settings.epg_grid_max_channels)
+    
+    window_start = to_utc(start) if start else datetime.now(timezone.utc)
+    window_end = window_start + timedelta(hours=hours)
+    
+    channels = await _channel_page(db, skip, limit, category)
+    grid = await db.run_sync(guide_grid, [channel.id for channel in channels], window_start, window_end)
+    
+    return {
+        "start": window_start,
+        "end": window_end,
+        "skip": skip,
+        "limit": limit,
+        "channels": [
+            {
+                "id": channel.id,
+                "name": channel.name,
+                "logo_url": channel.logo_url,
+                "programmes": grid[channel.id]
+            }
+            for channel in channels
+        ]
+    }
+
+@router.post("/epg/import")
+async def import_epg(
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    epg_dir = os.path.join(settings.media_path, "epg")
+    os.makedirs(epg_dir, exist_ok=True)
+    
+    # Save in chunks; guides can be hundreds of megabytes
+    file_path = os.path.join(epg_dir, f"xmltv_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xml")
+    with open(file_path, "wb") as buffer:
+        while chunk := await file.read(1024 * 1024):
+            buffer.write(chunk)
+    
+    job = await job_manager.enqueue("epg_import", {"file_path": file_path, "remove_after": True})
+    return {"job_id": job.id, "message": "EPG import queued"}
+
+@router.post("/epg/import-url")
+async def import_epg_url(
+    url: str,
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if not url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="Invalid EPG URL")
+    
+    job = await job_manager.enqueue("epg_import", {"url": url})
+    return {"job_id": job.id, "message": "EPG import queued"}
+
+@router.post("/health/check")
+async def check_channel_health(
+    playlist_id: Optional[int] = Query(None),
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    job = await job_manager.enqueue("channel_health", {"playlist_id": playlist_id})
+    return {"job_id": job.id, "message": "Channel health check queued"}
+
+@router.get("/health")
+async def get_channel_health(
+    playlist_id: Optional[int] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    dead = LiveTVChannel.health_failures >= settings.health_max_failures
+    state = case(
+        (dead & (LiveTVChannel.is_active == False), "dead"),
+        (LiveTVChannel.is_active == False, "inactive"),
+        (LiveTVChannel.health_checked_at.is_(None), "unchecked"),
+        (LiveTVChannel.health_failures > 0, "failing"),
+        else_="alive",
+    )
+    query = select(state, func.count(), func.avg(LiveTVChannel.latency_ms), func.max(LiveTVChannel.health_checked_at)).group_by(state)
+    if playlist_id is not None:
+        query = query.where(LiveTVChannel.playlist_id == playlist_id)
+    rows = (await db.execute(query)).all()
+    
+    counts = {name: 0 for name in ("alive", "failing", "dead", "unchecked", "inactive")}
+    latency = None
+    last_checked = None
+    for name, count, avg_latency, checked_at in rows:
+        counts[name] = count
+        if name == "alive":
+            latency = round(avg_latency) if avg_latency is not None else None
+        if checked_at is not None and (last_checked is None or checked_at > last_checked):
+            last_checked = checked_at
+    
+    return {
+        "counts": counts,
+        "average_latency_ms": latency,
+        "last_checked_at": last_checked,
+        "max_failures": settings.health_max_failures
+    }
+
+def _facet_values(facet: str):
+    async def compute(db: AsyncSession):
+        counts = await facet_counts(db)
+        return [entry["value"] for entry in counts[FACET_NAMES[facet]]]
+    return compute
+
+@router.get("/facets")
+async def get_facets(
+    request: Request,
+    playlist_id: Optional[int] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Categories, languages and countries with active channel counts, in one round trip"""
+    return await response_cache.respond(request, CHANNELS, lambda db: facet_counts(db, playlist_id), db)
+
 @router.get("/categories")
 async def get_categories(
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    categories = db.query(LiveTVChannel.category).distinct().all()
-    return [cat[0] for cat in categories if cat[0]]
+    return await response_cache.respond(request, CHANNELS, _facet_values("category"), db)
 
 @router.get("/languages")
 async def get_languages(
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    languages = db.query(LiveTVChannel.language).distinct().all()
-    return [lang[0] for lang in languages if lang[0]]
+    return await response_cache.respond(request, CHANNELS, _facet_values("language"), db)
 
 @router.get("/countries")
 async def get_countries(
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    countries = db.query(LiveTVChannel.country).distinct().all()
-    return [country[0] for country in countries if country[0]]
+    return await response_cache.respond(request, CHANNELS, _facet_values("country"), db)
+
+@router.get("/cache")
+async def get_response_cache_stats(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return response_cache.stats()
@@ -1,15 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import FileResponse, StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 import os
 import mimetypes
 from pathlib import Path
 
-from database import get_db
+from database import get_async_db
 from models import Media, User
 from routers.auth import get_current_user
 from config import settings
+from services.file_response import RangeFileResponse
+from services.jobs import job_manager
+from services.pagination import cursor_values, keyset, next_cursor
+from services.scanner import scan_progress
+from services.search import search_media
+from services.thumbnails import ImageUnavailable, image_response, image_url, thumbnail_digest
+from services.transcode import QUALITIES, TranscodeBusy, TranscodeError, plan, transcode_manager
 
 router = APIRouter()
 
@@ -27,73 +34,81 @@ class MediaResponse:
         self.file_size = media.file_size
         self.created_at = media.created_at
 
+def _media_dict(item: Media) -> dict:
+    return {
+        "id": item.id,
+        "title": item.title,
+        "media_type": item.media_type,
+        "genre": item.genre,
+        "year": item.year,
+        "rating": item.rating,
+        "description": item.description,
+        "thumbnail_path": item.thumbnail_path,
+        "thumbnail_url": image_url("thumbnail", item.id, "sm") if item.media_type != "music" or item.thumbnail_path else None,
+        "duration": item.duration,
+        "file_size": item.file_size,
+        "container": item.container,
+        "video_codec": item.video_codec,
+        "audio_codec": item.audio_codec,
+        "width": item.width,
+        "height": item.height,
+        "bitrate_kbps": item.bitrate_kbps,
+        "created_at": item.created_at
+    }
+
 @router.get("/", response_model=List[dict])
 async def get_media(
+    response: Response,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page; replaces skip"),
     media_type: Optional[str] = Query(None),
-    search: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    search: Optional[str] = Query(None, description="Ranked, typo tolerant match on title and description"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    query = db.query(Media)
+    if search and cursor:
+        raise HTTPException(status_code=400, detail="Search results are paged with skip, not cursor")
+    columns = [Media.id]
+    after = cursor_values(cursor, "id", columns)
     
-    if media_type:
-        query = query.filter(Media.media_type == media_type)
+    filters = [Media.media_type == media_type] if media_type else []
     
     if search:
-        query = query.filter(Media.title.ilike(f"%{search}%"))
-    
-    media_items = query.offset(skip).limit(limit).all()
-    
-    return [
-        {
-            "id": item.id,
-            "title": item.title,
-            "media_type": item.media_type,
-            "genre": item.genre,
-            "year": item.year,
-            "rating": item.rating,
-            "description": item.description,
-            "thumbnail_path": item.thumbnail_path,
-            "duration": item.duration,
-            "file_size": item.file_size,
-            "created_at": item.created_at
-        }
-        for item in media_items
-    ]
+        hits = await search_media(db, search, skip, limit, filters)
+        return [_media_dict(item) for item, _ in hits]
+    
+    query = keyset(select(Media).where(*filters), columns, after)
+    if after is None:
+        query = query.offset(skip)
+    media_items = (await db.scalars(query.limit(limit))).all()
+    
+    next_page = next_cursor("id", media_items, limit, lambda item: [item.id])
+    if next_page:
+        response.headers["X-Next-Cursor"] = next_page
+    
+    return [_media_dict(item) for item in media_items]
 
 @router.get("/{media_id}")
 async def get_media_item(
     media_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    media = db.query(Media).filter(Media.id == media_id).first()
+    media = await db.get(Media, media_id)
     if not media:
         raise HTTPException(status_code=404, detail="Media not found")
     
-    return {
-        "id": media.id,
-        "title": media.title,
-        "media_type": media.media_type,
-        "genre": media.genre,
-        "year": media.year,
-        "rating": media.rating,
-        "description": media.description,
-        "thumbnail_path": media.thumbnail_path,
-        "duration": media.duration,
-        "file_size": media.file_size,
-        "created_at": media.created_at
-    }
+    return _media_dict(media)
 
-@router.get("/{media_id}/stream")
+@router.api_route("/{media_id}/stream", methods=["GET", "HEAD"])
 async def stream_media(
     media_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    media = db.query(Media).filter(Media.id == media_id).first()
+    media = await db.get(Media, media_id)
     if not media:
         raise HTTPException(status_code=404, detail="Media not found")
     
@@ -101,47 +116,95 @@ async def stream_media(
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Media file not found")
     
-    # Get file info
-    file_size = os.path.getsize(file_path)
     mime_type, _ = mimetypes.guess_type(file_path)
     
-    def iterfile():
-        with open(file_path, mode="rb") as file_like:
-            yield from file_like
+    # Release the connection before a potentially hours-long response
+    await db.close()
+    
+    # Honours Range/If-Range so players can seek without restarting the download
+    return RangeFileResponse(file_path, request.headers, media_type=mime_type)
+
+@router.get("/{media_id}/transcode")
+async def transcode_media(
+    media_id: int,
+    quality: str = Query("original", description=f"One of: {', '.join(QUALITIES)}"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """HLS for browsers: remuxed when the codecs allow it, transcoded otherwise"""
+    if quality not in QUALITIES:
+        raise HTTPException(status_code=400, detail=f"Unknown quality: {quality}")
+    media = await db.get(Media, media_id)
+    if not media:
+        raise HTTPException(status_code=404, detail="Media not found")
+    await db.close()
+    
+    file_path = os.path.join(settings.media_path, media.file_path)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="Media file not found")
+    
+    # Codecs come from the media probe; files it couldn't read are transcoded
+    steps = plan(media.video_codec, media.audio_codec, quality)
+    try:
+        session = await transcode_manager.open(file_path, steps, str(current_user.id))
+    except TranscodeBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except TranscodeError as e:
+        print(f"Error transcoding {file_path}: {e}")
+        raise HTTPException(status_code=502, detail="Transcoding failed")
     
-    return StreamingResponse(
-        iterfile(),
-        media_type=mime_type or "application/octet-stream",
-        headers={"Content-Length": str(file_size)}
-    )
+    return session.as_dict()
 
 @router.get("/{media_id}/thumbnail")
 async def get_thumbnail(
     media_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    size: str = Query("sm", pattern="^(sm|lg)$"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    media = db.query(Media).filter(Media.id == media_id).first()
+    media = await db.get(Media, media_id)
     if not media:
         raise HTTPException(status_code=404, detail="Media not found")
+    await db.close()
     
-    if not media.thumbnail_path:
+    # Generated on first request (frame grab or sidecar resize) and cached on disk
+    try:
+        digest = await thumbnail_digest(media, size)
+    except ImageUnavailable:
         raise HTTPException(status_code=404, detail="Thumbnail not available")
     
-    thumbnail_path = os.path.join(settings.media_path, media.thumbnail_path)
-    if not os.path.exists(thumbnail_path):
-        raise HTTPException(status_code=404, detail="Thumbnail file not found")
-    
-    return FileResponse(thumbnail_path)
+    return image_response(request, digest)
 
 @router.post("/scan")
-async def scan_media_library(
-    db: Session = Depends(get_db),
+async def start_media_scan(
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if scan_progress.running:
+        raise HTTPException(status_code=409, detail="A media scan is already running")
+    
+    job = await job_manager.enqueue("media_scan")
+    return {"job_id": job.id, "message": "Media library scan started"}
+
+@router.post("/probe")
+async def start_media_probe(
+    force: bool = Query(False, description="Re-probe files that already have media info"),
+    current_user: User = Depends(get_current_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    job = await job_manager.enqueue("media_probe", {"force": force})
+    return {"job_id": job.id, "message": "Media probe started"}
+
+@router.get("/scan/status")
+async def get_scan_status(
     current_user: User = Depends(get_current_user)
 ):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    # This would typically be implemented as a background task
-    # For now, we'll just return a success message
-    return {"message": "Media library scan started"}
+    return scan_progress.as_dict()
@@ -1,14 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import httpx
 import os
 import asyncio
 from datetime import datetime
 
-from database import get_db
-from models import Playlist, LiveTVChannel, User
+from database import get_async_db
+from models import Playlist, LiveTVChannel, ChannelFacet, EPGData, User
 from routers.auth import get_current_user
 from config import settings
+from services.cache import CHANNELS, response_cache
+from services.jobs import job_manager
+from services.xtream import XtreamClient, parse_xtream_path
 
 router = APIRouter()
 
@@ -23,10 +28,18 @@ class PlaylistResponse:
 
 @router.get("/", response_model=List[dict])
 async def get_playlists(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    playlists = db.query(Playlist).all()
+    # Count channels in SQL; loading every playlist's channels just to len() them
+    # is not possible on an async session and was an N+1 before
+    channel_count = func.count(LiveTVChannel.id).label("channel_count")
+    result = await db.execute(
+        select(Playlist, channel_count)
+        .outerjoin(LiveTVChannel, LiveTVChannel.playlist_id == Playlist.id)
+        .group_by(Playlist.id)
+        .order_by(Playlist.id)
+    )
     
     return [
         {
@@ -36,9 +49,9 @@ async def get_playlists(
             "is_active": playlist.is_active,
             "created_at": playlist.created_at,
             "updated_at": playlist.updated_at,
-            "channel_count": len(playlist.channels)
+            "channel_count": count
         }
-        for playlist in playlists
+        for playlist, count in result
     ]
 
 @router.post("/upload")
@@ -46,7 +59,7 @@ async def upload_playlist(
     name: str,
     playlist_type: str,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     if not current_user.is_admin:
@@ -59,11 +72,11 @@ async def upload_playlist(
     playlists_dir = os.path.join(settings.media_path, "playlists")
     os.makedirs(playlists_dir, exist_ok=True)
     
-    # Save uploaded file
+    # Save uploaded file in chunks so large playlists never sit fully in memory
     file_path = os.path.join(playlists_dir, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.m3u")
     with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+        while chunk := await file.read(1024 * 1024):
+            buffer.write(chunk)
     
     # Create playlist record
     playlist = Playlist(
@@ -72,18 +85,19 @@ async def upload_playlist(
         playlist_type=playlist_type
     )
     db.add(playlist)
-    db.commit()
-    db.refresh(playlist)
+    await db.commit()
+    await db.refresh(playlist)
     
-    # Parse playlist and create channels
-    await parse_playlist(playlist.id, file_path, db)
+    # Parse playlist and create channels in the background
+    job = await job_manager.enqueue("playlist_import", {"playlist_id": playlist.id, "file_path": file_path})
     
     return {
         "id": playlist.id,
         "name": playlist.name,
         "playlist_type": playlist.playlist_type,
         "file_path": playlist.file_path,
-        "message": "Playlist uploaded and parsed successfully"
+        "job_id": job.id,
+        "message": "Playlist uploaded, import queued"
     }
 
 @router.post("/xtream")
@@ -92,7 +106,7 @@ async def add_xtream_playlist(
     url: str,
     username: str,
     password: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     if not current_user.is_admin:
@@ -105,136 +119,133 @@ async def add_xtream_playlist(
         playlist_type="xtream"
     )
     db.add(playlist)
-    db.commit()
-    db.refresh(playlist)
+    await db.commit()
+    await db.refresh(playlist)
     
-    # Fetch channels from Xtream Codes API
-    await fetch_xtream_channels(playlist.id, url, username, password, db)
+    # Fetch channels from Xtream Codes API in the background
+    job = await job_manager.enqueue("xtream_import", {
+        "playlist_id": playlist.id,
+        "url": url,
+        "username": username,
+        "password": password
+    })
     
     return {
         "id": playlist.id,
         "name": playlist.name,
         "playlist_type": playlist.playlist_type,
-        "message": "Xtream Codes playlist added successfully"
+        "job_id": job.id,
+        "message": "Xtream Codes playlist added, import queued"
     }
 
+async def _xtream_client(db: AsyncSession, playlist_id: int) -> XtreamClient:
+    playlist = await db.get(Playlist, playlist_id)
+    if not playlist:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    credentials = parse_xtream_path(playlist.file_path) if playlist.playlist_type == "xtream" else None
+    if not credentials:
+        raise HTTPException(status_code=400, detail="Not an Xtream Codes playlist")
+    # Panel calls below may take a while; don't hold a pooled DB connection meanwhile
+    await db.close()
+    return XtreamClient(*credentials)
+
+@router.get("/{playlist_id}/vod")
+async def get_xtream_vod(
+    playlist_id: int,
+    category_id: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    client = await _xtream_client(db, playlist_id)
+    try:
+        categories = {c.get("category_id"): c.get("category_name") for c in await client.vod_categories()}
+        streams = await client.vod_streams(category_id)
+    except (httpx.HTTPError, ValueError) as e:
+        raise HTTPException(status_code=502, detail=f"Xtream panel unavailable: {e}")
+    
+    return [
+        {
+            "stream_id": stream.get("stream_id"),
+            "name": stream.get("name"),
+            "category": categories.get(stream.get("category_id")),
+            "rating": stream.get("rating"),
+            "poster_url": stream.get("stream_icon") or None,
+            "url": client.vod_url(stream.get("stream_id"), stream.get("container_extension"))
+        }
+        for stream in streams
+        if stream.get("stream_id") is not None
+    ]
+
+@router.get("/{playlist_id}/series")
+async def get_xtream_series(
+    playlist_id: int,
+    category_id: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    client = await _xtream_client(db, playlist_id)
+    try:
+        series = await client.series(category_id)
+    except (httpx.HTTPError, ValueError) as e:
+        raise HTTPException(status_code=502, detail=f"Xtream panel unavailable: {e}")
+    
+    return [
+        {
+            "series_id": item.get("series_id"),
+            "name": item.get("name"),
+            "plot": item.get("plot"),
+            "rating": item.get("rating"),
+            "cover_url": item.get("cover") or None,
+            "release_date": item.get("releaseDate")
+        }
+        for item in series
+    ]
+
 @router.delete("/{playlist_id}")
 async def delete_playlist(
     playlist_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    playlist = db.query(Playlist).filter(Playlist.id == playlist_id).first()
+    playlist = await db.get(Playlist, playlist_id)
     if not playlist:
         raise HTTPException(status_code=404, detail="Playlist not found")
     
-    # Delete associated channels
-    db.query(LiveTVChannel).filter(LiveTVChannel.playlist_id == playlist_id).delete()
+    # Delete associated channels and their guide data
+    channel_ids = select(LiveTVChannel.id).where(LiveTVChannel.playlist_id == playlist_id)
+    await db.execute(delete(EPGData).where(EPGData.channel_id.in_(channel_ids)))
+    await db.execute(delete(LiveTVChannel).where(LiveTVChannel.playlist_id == playlist_id))
+    await db.execute(delete(ChannelFacet).where(ChannelFacet.playlist_id == playlist_id))
     
     # Delete playlist file if it exists
     if os.path.exists(playlist.file_path):
         os.remove(playlist.file_path)
     
     # Delete playlist record
-    db.delete(playlist)
-    db.commit()
+    await db.execute(delete(Playlist).where(Playlist.id == playlist_id))
+    await db.commit()
+    await response_cache.bump(CHANNELS)
     
     return {"message": "Playlist deleted successfully"}
 
-async def parse_playlist(playlist_id: int, file_path: str, db: Session):
-    """Parse M3U playlist and create channel records"""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        current_channel = None
-        for line in lines:
-            line = line.strip()
-            if line.startswith('#EXTINF:'):
-                # Parse channel info
-                parts = line.split(',', 1)
-                if len(parts) > 1:
-                    info = parts[1]
-                    # Extract channel name and other info
-                    current_channel = {
-                        'name': info,
-                        'category': 'General',
-                        'language': 'Unknown',
-                        'country': 'Unknown'
-                    }
-            elif line and not line.startswith('#') and current_channel:
-                # This is the stream URL
-                channel = LiveTVChannel(
-                    name=current_channel['name'],
-                    url=line,
-                    category=current_channel['category'],
-                    language=current_channel['language'],
-                    country=current_channel['country'],
-                    playlist_id=playlist_id
-                )
-                db.add(channel)
-                current_channel = None
-        
-        db.commit()
-    except Exception as e:
-        print(f"Error parsing playlist: {e}")
-
-async def fetch_xtream_channels(playlist_id: int, url: str, username: str, password: str, db: Session):
-    """Fetch channels from Xtream Codes API"""
-    try:
-        import httpx
-        
-        # Get live streams
-        live_url = f"{url}/live/{username}/{password}"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(live_url)
-            if response.status_code == 200:
-                data = response.json()
-                for channel_data in data:
-                    channel = LiveTVChannel(
-                        name=channel_data.get('name', 'Unknown'),
-                        url=channel_data.get('url', ''),
-                        logo_url=channel_data.get('logo', ''),
-                        category=channel_data.get('category_name', 'General'),
-                        language=channel_data.get('language', 'Unknown'),
-                        country=channel_data.get('country', 'Unknown'),
-                        playlist_id=playlist_id
-                    )
-                    db.add(channel)
-        
-        db.commit()
-    except Exception as e:
-        print(f"Error fetching Xtream channels: {e}")
-
 @router.post("/{playlist_id}/refresh")
 async def refresh_playlist(
     playlist_id: int,
-    db: Session = Depends(get_db),
+    force: bool = Query(False),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    playlist = db.query(Playlist).filter(Playlist.id == playlist_id).first()
+    playlist = await db.get(Playlist, playlist_id)
     if not playlist:
         raise HTTPException(status_code=404, detail="Playlist not found")
     
-    # Delete existing channels
-    db.query(LiveTVChannel).filter(LiveTVChannel.playlist_id == playlist_id).delete()
-    
-    if playlist.playlist_type == "m3u":
-        await parse_playlist(playlist_id, playlist.file_path, db)
-    elif playlist.playlist_type == "xtream":
-        # Extract credentials from file_path
-        if playlist.file_path.startswith("xtream://"):
-            parts = playlist.file_path[9:].split("/")
-            if len(parts) >= 3:
-                url = f"{parts[0]}//{parts[1]}"
-                username = parts[2]
-                password = parts[3] if len(parts) > 3 else ""
-                await fetch_xtream_channels(playlist_id, url, username, password, db)
-    
-    return {"message": "Playlist refreshed successfully"}
+    # Unchanged sources are detected by content hash and skipped by the job
+    job = await job_manager.enqueue("playlist_refresh", {"playlist_id": playlist_id, "force": force})
+    
+    return {"job_id": job.id, "message": "Playlist refresh queued"}
@@ -0,0 +1,59 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db
+from models import User
+from routers.auth import get_current_user
+from services.search import search_channels, search_media
+
+router = APIRouter()
+
+@router.get("/")
+async def search(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Ranked channel and media matches for one query"""
+    channels = await search_channels(db, q, limit=limit)
+    media = await search_media(db, q, limit=limit)
+    
+    return {
+        "channels": [
+            {
+                "id": channel.id,
+                "name": channel.name,
+                "logo_url": channel.logo_url,
+                "category": channel.category,
+                "score": round(score, 4)
+            }
+            for channel, score in channels
+        ],
+        "media": [
+            {
+                "id": item.id,
+                "title": item.title,
+                "media_type": item.media_type,
+                "year": item.year,
+                "score": round(score, 4)
+            }
+            for item, score in media
+        ]
+    }
+
+@router.get("/suggest")
+async def suggest(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(8, ge=1, le=25),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Autocomplete: the last word of `q` is matched as a prefix"""
+    channels = await search_channels(db, q, limit=limit, prefix=True)
+    media = await search_media(db, q, limit=limit, prefix=True)
+    
+    return {
+        "channels": [{"id": channel.id, "name": channel.name} for channel, _ in channels],
+        "media": [{"id": item.id, "title": item.title} for item, _ in media]
+    }
@@ -0,0 +1,56 @@
+import os
+import re
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, Response
+
+from models import User
+from routers.auth import get_current_user
+from services.transcode import PLAYLIST, transcode_manager
+
+router = APIRouter()
+
+SEGMENT_RE = re.compile(r"^seg\d+\.ts$")
+
+@router.get("/")
+async def get_transcode_sessions(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    return transcode_manager.stats()
+
+# Session ids are unguessable and handed out only to authenticated viewers;
+# players fetching the playlist and segments can't attach bearer tokens
+@router.get("/{session_id}/{name}")
+async def get_transcode_file(session_id: str, name: str):
+    # Possibly a session another worker runs; its files are in the shared scratch directory
+    session = await transcode_manager.locate(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Transcode session not found")
+    
+    if name == PLAYLIST:
+        try:
+            with open(session.playlist_path(), "rb") as f:
+                playlist = f.read()
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Playlist not ready")
+        return Response(
+            content=playlist,
+            media_type="application/vnd.apple.mpegurl",
+            headers={"Cache-Control": "no-cache"}
+        )
+    
+    path = os.path.join(session.directory, name)
+    if not SEGMENT_RE.match(name) or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Segment not found")
+    # Segments never change once listed
+    return FileResponse(path, media_type="video/mp2t", headers={"Cache-Control": "private, max-age=3600"})
+
+@router.delete("/{session_id}")
+async def stop_transcode_session(session_id: str, current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    if not await transcode_manager.stop(session_id):
+        raise HTTPException(status_code=404, detail="Transcode session not found")
+    return {"message": "Transcode session stopped"}
@@ -0,0 +1,145 @@
+import json
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional
+
+from config import settings
+from services.cache import TTLCache
+from services.redis_pool import get_redis
+
+USER_FIELDS = ("id", "username", "email", "is_active", "is_admin", "created_at")
+
+
+class CachedUser:
+    """Read-only snapshot of a User row, safe to share between requests"""
+
+    __slots__ = USER_FIELDS
+
+    def __init__(self, **fields):
+        for name in USER_FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_model(cls, user) -> "CachedUser":
+        return cls(**{name: getattr(user, name) for name in USER_FIELDS})
+
+    def to_json(self) -> str:
+        data = {name: getattr(self, name) for name in USER_FIELDS}
+        if self.created_at is not None:
+            data["created_at"] = self.created_at.isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw) -> "CachedUser":
+        data = json.loads(raw)
+        if data.get("created_at"):
+            data["created_at"] = datetime.fromisoformat(data["created_at"])
+        return cls(**data)
+
+
+class UserCache:
+    """Verified tokens and the users behind them, so authentication skips the DB.
+
+    Two in-process layers: token -> subject (skips JWT verification for a
+    token already seen, until its exp) and subject -> user snapshot. When
+    Redis is reachable it backs the user layer so workers share lookups and
+    invalidations; the local layer then uses a short TTL so an invalidation
+    made by another worker is picked up quickly.
+    """
+
+    def __init__(self):
+        self.tokens = TTLCache(settings.auth_cache_size, settings.auth_cache_ttl)
+        self.users = TTLCache(settings.auth_cache_size, settings.auth_cache_ttl)
+        self.redis_hits = 0
+        self.db_loads = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _redis_key(username: str) -> str:
+        return f"auth:user:{username}"
+
+    def verified_subject(self, token: str) -> Optional[str]:
+        if not settings.auth_cache_enabled:
+            return None
+        entry = self.tokens.get(token)
+        if entry is None:
+            return None
+        subject, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            self.tokens.pop(token)
+            return None
+        return subject
+
+    def remember_token(self, token: str, subject: str, expires_at: Optional[float]):
+        if not settings.auth_cache_enabled:
+            return
+        ttl = self.tokens.ttl
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - time.time())
+        if ttl > 0:
+            self.tokens.set(token, (subject, expires_at), ttl)
+
+    async def get_user(self, username: str, load: Callable[[], Awaitable[Any]]) -> Optional[CachedUser]:
+        """Cached snapshot of a user, calling `load` (a DB lookup) only on a miss"""
+        if not settings.auth_cache_enabled:
+            user = await load()
+            return CachedUser.from_model(user) if user is not None else None
+
+        cached = self.users.get(username)
+        if cached is not None:
+            return cached
+
+        redis = await get_redis()
+        if redis is not None:
+            try:
+                raw = await redis.get(self._redis_key(username))
+            except Exception as e:
+                print(f"Error reading auth cache from Redis: {e}")
+                raw = None
+            if raw is not None:
+                cached = CachedUser.from_json(raw)
+                self.redis_hits += 1
+                self.users.set(username, cached, settings.auth_cache_local_ttl)
+                return cached
+
+        user = await load()
+        self.db_loads += 1
+        if user is None:
+            return None
+        cached = CachedUser.from_model(user)
+
+        if redis is not None:
+            try:
+                await redis.set(self._redis_key(username), cached.to_json(), ex=settings.auth_cache_ttl)
+            except Exception as e:
+                print(f"Error writing auth cache to Redis: {e}")
+            self.users.set(username, cached, settings.auth_cache_local_ttl)
+        else:
+            self.users.set(username, cached)
+        return cached
+
+    async def invalidate(self, username: str):
+        """Forget a user after their account changes (deactivation, admin flag, ...)"""
+        self.invalidations += 1
+        self.users.pop(username)
+        # Tokens map to a subject, not to user state, so they stay valid: the
+        # next request reloads the user and sees the change
+        redis = await get_redis()
+        if redis is not None:
+            try:
+                await redis.delete(self._redis_key(username))
+            except Exception as e:
+                print(f"Error invalidating auth cache in Redis: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.auth_cache_enabled,
+            "tokens": self.tokens.stats(),
+            "users": self.users.stats(),
+            "redis_hits": self.redis_hits,
+            "db_loads": self.db_loads,
+            "invalidations": self.invalidations,
+        }
+
+
+user_cache = UserCache()
@@ -0,0 +1,266 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database import AsyncSessionLocal
+from services.redis_pool import get_redis
+
+# Namespace of everything derived from the channel table; bumped whenever a
+# playlist import, refresh or delete changes channels
+CHANNELS = "channels"
+# Media library namespace; bumped after each library scan
+MEDIA = "media"
+# Guide data; bumped after each EPG import
+EPG = "epg"
+
+
+class TTLCache:
+    """Size-bounded LRU whose entries also expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires at, value)
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "items": len(self._entries),
+        }
+
+
+class Payload:
+    """Data to serve plus response headers that belong with it, e.g. a next-page cursor"""
+
+    __slots__ = ("data", "headers")
+
+    def __init__(self, data: Any, headers: Optional[Dict[str, str]] = None):
+        self.data = data
+        self.headers = headers or {}
+
+
+class CachedResponse:
+    """A rendered JSON body with its ETag, extra headers and the time it stops being fresh"""
+
+    __slots__ = ("etag", "fresh_until", "headers", "body")
+
+    def __init__(self, etag: str, fresh_until: float, headers: Dict[str, str], body: bytes):
+        self.etag = etag
+        self.fresh_until = fresh_until
+        self.headers = headers
+        self.body = body
+
+    @classmethod
+    def render(cls, data: Any) -> "CachedResponse":
+        headers = {}
+        if isinstance(data, Payload):
+            data, headers = data.data, data.headers
+        body = json.dumps(jsonable_encoder(data), separators=(",", ":")).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        return cls(etag, time.time() + settings.response_cache_ttl, headers, body)
+
+    def dumps(self) -> bytes:
+        return f"{self.etag}\n{self.fresh_until}\n{json.dumps(self.headers)}\n".encode() + self.body
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "CachedResponse":
+        etag, fresh_until, headers, body = raw.split(b"\n", 3)
+        return cls(etag.decode(), float(fresh_until), json.loads(headers), body)
+
+
+class ResponseCache:
+    """Cache of rendered JSON responses for read-mostly endpoints.
+
+    Keys carry a per-namespace version, so bumping the version invalidates
+    every cached response in the namespace at once without scanning for keys.
+    Entries stay fresh for response_cache_ttl; after that they are still
+    served (until response_cache_stale_ttl) while one background task
+    recomputes them. Responses carry an ETag and honour If-None-Match.
+
+    Redis holds versions and entries when reachable so all workers share
+    them; otherwise both live in process.
+    """
+
+    def __init__(self):
+        self.local = TTLCache(settings.response_cache_size, settings.response_cache_stale_ttl)
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.not_modified = 0
+        self._versions: Dict[str, int] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+    async def version(self, namespace: str) -> int:
+        redis = await get_redis()
+        if redis is not None:
+            try:
+                return int(await redis.get(f"cache:version:{namespace}") or 0)
+            except Exception as e:
+                print(f"Error reading cache version from Redis: {e}")
+        return self._versions.get(namespace, 0)
+
+    async def bump(self, namespace: str):
+        """Invalidate every cached response in a namespace"""
+        self._versions[namespace] = self._versions.get(namespace, 0) + 1
+        redis = await get_redis()
+        if redis is not None:
+            try:
+                await redis.incr(f"cache:version:{namespace}")
+            except Exception as e:
+                print(f"Error bumping cache version in Redis: {e}")
+
+    @staticmethod
+    def _key(namespace: str, version: int, request: Request) -> str:
+        query = urlencode(sorted(request.query_params.multi_items()))
+        digest = hashlib.sha1(f"{request.url.path}?{query}".encode()).hexdigest()
+        return f"cache:resp:{namespace}:{version}:{digest}"
+
+    async def _load(self, key: str) -> Optional[CachedResponse]:
+        redis = await get_redis()
+        if redis is not None:
+            try:
+                raw = await redis.get(key)
+                return CachedResponse.loads(raw) if raw is not None else None
+            except Exception as e:
+                print(f"Error reading response cache from Redis: {e}")
+        return self.local.get(key)
+
+    async def _store(self, key: str, entry: CachedResponse):
+        redis = await get_redis()
+        if redis is not None:
+            try:
+                await redis.set(key, entry.dumps(), ex=settings.response_cache_stale_ttl)
+                return
+            except Exception as e:
+                print(f"Error writing response cache to Redis: {e}")
+        self.local.set(key, entry)
+
+    async def _fill(self, key: str, compute: Callable[[AsyncSession], Awaitable[Any]], db: AsyncSession) -> CachedResponse:
+        # Concurrent misses on one key share a single computation
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            entry = CachedResponse.render(await compute(db))
+            await self._store(key, entry)
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def _revalidate(self, key: str, compute: Callable[[AsyncSession], Awaitable[Any]]):
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                # The request's session is closed by the time this runs
+                async with AsyncSessionLocal() as db:
+                    await self._fill(key, compute, db)
+            except Exception as e:
+                print(f"Error revalidating cached response: {e}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+    def _respond(self, request: Request, entry: CachedResponse) -> Response:
+        headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "private, no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or entry.etag in [
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        ]):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    async def respond(
+        self,
+        request: Request,
+        namespace: str,
+        compute: Callable[[AsyncSession], Awaitable[Any]],
+        db: AsyncSession,
+    ) -> Response:
+        """Serve `compute(db)` as JSON from the cache, computing it on a miss.
+
+        `compute` returns the data to serve, or a Payload when the response
+        also needs headers.
+        """
+        if not settings.response_cache_enabled:
+            return self._respond(request, CachedResponse.render(await compute(db)))
+
+        key = self._key(namespace, await self.version(namespace), request)
+        entry = await self._load(key)
+        if entry is None:
+            self.misses += 1
+            entry = await self._fill(key, compute, db)
+        else:
+            self.hits += 1
+            if entry.fresh_until <= time.time():
+                self.stale += 1
+                self._revalidate(key, compute)
+        return self._respond(request, entry)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": settings.response_cache_enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stale_served": self.stale,
+            "not_modified": self.not_modified,
+            "local_items": len(self.local),
+            "versions": dict(self._versions),
+        }
+
+
+response_cache = ResponseCache()
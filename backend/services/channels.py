@@ -0,0 +1,259 @@
+import csv
+import io
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from models import LiveTVChannel
+from config import settings
+from services.facets import FacetDeltas, apply_facet_deltas
+from services.health import UNPROBED_RANK
+from services.m3u import channel_identity, with_identities
+from services.perf import ImportStats
+
+CHANNEL_COLUMNS = [
+    "identity", "name", "url", "tvg_id", "logo_url", "category",
+    "language", "country", "is_active", "playlist_id",
+]
+
+# Columns compared when deciding whether an existing channel needs an update
+SYNC_FIELDS = ["name", "url", "tvg_id", "logo_url", "category", "language", "country"]
+
+# Health state cleared when a channel's stream URL changes or it leaves its playlist
+HEALTH_RESET = {
+    "health_failures": 0, "health_rank": UNPROBED_RANK, "health_checked_at": None,
+    "latency_ms": None, "bitrate_kbps": None,
+}
+
+
+class SyncStats(ImportStats):
+    """Outcome of diffing a playlist against the channels already stored"""
+
+    def __init__(self):
+        super().__init__()
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deactivated = 0
+
+    def as_dict(self) -> dict:
+        result = super().as_dict()
+        result.update({
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "deactivated": self.deactivated,
+        })
+        return result
+
+
+def _batches(entries: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _channel_row(entry: dict, playlist_id: int) -> dict:
+    return {
+        "identity": entry.get("identity"),
+        "name": entry["name"],
+        "url": entry["url"],
+        "tvg_id": entry.get("tvg_id"),
+        "logo_url": entry.get("logo_url"),
+        "category": entry.get("category") or "General",
+        "language": entry.get("language") or "Unknown",
+        "country": entry.get("country") or "Unknown",
+        "is_active": True,
+        "playlist_id": playlist_id,
+    }
+
+
+def _copy_rows(db: Session, rows: List[dict]):
+    """Load rows with PostgreSQL COPY, which avoids per-row statement overhead"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            "t" if row[col] is True else ("\\N" if row[col] is None else row[col])
+            for col in CHANNEL_COLUMNS
+        ])
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY live_tv_channels ({', '.join(CHANNEL_COLUMNS)}) "
+            "FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def _insert_rows(db: Session, rows: List[dict]):
+    if not rows:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        _copy_rows(db, rows)
+    else:
+        db.execute(insert(LiveTVChannel), rows)
+
+
+def bulk_insert_channels(
+    db: Session,
+    playlist_id: int,
+    entries: Iterable[dict],
+    batch_size: Optional[int] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> ImportStats:
+    """Insert channel entries in batches without building ORM objects.
+
+    Uses COPY on PostgreSQL and executemany everywhere else. The caller
+    owns the transaction and is expected to commit.
+    """
+    batch_size = batch_size or settings.playlist_batch_size
+    stats = ImportStats()
+    facets = FacetDeltas()
+
+    for batch in _batches(with_identities(entries), batch_size):
+        rows = [_channel_row(entry, playlist_id) for entry in batch]
+        _insert_rows(db, rows)
+        for row in rows:
+            facets.add(row)
+        stats.rows += len(batch)
+        if progress:
+            progress(stats.rows)
+
+    apply_facet_deltas(db, playlist_id, facets)
+    return stats.finish()
+
+
+def _load_existing(db: Session, playlist_id: int) -> Dict[str, dict]:
+    """Map identity -> stored column values for every channel in a playlist"""
+    columns = [LiveTVChannel.id, LiveTVChannel.identity, LiveTVChannel.is_active, LiveTVChannel.health_failures]
+    columns += [getattr(LiveTVChannel, field) for field in SYNC_FIELDS]
+    result = db.execute(
+        select(*columns)
+        .where(LiveTVChannel.playlist_id == playlist_id)
+        .order_by(LiveTVChannel.id)
+    )
+
+    existing = {}
+    # Rows imported before identities existed get one derived the same way a
+    # fresh import would, so the first diff adopts them instead of duplicating.
+    legacy = []
+    for row in result.mappings():
+        row = dict(row)
+        if row["identity"]:
+            existing[row["identity"]] = row
+        else:
+            legacy.append(row)
+
+    seen: Dict[str, int] = {}
+    for row in legacy:
+        identity = channel_identity(row)
+        occurrence = seen.get(identity, 0)
+        seen[identity] = occurrence + 1
+        if occurrence:
+            identity = f"{identity}#{occurrence}"
+        if identity not in existing:
+            row["identity"] = identity
+            row["needs_identity"] = True
+            existing[identity] = row
+    return existing
+
+
+def sync_channels(
+    db: Session,
+    playlist_id: int,
+    entries: Iterable[dict],
+    batch_size: Optional[int] = None,
+    progress: Optional[Callable[[int], None]] = None,
+) -> SyncStats:
+    """Apply a playlist to its stored channels as a diff.
+
+    New identities are inserted, changed ones updated in place (keeping their
+    ids), and channels missing from the playlist are deactivated rather than
+    deleted so cached ids and EPG rows stay valid. The caller owns the
+    transaction and is expected to commit.
+    """
+    batch_size = batch_size or settings.playlist_batch_size
+    stats = SyncStats()
+    facets = FacetDeltas()
+    existing = _load_existing(db, playlist_id)
+
+    for batch in _batches(with_identities(entries), batch_size):
+        inserts = []
+        updates = []
+        for entry in batch:
+            row = _channel_row(entry, playlist_id)
+            current = existing.pop(row["identity"], None)
+            if current is None:
+                inserts.append(row)
+                facets.add(row)
+                continue
+
+            changed = {
+                field: row[field]
+                for field in SYNC_FIELDS
+                if current[field] != row[field]
+            }
+            if "url" in changed:
+                changed.update(HEALTH_RESET)
+            if current["is_active"]:
+                facets.change(current, row)
+            elif "url" in changed or current["health_failures"] < settings.health_max_failures:
+                # Back in the playlist. A channel the health prober deactivated
+                # stays down until it answers again or gets a new URL.
+                changed["is_active"] = True
+                facets.add(row)
+            if current.get("needs_identity"):
+                changed["identity"] = row["identity"]
+
+            if changed:
+                changed["id"] = current["id"]
+                updates.append(changed)
+            else:
+                stats.unchanged += 1
+
+        _insert_rows(db, inserts)
+        # Group by column set so each executemany shares one UPDATE statement
+        by_columns: Dict[tuple, List[dict]] = {}
+        for values in updates:
+            by_columns.setdefault(tuple(sorted(values)), []).append(values)
+        for group in by_columns.values():
+            db.execute(update(LiveTVChannel), group)
+
+        stats.inserted += len(inserts)
+        stats.updated += len(updates)
+        stats.rows += len(batch)
+        if progress:
+            progress(stats.rows)
+
+    # Channels the prober deactivated are included so their failure count is
+    # cleared, which takes them out of future probe runs
+    stale = [
+        row for row in existing.values()
+        if row["is_active"] or row["health_failures"] >= settings.health_max_failures
+    ]
+    for row in stale:
+        if row["is_active"]:
+            facets.add(row, -1)
+    stale_ids = [row["id"] for row in stale]
+    for ids in _batches(stale_ids, batch_size):
+        db.execute(
+            update(LiveTVChannel)
+            .where(LiveTVChannel.id.in_(ids))
+            .values(is_active=False, **HEALTH_RESET)
+            .execution_options(synchronize_session=False)
+        )
+    stats.deactivated = sum(1 for row in stale if row["is_active"])
+
+    apply_facet_deltas(db, playlist_id, facets)
+    return stats.finish()
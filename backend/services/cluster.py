@@ -0,0 +1,39 @@
+import os
+import secrets
+import socket
+
+# Identifies this worker process in Redis leases. The random part keeps a
+# restarted container, whose pids repeat, from matching a stale lease.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+
+# Only the holder may extend or drop a lease
+_RENEW = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+async def acquire_lease(redis, key: str, ttl: float) -> bool:
+    """Take `key` for this worker unless another worker holds it.
+
+    A lease expires after `ttl` seconds unless renewed, so one held by a
+    worker that died is freed without anyone cleaning up after it.
+    """
+    return bool(await redis.set(key, WORKER_ID, nx=True, px=int(ttl * 1000)))
+
+
+async def renew_lease(redis, key: str, ttl: float) -> bool:
+    """Extend a lease this worker holds; False if it expired and may now be someone else's"""
+    return bool(await redis.eval(_RENEW, 1, key, WORKER_ID, int(ttl * 1000)))
+
+
+async def release_lease(redis, key: str):
+    await redis.eval(_RELEASE, 1, key, WORKER_ID)
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Sequence
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import Session
+
+from models import EPGData
+from config import settings
+
+PROGRAMME_COLUMNS = (EPGData.id, EPGData.channel_id, EPGData.title, EPGData.description,
+                     EPGData.start_time, EPGData.end_time)
+
+
+def to_utc(value: datetime) -> datetime:
+    """Aware UTC datetime; naive values (SQLite reads, query params) are taken as UTC"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _programme(row) -> dict:
+    return {
+        "id": row.id,
+        "title": row.title,
+        "description": row.description,
+        "start_time": row.start_time,
+        "end_time": row.end_time,
+    }
+
+
+def _grid_cell(row) -> dict:
+    return {"id": row.id, "title": row.title, "start_time": row.start_time, "end_time": row.end_time}
+
+
+def overlapping(start: datetime, end: datetime):
+    """Filter for programmes airing at any point in [start, end).
+
+    The lower bound on start_time is implied by the overlap (nothing runs longer
+    than epg_max_programme_hours) but spelling it out turns the scan of the
+    (channel_id, start_time, end_time) index into a short range per channel
+    instead of everything before `end`.
+    """
+    return and_(
+        EPGData.start_time >= start - timedelta(hours=settings.epg_max_programme_hours),
+        EPGData.start_time < end,
+        EPGData.end_time > start,
+    )
+
+
+def guide_grid(db: Session, channel_ids: Sequence[int], start: datetime, end: datetime) -> Dict[int, List[dict]]:
+    """channel id -> programmes overlapping [start, end), in start order.
+
+    Grid cells leave out descriptions, which dominate the payload for a full
+    guide page; fetch them per programme from /epg when a cell is opened.
+    """
+    start, end = to_utc(start), to_utc(end)
+    grid: Dict[int, List[dict]] = {channel_id: [] for channel_id in channel_ids}
+    if not channel_ids:
+        return grid
+
+    rows = db.execute(
+        select(EPGData.id, EPGData.channel_id, EPGData.title, EPGData.start_time, EPGData.end_time)
+        .where(EPGData.channel_id.in_(channel_ids), overlapping(start, end))
+        .order_by(EPGData.channel_id, EPGData.start_time)
+    )
+    for row in rows:
+        grid[row.channel_id].append(_grid_cell(row))
+    return grid
+
+
+def now_next(db: Session, channel_ids: Sequence[int], at: datetime) -> Dict[int, dict]:
+    """channel id -> {"now": programme or None, "next": programme or None}
+
+    One query for all channels: each channel's programmes still running or
+    starting within epg_next_horizon_hours are ranked by start time and only
+    the first two are returned.
+    """
+    at = to_utc(at)
+    result = {channel_id: {"now": None, "next": None} for channel_id in channel_ids}
+    if not channel_ids:
+        return result
+
+    rank = func.row_number().over(partition_by=EPGData.channel_id, order_by=EPGData.start_time).label("rank")
+    ranked = (
+        select(*PROGRAMME_COLUMNS, rank)
+        .where(
+            EPGData.channel_id.in_(channel_ids),
+            overlapping(at, at + timedelta(hours=settings.epg_next_horizon_hours)),
+        )
+        .subquery()
+    )
+    rows = db.execute(select(ranked).where(ranked.c.rank <= 2).order_by(ranked.c.channel_id, ranked.c.rank))
+
+    for row in rows:
+        slots = result[row.channel_id]
+        if row.rank == 1 and to_utc(row.start_time) <= at:
+            slots["now"] = _programme(row)
+        elif slots["next"] is None:
+            slots["next"] = _programme(row)
+    return result
+
@@ -0,0 +1,300 @@
+import asyncio
+import gzip
+import hashlib
+import hmac
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, Hashable, List
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from xml.sax.saxutils import escape, quoteattr
+
+from config import settings
+from models import EPGData, LiveTVChannel
+from services.cache import TTLCache
+from services.epg import overlapping, to_utc
+
+try:
+    import zstandard
+except ImportError:  # optional; exports are then offered gzip compressed only
+    zstandard = None
+
+# Rows fetched per round trip from the server-side cursor
+ROW_BATCH = 1000
+# Rendered text is handed to the writer thread in chunks of about this size
+WRITE_CHUNK = 256 * 1024
+
+# Players poll these; revalidating by ETag costs them a 304
+CACHE_CONTROL = "private, no-cache"
+
+# Stored representations, preferred first: (file suffix, Content-Encoding)
+ENCODINGS = [("zst", "zstd"), ("gz", "gzip")] if zstandard else [("gz", "gzip")]
+
+
+def _signature(user_id: int) -> str:
+    message = f"export:{user_id}".encode("utf-8")
+    return hmac.new(settings.jwt_secret.encode("utf-8"), message, hashlib.sha256).hexdigest()[:32]
+
+
+def export_key(user_id: int) -> str:
+    """Key that authorizes a user's export URLs.
+
+    IPTV players are configured with a URL and can't send bearer tokens, so
+    the playlist, guide and the stream URLs inside them carry this instead.
+    It doesn't expire; deactivating the user revokes it.
+    """
+    return _signature(user_id)
+
+
+def verify_export_key(user_id: int, key: str) -> bool:
+    return hmac.compare_digest(_signature(user_id), key)
+
+
+class _ExportWriter:
+    """One export being rendered: plain and compressed temp files, hashed as written"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.hash = hashlib.sha256()
+        self.paths: Dict[str, str] = {}
+        self._raw = {}
+        self._streams = {}
+        for suffix in [""] + [suffix for suffix, _ in ENCODINGS]:
+            fd, path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+            self.paths[suffix] = path
+            self._raw[suffix] = os.fdopen(fd, "wb")
+        self._streams[""] = self._raw[""]
+        # mtime=0 keeps the gzip output a function of the content alone
+        self._streams["gz"] = gzip.GzipFile(fileobj=self._raw["gz"], mode="wb", compresslevel=6, mtime=0)
+        if zstandard:
+            self._streams["zst"] = zstandard.ZstdCompressor(level=3).stream_writer(self._raw["zst"], closefd=False)
+
+    def write(self, data: bytes):
+        self.hash.update(data)
+        for stream in self._streams.values():
+            stream.write(data)
+
+    def commit(self) -> str:
+        for suffix, stream in self._streams.items():
+            if stream is not self._raw[suffix]:
+                stream.close()
+            self._raw[suffix].close()
+        digest = self.hash.hexdigest()
+        for suffix, path in self.paths.items():
+            os.replace(path, os.path.join(self.directory, f"{digest}.{suffix}" if suffix else digest))
+        return digest
+
+    def discard(self):
+        for raw in self._raw.values():
+            raw.close()
+        for path in self.paths.values():
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+class ExportCache:
+    """Rendered M3U/XMLTV exports on disk, named by the hash of their content.
+
+    The hash is the ETag, so a player re-fetching an unchanged export gets
+    a 304 even after it was rendered again. Exports are rendered from a
+    streaming query straight to disk, already compressed, so a 100k channel
+    playlist or a week of guide data never sits in memory. A rendered export
+    is reused for export_cache_ttl, or until the data behind it changes.
+    """
+
+    def __init__(self):
+        self.root = settings.export_cache_dir or os.path.join(settings.media_path, ".cache", "exports")
+        self._refs = TTLCache(1000, settings.export_cache_ttl)
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.renders = 0
+
+    def path(self, digest: str, suffix: str = "") -> str:
+        return os.path.join(self.root, f"{digest}.{suffix}" if suffix else digest)
+
+    async def get(self, key: Hashable, render: Callable[[], AsyncIterator[str]]) -> str:
+        """Digest of the export for `key`, rendering it if needed"""
+        digest = self._refs.get(key)
+        if digest is not None and os.path.exists(self.path(digest)):
+            return digest
+
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            digest = await self._render(render())
+            self._refs.set(key, digest)
+            future.set_result(digest)
+            return digest
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved; waiters re-raise it
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _render(self, chunks: AsyncIterator[str]) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        writer = await asyncio.to_thread(_ExportWriter, self.root)
+        try:
+            pending: List[str] = []
+            size = 0
+            async for text in chunks:
+                pending.append(text)
+                size += len(text)
+                if size >= WRITE_CHUNK:
+                    # Compression runs in a thread so large exports don't stall the event loop
+                    await asyncio.to_thread(writer.write, "".join(pending).encode("utf-8"))
+                    pending, size = [], 0
+            await asyncio.to_thread(writer.write, "".join(pending).encode("utf-8"))
+            digest = await asyncio.to_thread(writer.commit)
+        except BaseException:
+            await asyncio.to_thread(writer.discard)
+            raise
+        self.renders += 1
+        await asyncio.to_thread(self._prune)
+        return digest
+
+    def _prune(self):
+        """Remove exports no ref can still point at (open responses keep their file handle)"""
+        cutoff = time.time() - 2 * settings.export_cache_ttl
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        return {
+            "root": self.root,
+            "encodings": [encoding for _, encoding in ENCODINGS],
+            "renders": self.renders,
+            "refs": self._refs.stats(),
+        }
+
+
+export_cache = ExportCache()
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def export_response(request: Request, digest: str, media_type: str, filename: str) -> Response:
+    """Serve a rendered export in the best encoding the client accepts"""
+    accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+    suffix, encoding = next(((s, e) for s, e in ENCODINGS if e in accepted), ("", None))
+    # Each encoding is a different byte sequence, so each gets its own strong ETag
+    etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+        "Content-Disposition": f'inline; filename="{filename}"',
+    }
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(export_cache.path(digest, suffix), media_type=media_type, headers=headers)
+
+
+def _attr(value) -> str:
+    """An #EXTINF attribute value; M3U has no escaping, so quotes and line breaks are replaced"""
+    return str(value).replace('"', "'").replace("\r", " ").replace("\n", " ")
+
+
+def _xmltv_time(value: datetime) -> str:
+    return to_utc(value).strftime("%Y%m%d%H%M%S +0000")
+
+
+async def render_m3u(
+    db: AsyncSession,
+    filters: list,
+    stream_url: Callable[[int], str],
+    logo_url: Callable[[int], str],
+    epg_url: str,
+) -> AsyncIterator[str]:
+    """M3U lines for active channels, a batch of rows at a time"""
+    yield f'#EXTM3U url-tvg="{_attr(epg_url)}" x-tvg-url="{_attr(epg_url)}"\n'
+    query = (
+        select(
+            LiveTVChannel.id, LiveTVChannel.name, LiveTVChannel.logo_url,
+            LiveTVChannel.category, LiveTVChannel.language, LiveTVChannel.country,
+        )
+        .where(LiveTVChannel.is_active == True, *filters)
+        .order_by(LiveTVChannel.id)
+        .execution_options(yield_per=ROW_BATCH)
+    )
+    result = await db.stream(query)
+    async for rows in result.partitions():
+        lines = []
+        for row in rows:
+            # tvg-id is our channel id, which is also the channel id in the exported guide
+            attributes = [f'tvg-id="{row.id}"', f'tvg-name="{_attr(row.name)}"']
+            if row.logo_url:
+                attributes.append(f'tvg-logo="{_attr(logo_url(row.id))}"')
+            for name, value in (("group-title", row.category), ("tvg-language", row.language), ("tvg-country", row.country)):
+                if value:
+                    attributes.append(f'{name}="{_attr(value)}"')
+            name = _attr(row.name).replace(",", " ")
+            lines.append(f"#EXTINF:-1 {' '.join(attributes)},{name}\n{stream_url(row.id)}\n")
+        yield "".join(lines)
+
+
+async def render_xmltv(
+    db: AsyncSession,
+    filters: list,
+    logo_url: Callable[[int], str],
+    days: int,
+) -> AsyncIterator[str]:
+    """XMLTV for active channels: channel elements, then programmes per channel in start order"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE tv SYSTEM "xmltv.dtd">\n<tv generator-info-name="LiveTV">\n'
+
+    channels = (
+        select(LiveTVChannel.id, LiveTVChannel.name, LiveTVChannel.logo_url)
+        .where(LiveTVChannel.is_active == True, *filters)
+        .order_by(LiveTVChannel.id)
+        .execution_options(yield_per=ROW_BATCH)
+    )
+    result = await db.stream(channels)
+    async for rows in result.partitions():
+        yield "".join(
+            f'<channel id="{row.id}"><display-name>{escape(row.name)}</display-name>'
+            + (f"<icon src={quoteattr(logo_url(row.id))}/>" if row.logo_url else "")
+            + "</channel>\n"
+            for row in rows
+        )
+
+    now = datetime.now(timezone.utc)
+    programmes = (
+        select(EPGData.channel_id, EPGData.title, EPGData.description, EPGData.start_time, EPGData.end_time)
+        .join(LiveTVChannel, EPGData.channel_id == LiveTVChannel.id)
+        .where(LiveTVChannel.is_active == True, *filters, overlapping(now - timedelta(hours=2), now + timedelta(days=days)))
+        .order_by(EPGData.channel_id, EPGData.start_time)
+        .execution_options(yield_per=ROW_BATCH)
+    )
+    result = await db.stream(programmes)
+    async for rows in result.partitions():
+        yield "".join(
+            f'<programme start="{_xmltv_time(row.start_time)}" stop="{_xmltv_time(row.end_time)}" channel="{row.channel_id}">'
+            f"<title>{escape(row.title)}</title>"
+            + (f"<desc>{escape(row.description)}</desc>" if row.description else "")
+            + "</programme>\n"
+            for row in rows
+        )
+
+    yield "</tv>\n"
@@ -0,0 +1,78 @@
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import ChannelFacet
+
+FACET_FIELDS = ("category", "language", "country")
+
+# Response keys for each facet field
+FACET_NAMES = {"category": "categories", "language": "languages", "country": "countries"}
+
+
+class FacetDeltas(Counter):
+    """Pending (facet, value) -> count changes for one playlist"""
+
+    def add(self, row: dict, sign: int = 1):
+        for facet in FACET_FIELDS:
+            value = row.get(facet)
+            if value is not None:
+                self[(facet, value)] += sign
+
+    def change(self, old: dict, new: dict):
+        """Move an active channel's counts from its old facet values to its new ones"""
+        for facet in FACET_FIELDS:
+            if old.get(facet) != new.get(facet):
+                if old.get(facet) is not None:
+                    self[(facet, old[facet])] -= 1
+                if new.get(facet) is not None:
+                    self[(facet, new[facet])] += 1
+
+
+def apply_facet_deltas(db: Session, playlist_id: int, deltas: FacetDeltas):
+    """Fold count changes into channel_facets. The caller owns the transaction.
+
+    One statement per distinct (facet, value) touched, which is bounded by the
+    number of distinct values rather than the number of channels changed.
+    """
+    changed = [(key, delta) for key, delta in deltas.items() if delta]
+    if not changed:
+        return
+
+    for (facet, value), delta in changed:
+        result = db.execute(
+            update(ChannelFacet)
+            .where(
+                ChannelFacet.playlist_id == playlist_id,
+                ChannelFacet.facet == facet,
+                ChannelFacet.value == value,
+            )
+            .values(count=ChannelFacet.count + delta)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0 and delta > 0:
+            db.execute(insert(ChannelFacet).values(playlist_id=playlist_id, facet=facet, value=value, count=delta))
+
+    db.execute(
+        delete(ChannelFacet)
+        .where(ChannelFacet.playlist_id == playlist_id, ChannelFacet.count <= 0)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def facet_counts(db: AsyncSession, playlist_id: Optional[int] = None) -> Dict[str, List[dict]]:
+    """All facet values with channel counts, for one playlist or summed across all of them"""
+    total = func.sum(ChannelFacet.count).label("count")
+    query = select(ChannelFacet.facet, ChannelFacet.value, total).group_by(ChannelFacet.facet, ChannelFacet.value)
+    if playlist_id is not None:
+        query = query.where(ChannelFacet.playlist_id == playlist_id)
+
+    result: Dict[str, List[dict]] = {name: [] for name in FACET_NAMES.values()}
+    rows: List[Tuple[str, str, int]] = (await db.execute(query)).all()
+    for facet, value, count in sorted(rows, key=lambda row: (-row[2], row[1])):
+        if count > 0:
+            result[FACET_NAMES[facet]].append({"value": value, "count": int(count)})
+    return result
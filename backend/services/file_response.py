@@ -0,0 +1,204 @@
+import asyncio
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Optional, Tuple
+
+import aiofiles
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from config import settings
+
+ByteRange = Tuple[int, int]  # inclusive start, inclusive end
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(header: str, size: int, max_ranges: int = 16) -> Optional[List[ByteRange]]:
+    """Parse a bytes Range header into inclusive (start, end) pairs.
+
+    Returns None when the header should be ignored (malformed or not a bytes
+    range), and raises RangeNotSatisfiable when no range overlaps the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_text, sep, end_text = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if start_text == "":
+                # Suffix range: the last N bytes
+                length = int(end_text)
+                if length == 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(start_text)
+                end = int(end_text) if end_text else size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        if start < 0 or end < start:
+            return None
+        ranges.append((start, min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > max_ranges:
+        return None
+
+    # Coalesce overlapping or adjacent ranges so clients can't amplify reads
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class RangeFileResponse(Response):
+    """File response with Range/If-Range support and a zero-copy send path.
+
+    Single ranges are answered with 206 and Content-Range, multiple ranges
+    with multipart/byteranges. The body is read in large fixed-size chunks
+    off the event loop, or handed to the server with the ASGI
+    http.response.zerocopysend extension when the server advertises it.
+    """
+
+    def __init__(self, path: str, request_headers, media_type: Optional[str] = None):
+        self.path = path
+        self.media_type = media_type or "application/octet-stream"
+        self.background = None
+        self.chunk_size = settings.media_chunk_size
+
+        stat = os.stat(path)
+        self.file_size = stat.st_size
+        etag = f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+
+        self.ranges: List[ByteRange] = []
+        self.status_code = 200
+        self.boundary = None
+        range_header = request_headers.get("range")
+        if range_header and self._if_range_matches(request_headers.get("if-range"), etag, stat.st_mtime):
+            try:
+                self.ranges = parse_range_header(range_header, self.file_size) or []
+            except RangeNotSatisfiable:
+                self.status_code = 416
+
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified,
+        }
+        if self.status_code == 416:
+            headers["content-range"] = f"bytes */{self.file_size}"
+            headers["content-length"] = "0"
+        elif len(self.ranges) == 1:
+            start, end = self.ranges[0]
+            self.status_code = 206
+            headers["content-range"] = f"bytes {start}-{end}/{self.file_size}"
+            headers["content-length"] = str(end - start + 1)
+            headers["content-type"] = self.media_type
+        elif len(self.ranges) > 1:
+            self.status_code = 206
+            self.boundary = secrets.token_hex(16)
+            self.part_headers = [
+                (
+                    f"--{self.boundary}\r\n"
+                    f"Content-Type: {self.media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{self.file_size}\r\n\r\n"
+                ).encode("latin-1")
+                for start, end in self.ranges
+            ]
+            self.closing = f"--{self.boundary}--\r\n".encode("latin-1")
+            length = sum(len(h) + (end - start + 1) + 2 for h, (start, end) in zip(self.part_headers, self.ranges))
+            headers["content-type"] = f"multipart/byteranges; boundary={self.boundary}"
+            headers["content-length"] = str(length + len(self.closing))
+        else:
+            self.ranges = [(0, self.file_size - 1)] if self.file_size else []
+            headers["content-length"] = str(self.file_size)
+            headers["content-type"] = self.media_type
+
+        self.init_headers(headers)
+
+    @staticmethod
+    def _if_range_matches(if_range: Optional[str], etag: str, mtime: float) -> bool:
+        if not if_range:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith(('"', 'W/')):
+            # Weak validators never match for byte ranges
+            return if_range == etag
+        try:
+            return int(parsedate_to_datetime(if_range).timestamp()) == int(mtime)
+        except (TypeError, ValueError):
+            return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.status_code == 416 or not self.ranges or scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    return
+
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            zero_copy = "http.response.zerocopysend" in scope.get("extensions", {})
+            with open(self.path, "rb") as raw_file:
+                async with aiofiles.open(self.path, "rb") as file:
+                    for index, (start, end) in enumerate(self.ranges):
+                        if self.boundary:
+                            await send({"type": "http.response.body", "body": self.part_headers[index], "more_body": True})
+                        if zero_copy:
+                            await send({
+                                "type": "http.response.zerocopysend",
+                                "file": raw_file,
+                                "offset": start,
+                                "count": end - start + 1,
+                                "more_body": True,
+                            })
+                        elif not await self._send_chunks(file, start, end, send, disconnected):
+                            return
+                        if self.boundary:
+                            await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+                        if disconnected.is_set():
+                            return
+            await send({"type": "http.response.body", "body": self.closing if self.boundary else b""})
+        finally:
+            watcher.cancel()
+
+    async def _send_chunks(self, file, start: int, end: int, send: Send, disconnected: asyncio.Event) -> bool:
+        await file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            if disconnected.is_set():
+                return False
+            chunk = await file.read(min(self.chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        return True
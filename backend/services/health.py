@@ -0,0 +1,324 @@
+import asyncio
+import re
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+import httpx
+from sqlalchemy import or_, select, update
+
+from config import settings
+from database import SessionLocal
+from models import LiveTVChannel
+from services.facets import FacetDeltas, apply_facet_deltas
+from services.http_clients import http_clients
+from services.perf import ImportStats
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+PCR_HZ = 27_000_000
+
+BANDWIDTH_RE = re.compile(rb"BANDWIDTH=(\d+)")
+STREAM_CONTENT_TYPES = ("video/", "audio/", "application/octet-stream", "application/mp2t")
+
+# health_rank orders channels for sort=health: alive ones by latency, then
+# never probed ones, then failing ones by how many probes in a row they failed
+UNPROBED_RANK = 60000
+
+
+def health_rank(failures: int, latency_ms: Optional[int]) -> int:
+    if failures:
+        return UNPROBED_RANK * (1 + failures)
+    if latency_ms is None:
+        return UNPROBED_RANK
+    return min(latency_ms, UNPROBED_RANK - 1)
+
+
+def _ts_offset(data: bytes) -> Optional[int]:
+    """Offset of the first packet boundary, confirmed by the next two sync bytes"""
+    for offset in range(min(TS_PACKET_SIZE, len(data))):
+        if all(
+            data[i] == TS_SYNC_BYTE
+            for i in range(offset, min(offset + 3 * TS_PACKET_SIZE, len(data)), TS_PACKET_SIZE)
+        ):
+            return offset
+    return None
+
+
+def ts_bitrate(data: bytes) -> Optional[int]:
+    """Bits per second of an MPEG-TS sample, from the PCRs carried by one PID.
+
+    The bytes between two PCRs of the same PID were muxed to be sent in the
+    time between them, which measures the stream's bitrate rather than how
+    fast the provider happened to burst its buffer to us.
+    """
+    start = _ts_offset(data)
+    if start is None:
+        return None
+
+    first: Dict[int, tuple] = {}
+    span: Dict[int, tuple] = {}
+    for offset in range(start, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        if data[offset] != TS_SYNC_BYTE:
+            break
+        # Adaptation field present, long enough, with the PCR flag set
+        if not data[offset + 3] & 0x20 or data[offset + 4] < 7 or not data[offset + 5] & 0x10:
+            continue
+        pid = ((data[offset + 1] & 0x1F) << 8) | data[offset + 2]
+        b = data[offset + 6:offset + 12]
+        base = (b[0] << 25) | (b[1] << 17) | (b[2] << 9) | (b[3] << 1) | (b[4] >> 7)
+        pcr = base * 300 + (((b[4] & 0x01) << 8) | b[5])
+        if pid not in first:
+            first[pid] = (offset, pcr)
+        elif pcr > first[pid][1]:
+            span[pid] = (offset - first[pid][0], pcr - first[pid][1])
+
+    if not span:
+        return None
+    size, ticks = max(span.values(), key=lambda value: value[1])
+    return int(size * 8 * PCR_HZ / ticks)
+
+
+class HostLimiter:
+    """Caps concurrent probes and spaces out probe starts per upstream host"""
+
+    def __init__(self, concurrency: int, interval: float):
+        self.concurrency = concurrency
+        self.interval = interval
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.concurrency)
+        async with semaphore:
+            now = time.monotonic()
+            start = max(now, self._next_start.get(host, 0.0))
+            self._next_start[host] = start + self.interval
+            if start > now:
+                await asyncio.sleep(start - now)
+            yield
+
+
+async def probe_url(client: httpx.AsyncClient, url: str) -> dict:
+    """Fetch the first few KB of a stream (or its HLS manifest) and judge whether it is alive"""
+    # No retries: a failure counts towards the channel's failure streak instead
+    async with http_clients.host_slot(url):
+        started = time.perf_counter()
+        async with client.stream("GET", url) as response:
+            latency_ms = int((time.perf_counter() - started) * 1000)
+            response.raise_for_status()
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) >= settings.health_probe_bytes:
+                    break
+            content_type = response.headers.get("content-type", "").lower()
+
+    if body.lstrip().startswith(b"#EXTM3U"):
+        bandwidths = BANDWIDTH_RE.findall(body)
+        bitrate = max(int(value) for value in bandwidths) if bandwidths else None
+    elif _ts_offset(body) is not None:
+        bitrate = ts_bitrate(body)
+    elif body and content_type.startswith(STREAM_CONTENT_TYPES):
+        bitrate = None
+    else:
+        # Dead providers commonly answer 200 with an HTML error page or nothing
+        raise ValueError(f"Not a stream ({content_type or 'no content type'}, {len(body)} bytes)")
+
+    return {
+        "latency_ms": latency_ms,
+        "bitrate_kbps": bitrate // 1000 if bitrate else None,
+    }
+
+
+def _interleave_hosts(targets: Sequence[dict]) -> List[dict]:
+    """Round-robin targets across hosts.
+
+    Provider lists are usually grouped by host; probed in id order every
+    worker would queue on the first host's limiter while other hosts sit idle.
+    """
+    by_host: Dict[str, List[dict]] = {}
+    for target in targets:
+        by_host.setdefault(target["host"], []).append(target)
+    queues = [list(reversed(group)) for group in by_host.values()]
+    interleaved = []
+    while queues:
+        for group in queues:
+            interleaved.append(group.pop())
+        queues = [group for group in queues if group]
+    return interleaved
+
+
+def _load_targets(playlist_id: Optional[int], channel_ids: Optional[Iterable[int]]) -> List[dict]:
+    """Active channels, plus ones the prober deactivated (so they can come back)"""
+    query = select(
+        LiveTVChannel.id, LiveTVChannel.url, LiveTVChannel.is_active, LiveTVChannel.health_failures,
+    ).where(or_(
+        LiveTVChannel.is_active == True,
+        LiveTVChannel.health_failures >= settings.health_max_failures,
+    ))
+    if playlist_id is not None:
+        query = query.where(LiveTVChannel.playlist_id == playlist_id)
+    if channel_ids is not None:
+        query = query.where(LiveTVChannel.id.in_(list(channel_ids)))
+
+    db = SessionLocal()
+    try:
+        targets = []
+        for row in db.execute(query.order_by(LiveTVChannel.id)).mappings():
+            target = dict(row)
+            target["host"] = urlsplit(target["url"]).netloc.lower()
+            targets.append(target)
+        return targets
+    finally:
+        db.close()
+
+
+def _flip_active(db, ids: List[int], active: bool) -> int:
+    """Set is_active on those of `ids` not already in that state, keeping facet counts in step.
+
+    Conditional on the current value, so a playlist refresh that changed a
+    channel meanwhile can't make its facet counts drift.
+    """
+    if not ids:
+        return 0
+    condition = [LiveTVChannel.is_active == False] if active else [LiveTVChannel.is_active == True]
+    if active:
+        # Only revive channels the prober deactivated, not ones their playlist dropped
+        condition.append(LiveTVChannel.health_failures >= settings.health_max_failures)
+    rows = db.execute(
+        update(LiveTVChannel)
+        .where(LiveTVChannel.id.in_(ids), *condition)
+        .values(is_active=active)
+        .returning(LiveTVChannel.playlist_id, LiveTVChannel.category, LiveTVChannel.language, LiveTVChannel.country)
+        .execution_options(synchronize_session=False)
+    ).mappings().all()
+
+    deltas: Dict[int, FacetDeltas] = {}
+    for row in rows:
+        deltas.setdefault(row["playlist_id"], FacetDeltas()).add(row, 1 if active else -1)
+    for playlist_id, facets in deltas.items():
+        apply_facet_deltas(db, playlist_id, facets)
+    return len(rows)
+
+
+def store_results(results: List[dict]) -> Dict[str, int]:
+    """Write a batch of probe results, flipping is_active where the failure streak says so"""
+    now = datetime.now(timezone.utc)
+    updates = []
+    revive = []
+    deactivate = []
+    for result in results:
+        if result["alive"]:
+            updates.append({
+                "id": result["id"],
+                "health_checked_at": now,
+                "last_alive_at": now,
+                "latency_ms": result["latency_ms"],
+                "bitrate_kbps": result["bitrate_kbps"],
+                "health_failures": 0,
+                "health_rank": health_rank(0, result["latency_ms"]),
+            })
+            if not result["is_active"]:
+                revive.append(result["id"])
+        else:
+            failures = result["health_failures"] + 1
+            updates.append({
+                "id": result["id"],
+                "health_checked_at": now,
+                "health_failures": failures,
+                "health_rank": health_rank(failures, None),
+            })
+            if result["is_active"] and failures >= settings.health_max_failures:
+                deactivate.append(result["id"])
+
+    db = SessionLocal()
+    try:
+        # Flips first: reviving checks the failure count the batch is about to reset
+        revived = _flip_active(db, revive, True)
+        deactivated = _flip_active(db, deactivate, False)
+        by_columns: Dict[tuple, List[dict]] = {}
+        for values in updates:
+            by_columns.setdefault(tuple(sorted(values)), []).append(values)
+        for group in by_columns.values():
+            db.execute(update(LiveTVChannel), group)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    return {"revived": revived, "deactivated": deactivated}
+
+
+async def check_channels(
+    playlist_id: Optional[int] = None,
+    channel_ids: Optional[Iterable[int]] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+    client: Optional[httpx.AsyncClient] = None,
+) -> dict:
+    """Probe channel streams with bounded concurrency and record their health.
+
+    A fixed pool of workers takes targets interleaved by host, each probe
+    holding a per-host slot. Results are written in batches from a worker
+    thread while probing continues. `client` defaults to the shared probe pool.
+    """
+    stats = ImportStats()
+    targets = await asyncio.to_thread(_load_targets, playlist_id, channel_ids)
+    queue = _interleave_hosts(targets)
+    queue.reverse()  # popped from the end
+    limiter = HostLimiter(settings.health_per_host_concurrency, settings.health_per_host_interval)
+    totals = {"alive": 0, "failed": 0, "revived": 0, "deactivated": 0}
+    pending: List[dict] = []
+    write_lock = asyncio.Lock()
+
+    async def flush():
+        nonlocal pending
+        batch, pending = pending, []
+        if batch:
+            async with write_lock:
+                for key, count in (await asyncio.to_thread(store_results, batch)).items():
+                    totals[key] += count
+
+    async def worker():
+        while queue:
+            target = queue.pop()
+            result = dict(target, alive=False)
+            try:
+                async with limiter.slot(target["host"]):
+                    result.update(await asyncio.wait_for(probe_url(client, target["url"]), settings.health_timeout))
+                result["alive"] = True
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+            totals["alive" if result["alive"] else "failed"] += 1
+            pending.append(result)
+            stats.rows += 1
+            if progress:
+                progress(stats.rows, len(targets))
+            if len(pending) >= settings.health_batch_size:
+                await flush()
+
+    client = client or http_clients.client("probe")
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, min(settings.health_concurrency, len(targets))))))
+    finally:
+        await flush()
+
+    stats.finish()
+    result = stats.as_dict()
+    result["channels"] = result.pop("rows")
+    result["channels_per_sec"] = result.pop("rows_per_sec")
+    result["hosts"] = len({target["host"] for target in targets})
+    result.update(totals)
+    print(
+        f"Probed {result['channels']} channels on {result['hosts']} hosts in {result['elapsed_seconds']:.0f}s: "
+        f"{result['alive']} alive, {result['failed']} failed, "
+        f"{result['deactivated']} deactivated, {result['revived']} revived"
+    )
+    return result
@@ -0,0 +1,328 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import re
+import shutil
+import socket
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlencode, urljoin, urlsplit
+
+from config import settings
+from services.http_clients import http_clients
+
+URI_ATTR_RE = re.compile(r'URI="([^"]+)"')
+
+# Tags whose URI attribute names another playlist rather than media data
+PLAYLIST_URI_TAGS = ("#EXT-X-MEDIA:", "#EXT-X-I-FRAME-STREAM-INF:", "#EXT-X-RENDITION-REPORT:")
+
+CachedObject = Tuple[bytes, str]  # (body, content type)
+
+
+def _signature(channel_id: int, kind: str, encoded_url: str, expires: int) -> str:
+    message = f"{channel_id}:{kind}:{encoded_url}:{expires}".encode("utf-8")
+    return hmac.new(settings.jwt_secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def sign_upstream_url(channel_id: int, kind: str, url: str) -> dict:
+    """Query parameters that let a player fetch an upstream URL through the proxy.
+
+    Players can't attach bearer tokens to segment requests, so each rewritten
+    URI carries an expiring HMAC instead.
+    """
+    encoded = base64.urlsafe_b64encode(url.encode("utf-8")).decode("ascii").rstrip("=")
+    expires = int(time.time()) + settings.hls_url_ttl
+    return {"u": encoded, "exp": expires, "sig": _signature(channel_id, kind, encoded, expires)}
+
+
+def verify_upstream_url(channel_id: int, kind: str, encoded: str, expires: int, signature: str) -> Optional[str]:
+    """Return the upstream URL if the signature is valid and unexpired"""
+    if expires < time.time():
+        return None
+    expected = _signature(channel_id, kind, encoded, expires)
+    if not hmac.compare_digest(expected, signature):
+        return None
+    padding = "=" * (-len(encoded) % 4)
+    return base64.urlsafe_b64decode(encoded + padding).decode("utf-8")
+
+
+def _is_playlist_uri(uri: str) -> bool:
+    return urlsplit(uri).path.lower().endswith((".m3u8", ".m3u"))
+
+
+def rewrite_manifest(
+    text: str,
+    base_url: str,
+    channel_id: int,
+    playlist_path: str,
+    segment_path: str,
+) -> str:
+    """Point every URI in an HLS playlist back at this server.
+
+    Relative URIs are resolved against the URL the manifest was actually
+    served from. Variant and rendition playlists go to playlist_path, media
+    segments, init sections and keys to segment_path.
+    """
+    is_master = "#EXT-X-STREAM-INF" in text
+
+    def proxied(uri: str, as_playlist: bool) -> str:
+        absolute = urljoin(base_url, uri.strip())
+        kind = "playlist" if as_playlist else "segment"
+        path = playlist_path if as_playlist else segment_path
+        return f"{path}?{urlencode(sign_upstream_url(channel_id, kind, absolute))}"
+
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            lines.append(line)
+        elif stripped.startswith("#"):
+            if 'URI="' in stripped:
+                as_playlist = stripped.startswith(PLAYLIST_URI_TAGS)
+                stripped = URI_ATTR_RE.sub(
+                    lambda match: f'URI="{proxied(match.group(1), as_playlist)}"', stripped
+                )
+            lines.append(stripped)
+        else:
+            lines.append(proxied(stripped, is_master or _is_playlist_uri(stripped)))
+    return "\n".join(lines) + "\n"
+
+
+def _pid_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _worker_cache_dir(base: str) -> str:
+    """This process's own, empty directory under the configured cache dir.
+
+    The disk index lives in memory, so files from an earlier run would sit
+    outside the budget, and uvicorn workers sharing one directory would each
+    count only their own. Each worker gets a subdirectory, emptied here;
+    those of workers on this host that have exited are removed.
+    """
+    host = socket.gethostname()
+    own = os.path.join(base, f"{host}-{os.getpid()}")
+    os.makedirs(base, exist_ok=True)
+    for entry in os.scandir(base):
+        if entry.is_dir(follow_symlinks=False):
+            prefix, _, pid = entry.name.rpartition("-")
+            if entry.path == own or (prefix == host and pid.isdigit() and not _pid_running(int(pid))):
+                shutil.rmtree(entry.path, ignore_errors=True)
+        elif re.fullmatch(r"[0-9a-f]{64}", entry.name):
+            # Segments from before the cache used per-worker directories
+            os.remove(entry.path)
+    os.makedirs(own)
+    return own
+
+
+class SegmentCache:
+    """Size-bounded LRU of upstream objects with request coalescing.
+
+    Objects live in memory and, when a cache directory is configured, spill to
+    disk under a second byte budget. Concurrent misses for the same URL share
+    one upstream fetch.
+    """
+
+    def __init__(self, memory_bytes: int, disk_dir: Optional[str] = None, disk_bytes: int = 0):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = _worker_cache_dir(disk_dir) if disk_dir else None
+        self.disk_bytes = disk_bytes
+        self._memory: "OrderedDict[str, CachedObject]" = OrderedDict()
+        self._memory_used = 0
+        self._disk: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()  # key -> (size, content type)
+        self._disk_used = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    async def _remember(self, key: str, value: CachedObject):
+        size = len(value[0])
+        # Don't let one oversized object flush the whole cache
+        if size > self.memory_bytes // 4:
+            return
+        if key in self._memory:
+            self._memory_used -= len(self._memory.pop(key)[0])
+        self._memory[key] = value
+        self._memory_used += size
+        evicted = []
+        while self._memory_used > self.memory_bytes:
+            evicted_key, evicted_value = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted_value[0])
+            evicted.append((evicted_key, evicted_value))
+        if evicted and self.disk_dir:
+            await self._spill(evicted)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key)
+
+    async def _spill(self, items):
+        items = [(key, value) for key, value in items if len(value[0]) <= self.disk_bytes // 4]
+        if not items:
+            return
+        # File I/O in a thread; an entry is indexed only once its file is complete
+        for key, value in await asyncio.to_thread(self._write_files, items):
+            if key in self._disk:
+                self._disk_used -= self._disk.pop(key)[0]
+            self._disk[key] = (len(value[0]), value[1])
+            self._disk_used += len(value[0])
+        removed = []
+        while self._disk_used > self.disk_bytes:
+            evicted_key, (size, _) = self._disk.popitem(last=False)
+            self._disk_used -= size
+            removed.append(evicted_key)
+        if removed:
+            await asyncio.to_thread(self._remove_files, removed)
+
+    def _write_files(self, items) -> list:
+        written = []
+        for key, value in items:
+            try:
+                with open(self._disk_path(key), "wb") as f:
+                    f.write(value[0])
+            except OSError as e:
+                print(f"Error writing HLS cache file: {e}")
+                continue
+            written.append((key, value))
+        return written
+
+    def _remove_files(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def _take_file(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                body = f.read()
+            os.remove(self._disk_path(key))
+        except OSError:
+            return None
+        return body
+
+    async def _read_disk(self, key: str) -> Optional[CachedObject]:
+        entry = self._disk.pop(key, None)
+        if entry is None:
+            return None
+        self._disk_used -= entry[0]
+        body = await asyncio.to_thread(self._take_file, key)
+        return (body, entry[1]) if body is not None else None
+
+    async def get(self, url: str, fetch: Callable[[str], Awaitable[CachedObject]]) -> CachedObject:
+        key = self._key(url)
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return value
+
+        # Disk reads join the in-flight map too, so concurrent requests wait for one read
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._read_disk(key) if self.disk_dir else None
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                value = await fetch(url)
+            await self._remember(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure doesn't log a warning
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory_bytes": self._memory_used,
+            "memory_items": len(self._memory),
+            "disk_bytes": self._disk_used,
+            "disk_items": len(self._disk),
+        }
+
+
+class ManifestCache:
+    """Very short-lived manifest cache so N viewers polling a live playlist cost one fetch"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, Tuple[str, str]]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def get(self, url: str, fetch: Callable[[str], Awaitable[Tuple[str, str]]]) -> Tuple[str, str]:
+        entry = self._entries.get(url)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        pending = self._inflight.get(url)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[url] = future
+        try:
+            value = await fetch(url)
+            # Drop expired entries opportunistically so the dict stays small
+            self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+            self._entries[url] = (time.monotonic() + self.ttl, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._inflight[url]
+
+
+async def fetch_manifest(url: str) -> Tuple[str, str]:
+    """Fetch a playlist, returning its text and the final URL after redirects"""
+    response = await http_clients.request("GET", url, profile="segment")
+    response.raise_for_status()
+    return response.text, str(response.url)
+
+
+async def fetch_segment(url: str) -> CachedObject:
+    response = await http_clients.request("GET", url, profile="segment")
+    response.raise_for_status()
+    return response.content, response.headers.get("content-type", "video/mp2t")
+
+
+# The disk budget covers the whole node, so it is split between the uvicorn workers
+segment_cache = SegmentCache(
+    settings.hls_cache_memory_bytes,
+    settings.hls_cache_dir,
+    settings.hls_cache_disk_bytes // max(1, int(os.environ.get("WEB_CONCURRENCY") or 1)),
+)
+manifest_cache = ManifestCache(settings.hls_manifest_ttl)
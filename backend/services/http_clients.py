@@ -0,0 +1,215 @@
+import asyncio
+import importlib.util
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import settings
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# One pool per kind of traffic, so long-lived streams can't starve API calls
+# of connections. Timeouts: (connect, read) seconds.
+PROFILES = {
+    "api": {"connect": 10.0, "read": 120.0, "max_connections": 50},  # Xtream API, XMLTV downloads
+    "stream": {"connect": 10.0, "read": 30.0, "max_connections": 1000},  # relayed live streams
+    "segment": {"connect": 5.0, "read": 20.0, "max_connections": 200},  # HLS manifests and segments
+    "probe": {"connect": 5.0, "read": settings.health_timeout, "max_connections": settings.health_concurrency},
+}
+
+
+class HostStats:
+    """Connection slot usage for one upstream host"""
+
+    __slots__ = ("limit", "active", "waiting", "peak", "requests", "retries", "errors", "waited_seconds")
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self.peak = 0
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.waited_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "peak": self.peak,
+            "saturation": round(self.active / self.limit, 3) if self.limit else None,
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
+
+
+class HTTPClientRegistry:
+    """Application-wide upstream HTTP clients.
+
+    Keeps connections (and their TLS sessions) alive across requests, and
+    caps concurrent connections per upstream host across every pool:
+    IPTV providers count streams, API calls and probes against the same
+    per-account connection limit and ban clients that go over it.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self._hosts: Dict[str, HostStats] = {}
+        self.http2 = settings.upstream_http2 and importlib.util.find_spec("h2") is not None
+
+    async def start(self):
+        for profile in PROFILES:
+            self.client(profile)
+
+    async def close(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def client(self, profile: str) -> httpx.AsyncClient:
+        client = self._clients.get(profile)
+        if client is None:
+            options = PROFILES[profile]
+            client = self._clients[profile] = httpx.AsyncClient(
+                http2=self.http2,
+                follow_redirects=True,
+                timeout=httpx.Timeout(
+                    options["read"],
+                    connect=options["connect"],
+                    pool=settings.upstream_slot_timeout,
+                ),
+                limits=httpx.Limits(
+                    max_connections=options["max_connections"],
+                    max_keepalive_connections=min(options["max_connections"], 100),
+                    keepalive_expiry=settings.upstream_keepalive_expiry,
+                ),
+            )
+        return client
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return urlsplit(url).netloc.lower()
+
+    def _host_limit(self, host: str) -> int:
+        return settings.upstream_host_limits.get(host, settings.upstream_host_limit)
+
+    def _stats(self, host: str) -> HostStats:
+        stats = self._hosts.get(host)
+        if stats is None:
+            stats = self._hosts[host] = HostStats(self._host_limit(host))
+        return stats
+
+    @asynccontextmanager
+    async def host_slot(self, url: str) -> AsyncIterator[HostStats]:
+        """Hold one of the host's connection slots, waiting up to upstream_slot_timeout for it"""
+        host = self.host_of(url)
+        semaphore = self._slots.get(host)
+        if semaphore is None:
+            semaphore = self._slots[host] = asyncio.Semaphore(self._host_limit(host))
+        stats = self._stats(host)
+
+        stats.waiting += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), settings.upstream_slot_timeout)
+        except asyncio.TimeoutError:
+            stats.errors += 1
+            raise httpx.PoolTimeout(f"All {stats.limit} connection slots for {host} are in use")
+        finally:
+            stats.waiting -= 1
+            stats.waited_seconds += time.monotonic() - started
+
+        stats.active += 1
+        stats.peak = max(stats.peak, stats.active)
+        try:
+            yield stats
+        finally:
+            stats.active -= 1
+            semaphore.release()
+
+    @staticmethod
+    def _backoff(attempt: int, response: Optional[httpx.Response] = None) -> float:
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), settings.upstream_retry_max_delay)
+        delay = settings.upstream_retry_backoff * (2 ** attempt)
+        return min(delay, settings.upstream_retry_max_delay) * random.uniform(0.5, 1.0)
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        method: str,
+        url: str,
+        profile: str = "stream",
+        retries: Optional[int] = None,
+        **kwargs,
+    ) -> AsyncIterator[httpx.Response]:
+        """Open a streamed response, holding a host slot until the block exits.
+
+        Connection failures and retryable statuses are retried with
+        exponential backoff, but only before the body is handed over.
+        """
+        retries = settings.upstream_retries if retries is None else retries
+        client = self.client(profile)
+        async with self.host_slot(url) as stats:
+            attempt = 0
+            while True:
+                stats.requests += 1
+                try:
+                    response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+                except httpx.TransportError:
+                    if attempt >= retries:
+                        stats.errors += 1
+                        raise
+                    response = None
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                        break
+                    await response.aclose()
+                stats.retries += 1
+                await asyncio.sleep(self._backoff(attempt, response))
+                attempt += 1
+
+            try:
+                yield response
+            finally:
+                await response.aclose()
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        profile: str = "api",
+        retries: Optional[int] = None,
+        **kwargs,
+    ) -> httpx.Response:
+        """A complete (body read) request, with the same slot and retry handling as stream()"""
+        async with self.stream(method, url, profile, retries, **kwargs) as response:
+            await response.aread()
+            return response
+
+    def stats(self) -> dict:
+        return {
+            "http2": self.http2,
+            "default_host_limit": settings.upstream_host_limit,
+            "pools": {
+                profile: {"max_connections": options["max_connections"], "open": profile in self._clients}
+                for profile, options in PROFILES.items()
+            },
+            "hosts": {
+                host: stats.as_dict()
+                for host, stats in sorted(self._hosts.items(), key=lambda item: -item[1].active)
+            },
+        }
+
+
+http_clients = HTTPClientRegistry()
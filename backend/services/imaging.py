@@ -0,0 +1,60 @@
+"""Image work run in the thumbnail process pool.
+
+Kept free of application imports: pool workers import only this module.
+"""
+import io
+import subprocess
+from typing import Optional, Tuple
+
+from PIL import Image, ImageOps
+
+# Refuse sources that would decode to more than this (decompression bombs)
+MAX_SOURCE_PIXELS = 64_000_000
+
+Image.MAX_IMAGE_PIXELS = MAX_SOURCE_PIXELS
+
+
+def _encode_webp(image: Image.Image, quality: int) -> bytes:
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+    out = io.BytesIO()
+    image.save(out, "WEBP", quality=quality, method=4)
+    return out.getvalue()
+
+
+def resize_image(data: bytes, box: Tuple[int, int], crop: bool, quality: int) -> bytes:
+    """Scale an image into `box` as WebP.
+
+    `crop` fills the box exactly (center crop, for media thumbnails);
+    otherwise the whole image is fitted inside it and never enlarged (logos).
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG can decode at 1/2, 1/4 or 1/8 scale, far cheaper than decoding then shrinking
+        image.draft("RGB", (box[0] * 2, box[1] * 2))
+        image = ImageOps.exif_transpose(image)
+        if crop:
+            image = ImageOps.fit(image, box, Image.LANCZOS)
+        else:
+            image.thumbnail(box, Image.LANCZOS)
+        return _encode_webp(image, quality)
+
+
+def video_frame(
+    path: str, at: float, box: Tuple[int, int], quality: int, ffmpeg: str = "ffmpeg", timeout: float = 30.0
+) -> Optional[bytes]:
+    """Grab one frame with ffmpeg (already scaled down to cover `box`) and crop it to WebP"""
+    scale = f"scale={box[0]}:{box[1]}:force_original_aspect_ratio=increase"
+    for offset in (at, 0.0) if at else (0.0,):
+        # -ss before -i seeks by keyframe index instead of decoding up to the offset
+        result = subprocess.run(
+            [
+                ffmpeg, "-nostdin", "-loglevel", "error", "-ss", f"{offset:.3f}", "-i", path,
+                "-frames:v", "1", "-vf", scale, "-f", "image2pipe", "-vcodec", "png", "-",
+            ],
+            capture_output=True,
+            timeout=timeout,
+        )
+        # Seeking past the end of a short video yields no frame; retry from the start
+        if result.returncode == 0 and result.stdout:
+            return resize_image(result.stdout, box, True, quality)
+    return None
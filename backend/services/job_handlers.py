@@ -0,0 +1,114 @@
+"""Job types run by the background job manager.
+
+Importing this module registers them; main.py does so before starting the
+manager.
+"""
+import asyncio
+import os
+
+from config import settings
+from services.cache import CHANNELS, EPG, MEDIA, response_cache
+from services.health import check_channels
+from services.jobs import job_manager
+from services.media_probe import probe_media_library
+from services.playlist_import import import_m3u_playlist, import_xtream_playlist, refresh_playlist
+from services.scanner import scan_media_library
+from services.xmltv import download_xmltv, import_xmltv_file
+
+
+async def run_media_scan(ctx):
+    def on_batch(progress):
+        ctx.progress(progress.files_matched, message=f"{progress.directories} directories scanned")
+
+    result = await asyncio.to_thread(scan_media_library, on_batch=on_batch)
+    await response_cache.bump(MEDIA)
+    # Probe what the scan added or changed
+    result["probe"] = await asyncio.to_thread(probe_media_library, progress=ctx.progress)
+    if result["probe"]["files"]:
+        await response_cache.bump(MEDIA)
+    return result
+
+
+async def run_media_probe(ctx):
+    params = ctx.params
+    result = await asyncio.to_thread(
+        probe_media_library, params.get("media_ids"), params.get("force", False), ctx.progress
+    )
+    if result["files"]:
+        await response_cache.bump(MEDIA)
+    return result
+
+
+async def run_playlist_import(ctx):
+    result = await asyncio.to_thread(
+        import_m3u_playlist, ctx.params["playlist_id"], ctx.params["file_path"], ctx.progress
+    )
+    await response_cache.bump(CHANNELS)
+    return result
+
+
+async def run_xtream_import(ctx):
+    params = ctx.params
+    result = await import_xtream_playlist(
+        params["playlist_id"], params["url"], params["username"], params["password"], ctx.progress
+    )
+    await response_cache.bump(CHANNELS)
+    return result
+
+
+async def run_playlist_refresh(ctx):
+    result = await refresh_playlist(ctx.params["playlist_id"], ctx.params.get("force", False), ctx.progress)
+    if not result.get("skipped"):
+        await response_cache.bump(CHANNELS)
+    return result
+
+
+async def run_epg_import(ctx):
+    params = ctx.params
+    if params.get("url"):
+        # Downloaded afresh by every attempt
+        file_path = await download_xmltv(params["url"])
+        downloaded = True
+    else:
+        file_path = params["file_path"]
+        downloaded = False
+    remove_after = downloaded or params.get("remove_after", False)
+    try:
+        result = await asyncio.to_thread(import_xmltv_file, file_path, None, ctx.progress)
+        await response_cache.bump(EPG)
+    except BaseException as e:
+        # An upload exists only once; keep it while a retry may still need it
+        if remove_after and (downloaded or ctx.ends_job(e)):
+            _remove(file_path)
+        raise
+    if remove_after:
+        _remove(file_path)
+    return result
+
+
+def _remove(file_path: str):
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+async def run_channel_health(ctx):
+    params = ctx.params
+    result = await check_channels(
+        params.get("playlist_id"),
+        params.get("channel_ids"),
+        lambda done, total: ctx.progress(done, total),
+    )
+    # Health ranks changed even when nothing was (de)activated
+    if result["channels"]:
+        await response_cache.bump(CHANNELS)
+    return result
+
+
+job_manager.register("media_scan", run_media_scan, concurrency=1)
+job_manager.register("media_probe", run_media_probe, concurrency=1)
+job_manager.register("playlist_import", run_playlist_import, concurrency=1, max_retries=1)
+job_manager.register("xtream_import", run_xtream_import, concurrency=1, max_retries=3)
+job_manager.register("playlist_refresh", run_playlist_refresh, concurrency=1, max_retries=3)
+job_manager.register("epg_import", run_epg_import, concurrency=1, max_retries=2)
+job_manager.register("channel_health", run_channel_health, concurrency=1)
+job_manager.schedule("channel_health", settings.health_check_interval_minutes * 60)
@@ -0,0 +1,642 @@
+import asyncio
+import json
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from config import settings
+from services.cluster import WORKER_ID, acquire_lease
+from services.redis_pool import get_redis
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# A consumer slot not renewed for this long belongs to a dead worker
+SLOT_TTL = 30.0
+# Seconds a job must stay orphaned before it is recovered
+ORPHAN_GRACE = 5.0
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    FIELDS = [
+        "id", "type", "params", "status", "progress", "total", "message",
+        "result", "error", "attempts", "max_retries", "cancel_requested",
+        "worker", "created_at", "started_at", "finished_at",
+    ]
+
+    def __init__(self, **values):
+        for field in self.FIELDS:
+            setattr(self, field, values.get(field))
+        self.params = self.params or {}
+        self.progress = self.progress or 0
+        self.attempts = self.attempts or 0
+        self.max_retries = self.max_retries or 0
+        self.cancel_requested = bool(self.cancel_requested)
+
+    def to_json(self) -> str:
+        return json.dumps({field: getattr(self, field) for field in self.FIELDS}, default=str)
+
+    @classmethod
+    def from_json(cls, data) -> "Job":
+        return cls(**json.loads(data))
+
+    def as_dict(self) -> dict:
+        result = {field: getattr(self, field) for field in self.FIELDS}
+        if self.started_at:
+            end = self.finished_at or time.time()
+            result["duration_seconds"] = round(end - self.started_at, 3)
+        else:
+            result["duration_seconds"] = None
+        for field in ("created_at", "started_at", "finished_at"):
+            if result[field]:
+                result[field] = datetime.utcfromtimestamp(result[field]).isoformat() + "Z"
+        return result
+
+
+class JobContext:
+    """Handed to job handlers to report progress and observe cancellation.
+
+    Safe to call from the worker thread that runs a synchronous handler.
+    """
+
+    def __init__(self, manager: "JobManager", job: Job, loop: asyncio.AbstractEventLoop):
+        self.manager = manager
+        self.job = job
+        self.loop = loop
+        self._last_saved = 0.0
+        self._save_lock = asyncio.Lock()
+
+    async def save(self):
+        # Serialized so a late progress write can't overwrite the final state
+        async with self._save_lock:
+            await self.manager.backend.save(self.job)
+
+    @property
+    def params(self) -> dict:
+        return self.job.params
+
+    @property
+    def cancelled(self) -> bool:
+        return self.job.cancel_requested or self.manager.stopping
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+    def ends_job(self, error: BaseException) -> bool:
+        """Whether the job is over if this attempt ends with `error`.
+
+        False when it will run again: a retry, or queued again because the
+        manager is shutting down. Follows the decision JobManager._run makes.
+        """
+        if isinstance(error, (JobCancelled, asyncio.CancelledError)):
+            return not self.manager.stopping or self.job.cancel_requested
+        return self.job.attempts > self.job.max_retries or self.job.cancel_requested
+
+    def progress(self, done: int, total: Optional[int] = None, message: Optional[str] = None):
+        """Record progress and raise JobCancelled if cancellation was requested"""
+        self.job.progress = done
+        if total is not None:
+            self.job.total = total
+        if message is not None:
+            self.job.message = message
+
+        # Throttle persistence; progress may be reported thousands of times a second
+        now = time.monotonic()
+        if now - self._last_saved >= 0.5:
+            self._last_saved = now
+            save = self.save()
+            try:
+                asyncio.get_running_loop()
+                asyncio.ensure_future(save)
+            except RuntimeError:
+                asyncio.run_coroutine_threadsafe(save, self.loop)
+        self.check_cancelled()
+
+
+class JobType:
+    def __init__(self, name: str, handler: Callable, concurrency: int, max_retries: int, retry_backoff: float):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.is_async = asyncio.iscoroutinefunction(handler)
+
+
+class MemoryJobBackend:
+    """Job state and queues held in this process"""
+
+    name = "memory"
+
+    def __init__(self):
+        self.jobs: Dict[str, str] = {}
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.delayed: Dict[str, Dict[str, float]] = {}  # job type -> {job id: due time}
+        self.pending = set()
+        self.cancelled = set()
+
+    def _queue(self, job_type: str) -> asyncio.Queue:
+        if job_type not in self.queues:
+            self.queues[job_type] = asyncio.Queue()
+        return self.queues[job_type]
+
+    async def save(self, job: Job):
+        self.jobs[job.id] = job.to_json()
+        # Keep the history bounded
+        while len(self.jobs) > settings.job_history_limit:
+            oldest = next(iter(self.jobs))
+            del self.jobs[oldest]
+            self.cancelled.discard(oldest)
+
+    async def load(self, job_id: str) -> Optional[Job]:
+        data = self.jobs.get(job_id)
+        return Job.from_json(data) if data else None
+
+    async def list(self, limit: int) -> List[Job]:
+        return [Job.from_json(data) for data in reversed(list(self.jobs.values())[-limit:])]
+
+    async def active(self) -> List[Job]:
+        jobs = [Job.from_json(data) for data in self.jobs.values()]
+        return [job for job in jobs if job.status not in FINISHED_STATES]
+
+    async def push(self, job: Job):
+        self.pending.add(job.id)
+        self._queue(job.type).put_nowait(job.id)
+
+    async def pop(self, job_type: str, timeout: float) -> Optional[str]:
+        try:
+            job_id = await asyncio.wait_for(self._queue(job_type).get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.pending.discard(job_id)
+        return job_id
+
+    async def push_delayed(self, job: Job, due: float):
+        self.pending.add(job.id)
+        self.delayed.setdefault(job.type, {})[job.id] = due
+
+    async def promote_due(self, job_type: str) -> int:
+        delayed = self.delayed.get(job_type, {})
+        now = time.time()
+        due = [job_id for job_id, at in delayed.items() if at <= now]
+        for job_id in due:
+            del delayed[job_id]
+            self._queue(job_type).put_nowait(job_id)
+        return len(due)
+
+    async def is_pending(self, job: Job) -> bool:
+        return job.id in self.pending
+
+    async def queue_depth(self, job_type: str) -> int:
+        return self._queue(job_type).qsize()
+
+    async def request_cancel(self, job_id: str):
+        self.cancelled.add(job_id)
+
+    async def is_cancel_requested(self, job_id: str) -> bool:
+        return job_id in self.cancelled
+
+    # A single process: its own consumers already bound concurrency, and
+    # nothing else can hold a lock
+    async def acquire_slot(self, job_type: str, limit: int, holder: str) -> bool:
+        return True
+
+    async def release_slot(self, job_type: str, holder: str):
+        pass
+
+    async def holds_slot(self, job_type: str, holder: str) -> bool:
+        # Jobs this process is running are in JobManager.running; any other
+        # running job was left by a previous start
+        return False
+
+    async def try_lock(self, name: str, ttl: float) -> bool:
+        return True
+
+
+# Holders whose score (expiry time) has passed are dropped, then a holder
+# renews its slot or takes a free one
+_ACQUIRE_SLOT = """
+redis.call('zremrangebyscore', KEYS[1], '-inf', ARGV[1])
+if redis.call('zscore', KEYS[1], ARGV[3]) or redis.call('zcard', KEYS[1]) < tonumber(ARGV[4]) then
+    redis.call('zadd', KEYS[1], ARGV[2], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+# Moves the retries that are due onto the queue; atomic, so with several
+# workers promoting each job is queued once
+_PROMOTE_DUE = """
+local due = redis.call('zrangebyscore', KEYS[1], '-inf', ARGV[1])
+for _, job_id in ipairs(due) do
+    redis.call('zrem', KEYS[1], job_id)
+    redis.call('rpush', KEYS[2], job_id)
+end
+return #due
+"""
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisJobBackend:
+    """Job state and queues shared through Redis, so any worker can run or report a job"""
+
+    name = "redis"
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def save(self, job: Job):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(f"jobs:{job.id}", job.to_json(), ex=settings.job_ttl_seconds)
+        pipe.zadd("jobs:index", {job.id: job.created_at})
+        # Unfinished jobs, for recovering the ones a dead worker left behind
+        if job.status in FINISHED_STATES:
+            pipe.srem("jobs:active", job.id)
+        else:
+            pipe.sadd("jobs:active", job.id)
+        await pipe.execute()
+
+    async def load(self, job_id: str) -> Optional[Job]:
+        data = await self.redis.get(f"jobs:{job_id}")
+        return Job.from_json(data) if data else None
+
+    async def list(self, limit: int) -> List[Job]:
+        ids = await self.redis.zrevrange("jobs:index", 0, limit - 1)
+        if not ids:
+            return []
+        ids = [_text(i) for i in ids]
+        values = await self.redis.mget([f"jobs:{job_id}" for job_id in ids])
+        expired = [job_id for job_id, value in zip(ids, values) if value is None]
+        if expired:
+            await self.redis.zrem("jobs:index", *expired)
+        return [Job.from_json(value) for value in values if value]
+
+    async def active(self) -> List[Job]:
+        ids = [_text(i) for i in await self.redis.smembers("jobs:active")]
+        if not ids:
+            return []
+        values = await self.redis.mget([f"jobs:{job_id}" for job_id in ids])
+        expired = [job_id for job_id, value in zip(ids, values) if value is None]
+        if expired:
+            await self.redis.srem("jobs:active", *expired)
+        return [Job.from_json(value) for value in values if value]
+
+    async def push(self, job: Job):
+        await self.redis.rpush(f"jobs:queue:{job.type}", job.id)
+
+    async def pop(self, job_type: str, timeout: float) -> Optional[str]:
+        item = await self.redis.blpop([f"jobs:queue:{job_type}"], timeout=max(1, int(timeout)))
+        if not item:
+            return None
+        return _text(item[1])
+
+    async def push_delayed(self, job: Job, due: float):
+        await self.redis.zadd(f"jobs:delayed:{job.type}", {job.id: due})
+
+    async def promote_due(self, job_type: str) -> int:
+        return await self.redis.eval(_PROMOTE_DUE, 2, f"jobs:delayed:{job_type}", f"jobs:queue:{job_type}", time.time())
+
+    async def is_pending(self, job: Job) -> bool:
+        if await self.redis.zscore(f"jobs:delayed:{job.type}", job.id) is not None:
+            return True
+        return await self.redis.lpos(f"jobs:queue:{job.type}", job.id) is not None
+
+    async def queue_depth(self, job_type: str) -> int:
+        return await self.redis.llen(f"jobs:queue:{job_type}")
+
+    async def request_cancel(self, job_id: str):
+        await self.redis.set(f"jobs:{job_id}:cancel", 1, ex=settings.job_ttl_seconds)
+
+    async def is_cancel_requested(self, job_id: str) -> bool:
+        return bool(await self.redis.exists(f"jobs:{job_id}:cancel"))
+
+    async def acquire_slot(self, job_type: str, limit: int, holder: str) -> bool:
+        """Take or renew one of `limit` consumer slots for a job type, shared by every worker"""
+        now = time.time()
+        return bool(await self.redis.eval(_ACQUIRE_SLOT, 1, f"jobs:slots:{job_type}", now, now + SLOT_TTL, holder, limit))
+
+    async def release_slot(self, job_type: str, holder: str):
+        await self.redis.zrem(f"jobs:slots:{job_type}", holder)
+
+    async def holds_slot(self, job_type: str, holder: str) -> bool:
+        expires = await self.redis.zscore(f"jobs:slots:{job_type}", holder)
+        return expires is not None and expires > time.time()
+
+    async def try_lock(self, name: str, ttl: float) -> bool:
+        return await acquire_lease(self.redis, f"jobs:lock:{name}", ttl)
+
+
+class JobManager:
+    """Runs registered job types on a bounded pool of workers.
+
+    Each job type gets its own queue and its own number of consumers, so a
+    long playlist import can't occupy the slots that scans or EPG ingests
+    need. Synchronous handlers run on a thread pool, never on the event loop.
+
+    With the Redis backend a type's concurrency holds across all workers:
+    a consumer only pops jobs while it holds one of the type's slots, and
+    schedules fire on one worker per interval.
+
+    Retries wait in the backend until due rather than in timers, and jobs
+    a dead worker was running (or had popped) are queued again once its
+    slot lapses, so a restart or crash doesn't strand them.
+    """
+
+    def __init__(self):
+        self.types: Dict[str, JobType] = {}
+        self.schedules: List[tuple] = []  # (job type, interval seconds, params)
+        self.backend = MemoryJobBackend()
+        self.running: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._started = False
+        self.stopping = False
+
+    def register(
+        self,
+        name: str,
+        handler: Callable,
+        concurrency: int = 1,
+        max_retries: int = 0,
+        retry_backoff: float = 5.0,
+    ):
+        concurrency = settings.job_concurrency.get(name, concurrency)
+        self.types[name] = JobType(name, handler, concurrency, max_retries, retry_backoff)
+
+    def schedule(self, name: str, interval: float, params: Optional[dict] = None):
+        """Enqueue a job type every `interval` seconds while the manager runs"""
+        if interval > 0:
+            self.schedules.append((name, interval, params))
+
+    async def start(self):
+        if self._started:
+            return
+        self._started = True
+        self.stopping = False
+        if settings.job_backend != "memory":
+            redis = await get_redis()
+            if redis is not None:
+                self.backend = RedisJobBackend(redis)
+            elif settings.job_backend == "redis":
+                raise RuntimeError("job_backend is 'redis' but Redis is unavailable")
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, sum(t.concurrency for t in self.types.values())),
+            thread_name_prefix="job",
+        )
+        for job_type in self.types.values():
+            for slot in range(job_type.concurrency):
+                self._tasks.append(asyncio.create_task(self._worker(job_type, f"{WORKER_ID}:{slot}")))
+        self._tasks.append(asyncio.create_task(self._watch_cancellations()))
+        self._tasks.append(asyncio.create_task(self._promote_retries()))
+        self._tasks.append(asyncio.create_task(self._recover_orphans()))
+        for name, interval, params in self.schedules:
+            self._tasks.append(asyncio.create_task(self._run_schedule(name, interval, params)))
+
+    async def stop(self):
+        # Running jobs are interrupted and queued again, not cancelled; the
+        # flag also stops synchronous handlers at their next progress report
+        self.stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._started = False
+
+    async def enqueue(self, job_type: str, params: Optional[dict] = None) -> Job:
+        if job_type not in self.types:
+            raise ValueError(f"Unknown job type: {job_type}")
+        job = Job(
+            id=uuid.uuid4().hex,
+            type=job_type,
+            params=params or {},
+            status=QUEUED,
+            max_retries=self.types[job_type].max_retries,
+            created_at=time.time(),
+        )
+        await self.backend.save(job)
+        await self.backend.push(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return self.running.get(job_id) or await self.backend.load(job_id)
+
+    async def list(self, limit: int = 100) -> List[Job]:
+        jobs = await self.backend.list(limit)
+        return [self.running.get(job.id, job) for job in jobs]
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        job = await self.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+        # The flag lives apart from the job record so progress writes by the
+        # worker running the job (possibly another process) can't clobber it
+        await self.backend.request_cancel(job_id)
+        job.cancel_requested = True
+        if job.status == QUEUED:
+            # Still sitting in a queue; the worker that pops it will skip it
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            await self.backend.save(job)
+        return job
+
+    async def queue_depths(self) -> Dict[str, int]:
+        return {name: await self.backend.queue_depth(name) for name in self.types}
+
+    async def _watch_cancellations(self):
+        # Cancellation may be requested through another worker process; pick it up
+        while True:
+            await asyncio.sleep(1.0)
+            for job in list(self.running.values()):
+                try:
+                    if await self.backend.is_cancel_requested(job.id):
+                        job.cancel_requested = True
+                except Exception:
+                    continue
+
+    async def _run_schedule(self, name: str, interval: float, params: Optional[dict]):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Every worker runs this loop; the lock lets one of them enqueue per interval
+                if not await self.backend.try_lock(f"schedule:{name}", interval * 0.9):
+                    continue
+                # Skip a beat rather than pile up runs when the last one is still going
+                busy = any(job.type == name for job in self.running.values())
+                if not busy and await self.backend.queue_depth(name) == 0:
+                    await self.enqueue(name, params)
+            except Exception as e:
+                print(f"Error scheduling {name} job: {e}")
+
+    async def _worker(self, job_type: JobType, holder: str):
+        try:
+            while True:
+                try:
+                    if not await self.backend.acquire_slot(job_type.name, job_type.concurrency, holder):
+                        # Other workers hold every slot for this type
+                        await asyncio.sleep(1.0)
+                        continue
+                    job_id = await self.backend.pop(job_type.name, timeout=5.0)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Job queue error for {job_type.name}: {e}")
+                    await asyncio.sleep(1.0)
+                    continue
+                if job_id is None:
+                    continue
+
+                job = await self.backend.load(job_id)
+                # Anything but queued was cancelled, or was queued twice by recovery and has already run
+                if job is None or job.status != QUEUED or await self.backend.is_cancel_requested(job_id):
+                    continue
+                heartbeat = asyncio.create_task(self._keep_slot(job_type, holder))
+                try:
+                    await self._run(job_type, job, holder)
+                finally:
+                    heartbeat.cancel()
+        finally:
+            try:
+                await asyncio.shield(self.backend.release_slot(job_type.name, holder))
+            except Exception:
+                pass
+
+    async def _keep_slot(self, job_type: JobType, holder: str):
+        # Long jobs outlive SLOT_TTL; renew so no other worker starts one alongside
+        while True:
+            await asyncio.sleep(SLOT_TTL / 3)
+            try:
+                await self.backend.acquire_slot(job_type.name, job_type.concurrency, holder)
+            except Exception as e:
+                print(f"Error renewing {job_type.name} job slot: {e}")
+
+    async def _run(self, job_type: JobType, job: Job, holder: str):
+        loop = asyncio.get_running_loop()
+        ctx = JobContext(self, job, loop)
+        job.status = RUNNING
+        job.attempts += 1
+        job.worker = holder
+        job.started_at = time.time()
+        job.finished_at = None
+        job.error = None
+        self.running[job.id] = job
+        await ctx.save()
+        retry_at = None
+
+        try:
+            if job_type.is_async:
+                result = await job_type.handler(ctx)
+            else:
+                result = await loop.run_in_executor(self._executor, job_type.handler, ctx)
+            job.status = SUCCEEDED
+            job.result = result
+        except (JobCancelled, asyncio.CancelledError) as e:
+            if self.stopping and not job.cancel_requested:
+                # Shut down mid-run: not the job's fault, so the attempt doesn't count
+                job.status = QUEUED
+                job.attempts -= 1
+                job.message = "Interrupted by shutdown, queued again"
+                retry_at = time.time()
+            else:
+                job.status = CANCELLED
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            print(f"Job {job.id} ({job.type}) failed: {job.error}\n{traceback.format_exc()}")
+            if job.attempts <= job.max_retries and not job.cancel_requested:
+                job.status = QUEUED
+                delay = job_type.retry_backoff * (2 ** (job.attempts - 1))
+                job.message = f"Retrying in {delay:.0f}s"
+                retry_at = time.time() + delay
+            else:
+                job.status = FAILED
+        finally:
+            self.running.pop(job.id, None)
+            if job.status != QUEUED:
+                job.finished_at = time.time()
+            await asyncio.shield(ctx.save())
+            if retry_at is not None:
+                # Saved as queued first; a crash in between leaves it to _recover
+                await asyncio.shield(self.backend.push_delayed(job, retry_at))
+
+    async def _promote_retries(self):
+        while True:
+            await asyncio.sleep(1.0)
+            for name in self.types:
+                try:
+                    await self.backend.promote_due(name)
+                except Exception as e:
+                    print(f"Error queueing {name} job retries: {e}")
+
+    async def _recover_orphans(self):
+        # First at startup, then whenever the slots of a worker that died
+        # without restarting may have lapsed
+        while True:
+            try:
+                if await self.backend.try_lock("recover", SLOT_TTL * 0.9):
+                    await self._recover()
+            except Exception as e:
+                print(f"Error recovering jobs: {e}")
+            await asyncio.sleep(SLOT_TTL)
+
+    async def _is_orphan(self, job: Job) -> bool:
+        if job.id in self.running or job.type not in self.types or job.status in FINISHED_STATES:
+            return False
+        if job.worker and await self.backend.holds_slot(job.type, job.worker):
+            return False
+        return job.status == RUNNING or not await self.backend.is_pending(job)
+
+    async def _recover(self):
+        """Queue again the jobs whose worker is gone.
+
+        A running job is orphaned once the slot of the worker running it
+        lapses. A queued one is orphaned when it is in no queue and the
+        worker that last ran it is gone (or it never ran): it was popped,
+        or saved for a retry, by a worker that died before going further.
+        """
+        candidates = [job.id for job in await self.backend.active() if await self._is_orphan(job)]
+        if not candidates:
+            return
+        # A live worker leaves a job in no queue for a moment, between popping
+        # it and marking it running; only jobs still orphaned later are lost
+        await asyncio.sleep(ORPHAN_GRACE)
+        for job_id in candidates:
+            job = await self.backend.load(job_id)
+            if job is None or not await self._is_orphan(job):
+                continue
+            if job.cancel_requested or await self.backend.is_cancel_requested(job.id):
+                job.status = CANCELLED
+                job.finished_at = time.time()
+            elif job.status == RUNNING and job.attempts > job.max_retries + 1:
+                # Every attempt has taken a worker down with it (or run out of retries)
+                job.status = FAILED
+                job.error = job.error or "The worker running the job stopped"
+                job.finished_at = time.time()
+            else:
+                if job.status == RUNNING:
+                    job.message = "The worker running the job stopped, queued again"
+                job.status = QUEUED
+            await self.backend.save(job)
+            if job.status == QUEUED:
+                await self.backend.push(job)
+                print(f"Requeued job {job.id} ({job.type}) left by {job.worker or 'a stopped worker'}")
+
+job_manager = JobManager()
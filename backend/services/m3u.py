@@ -0,0 +1,99 @@
+import hashlib
+import re
+from typing import Dict, Iterable, Iterator, Optional
+
+EXTINF_ATTR_RE = re.compile(r'([A-Za-z0-9_-]+)\s*=\s*"([^"]*)"')
+
+
+def parse_extinf(line: str) -> Dict[str, Optional[str]]:
+    """Parse an #EXTINF line into its attributes and display name"""
+    header = line[len("#EXTINF:"):]
+
+    # The display name follows the first comma that is not inside a quoted attribute
+    in_quotes = False
+    split_at = -1
+    for index, char in enumerate(header):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ',' and not in_quotes:
+            split_at = index
+            break
+
+    if split_at == -1:
+        attrs_part, name = header, ""
+    else:
+        attrs_part, name = header[:split_at], header[split_at + 1:]
+
+    attrs = {key.lower(): value.strip() for key, value in EXTINF_ATTR_RE.findall(attrs_part)}
+    name = name.strip() or attrs.get("tvg-name") or "Unknown"
+
+    return {
+        "name": name,
+        "tvg_id": attrs.get("tvg-id") or None,
+        "logo_url": attrs.get("tvg-logo") or None,
+        "category": attrs.get("group-title") or None,
+        "language": attrs.get("tvg-language") or None,
+        "country": attrs.get("tvg-country") or None,
+    }
+
+
+def iter_m3u(lines: Iterable[str]) -> Iterator[Dict[str, Optional[str]]]:
+    """Yield one channel dict per stream entry, consuming lines lazily"""
+    current = None
+    group = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXTINF:'):
+            current = parse_extinf(line)
+            group = None
+        elif line.startswith('#EXTGRP:'):
+            group = line[len('#EXTGRP:'):].strip() or None
+        elif line.startswith('#'):
+            continue
+        elif current is not None:
+            current["url"] = line
+            if not current["category"]:
+                current["category"] = group or "General"
+            yield current
+            current = None
+            group = None
+
+
+def iter_m3u_file(file_path: str) -> Iterator[Dict[str, Optional[str]]]:
+    """Stream channel entries from an M3U file on disk"""
+    with open(file_path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        yield from iter_m3u(f)
+
+
+def channel_identity(entry: dict) -> str:
+    """Stable key used to match a playlist entry against an existing channel"""
+    if entry.get("tvg_id"):
+        return f"tvg:{entry['tvg_id']}"
+    digest = hashlib.sha1(f"{entry['name']}\0{entry['url']}".encode("utf-8")).hexdigest()
+    return f"url:{digest}"
+
+
+def with_identities(entries: Iterable[dict]) -> Iterator[dict]:
+    """Attach an identity to each entry, disambiguating repeats in playlist order.
+
+    Providers often list the same tvg-id several times (HD/SD/backup feeds), so
+    the second and later occurrences get an ordinal suffix.
+    """
+    seen: Dict[str, int] = {}
+    for entry in entries:
+        identity = channel_identity(entry)
+        occurrence = seen.get(identity, 0)
+        seen[identity] = occurrence + 1
+        entry["identity"] = identity if occurrence == 0 else f"{identity}#{occurrence}"
+        yield entry
+
+
+def file_content_hash(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,140 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import Callable, Iterable, List, Optional
+
+from sqlalchemy import bindparam, select, update
+
+from config import settings
+from database import SessionLocal
+from models import Media
+from services import mediainfo
+from services.perf import ImportStats
+
+PROBE_COLUMNS = ("duration", "container", "video_codec", "audio_codec", "width", "height", "bitrate_kbps")
+
+# Only written while the row still describes the file that was probed: a
+# rescan that saw the file change in the meantime has reset probed_at and
+# the next probe run picks it up again
+_store = (
+    update(Media)
+    .where(
+        Media.id == bindparam("_id"),
+        Media.file_size == bindparam("_size"),
+        Media.file_mtime == bindparam("_mtime"),
+    )
+    .values({column: bindparam(column) for column in PROBE_COLUMNS + ("probed_at",)})
+)
+
+
+def _pending(db, after_id: int, limit: int, media_ids: Optional[List[int]], force: bool) -> list:
+    query = select(Media.id, Media.file_path, Media.file_size, Media.file_mtime).where(Media.id > after_id)
+    if not force:
+        query = query.where(Media.probed_at.is_(None))
+    if media_ids is not None:
+        query = query.where(Media.id.in_(media_ids))
+    return db.execute(query.order_by(Media.id).limit(limit)).all()
+
+
+def probe_media_library(
+    media_ids: Optional[Iterable[int]] = None,
+    force: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+    workers: Optional[int] = None,
+    batch_size: Optional[int] = None,
+) -> dict:
+    """Read duration, codecs, resolution and bitrate for media that hasn't been probed.
+
+    A probe result holds for the (path, size, mtime) it was taken at: the
+    scanner clears probed_at when a file changes, so a rerun only touches
+    new and changed files. Files are probed in a process pool with a
+    bounded number in flight, and results are written in batches.
+    """
+    workers = workers or settings.media_probe_workers
+    batch_size = batch_size or settings.media_probe_batch_size
+    media_ids = list(media_ids) if media_ids is not None else None
+    stats = ImportStats()
+    totals = {"probed": 0, "failed": 0, "changed": 0}
+    ffprobe = settings.ffprobe_path or None
+
+    db = SessionLocal()
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        results = []
+
+        def flush():
+            if results:
+                # Core executemany: ORM bulk updates only match on the primary key
+                db.connection().execute(_store, results)
+                db.commit()
+                results.clear()
+
+        def collect(future, row):
+            now = datetime.now(timezone.utc)
+            try:
+                info = future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                print(f"Error probing {row.file_path}: {e}")
+                totals["failed"] += 1
+                # Recorded as probed so a broken file isn't retried until it changes
+                info = dict.fromkeys(PROBE_COLUMNS)
+            else:
+                if (info["file_size"], info["file_mtime"]) != (row.file_size, row.file_mtime):
+                    totals["changed"] += 1  # the next scan will see the new version
+                    return
+                totals["probed"] += 1
+            results.append({
+                "_id": row.id,
+                "_size": row.file_size,
+                "_mtime": row.file_mtime,
+                "probed_at": now,
+                **{column: info[column] for column in PROBE_COLUMNS},
+            })
+            if len(results) >= batch_size:
+                flush()
+
+        after_id = 0
+        in_flight = {}
+        while True:
+            rows = _pending(db, after_id, batch_size, media_ids, force)
+            for row in rows:
+                path = os.path.join(settings.media_path, row.file_path)
+                in_flight[executor.submit(mediainfo.probe_file, path, ffprobe, settings.media_probe_timeout)] = row
+                # Bounded: enough queued to keep every worker busy, no more
+                while len(in_flight) >= workers * 4:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future, in_flight.pop(future))
+                        stats.rows += 1
+                if progress:
+                    progress(stats.rows, None)
+            if len(rows) < batch_size:
+                break
+            after_id = rows[-1].id
+
+        for future in list(in_flight):
+            collect(future, in_flight.pop(future))
+            stats.rows += 1
+        flush()
+    except Exception as e:
+        db.rollback()
+        print(f"Error probing media library: {e}")
+        raise
+    finally:
+        executor.shutdown(cancel_futures=True)
+        db.close()
+
+    stats.finish()
+    result = stats.as_dict()
+    result["files"] = result.pop("rows")
+    result["files_per_sec"] = result.pop("rows_per_sec")
+    result.update(totals)
+    print(
+        f"Probed {result['files']} media files in {result['elapsed_seconds']:.1f}s "
+        f"({result['files_per_sec']:.1f} files/sec): {result['failed']} failed"
+    )
+    return result
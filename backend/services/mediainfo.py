@@ -0,0 +1,455 @@
+"""Container header probing, run in the media probe process pool.
+
+Uses ffprobe when it is installed and falls back to reading MP4, Matroska
+(MKV/WebM), MP3 and FLAC headers directly. Kept free of application
+imports: pool workers import only this module.
+"""
+import json
+import os
+import shutil
+import struct
+import subprocess
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+# ISO BMFF sample entry / Matroska CodecID -> ffprobe codec names
+MP4_CODECS = {
+    b"avc1": "h264", b"avc3": "h264", b"hvc1": "hevc", b"hev1": "hevc", b"av01": "av1",
+    b"vp09": "vp9", b"mp4v": "mpeg4", b"mp4a": "aac", b"ac-3": "ac3", b"ec-3": "eac3",
+    b"Opus": "opus", b"fLaC": "flac", b".mp3": "mp3", b"alac": "alac",
+}
+MATROSKA_CODECS = {
+    "V_MPEG4/ISO/AVC": "h264", "V_MPEGH/ISO/HEVC": "hevc", "V_AV1": "av1", "V_VP8": "vp8",
+    "V_VP9": "vp9", "V_MPEG2": "mpeg2video", "V_MPEG4/ISO/ASP": "mpeg4", "A_AAC": "aac",
+    "A_AC3": "ac3", "A_EAC3": "eac3", "A_DTS": "dts", "A_OPUS": "opus", "A_VORBIS": "vorbis",
+    "A_FLAC": "flac", "A_MPEG/L3": "mp3", "A_TRUEHD": "truehd",
+}
+
+MP4_TOP_LEVEL = (b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot")
+EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+
+# Matroska element ids
+SEGMENT, SEEK_HEAD, SEEK, SEEK_ID, SEEK_POSITION = 0x18538067, 0x114D9B74, 0x4DBB, 0x53AB, 0x53AC
+INFO, TIMECODE_SCALE, DURATION = 0x1549A966, 0x2AD7B1, 0x4489
+TRACKS, TRACK_ENTRY, TRACK_TYPE, CODEC_ID = 0x1654AE6B, 0xAE, 0x83, 0x86
+VIDEO, PIXEL_WIDTH, PIXEL_HEIGHT = 0xE0, 0xB0, 0xBA
+CLUSTER, DOC_TYPE = 0x1F43B675, 0x4282
+
+MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = (44100, 48000, 32000)
+
+# How far past the ID3 tag to look for the first MP3 frame
+MP3_SYNC_WINDOW = 64 * 1024
+
+
+def _info(container: str, duration: Optional[float] = None) -> dict:
+    return {
+        "container": container,
+        "duration": duration,
+        "video_codec": None,
+        "audio_codec": None,
+        "width": None,
+        "height": None,
+        "bitrate_kbps": None,
+    }
+
+
+def _read_exact(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) < size:
+        raise ValueError("Unexpected end of file")
+    return data
+
+
+# -- MP4 / MOV ---------------------------------------------------------------
+
+def _mp4_boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """(type, payload start, payload end) of the boxes between start and end"""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", _read_exact(f, 8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", _read_exact(f, 8))[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise ValueError(f"Bad MP4 box size at {pos}")
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _mp4_child(f: BinaryIO, start: int, end: int, *path: bytes) -> Optional[Tuple[int, int]]:
+    for kind, payload, stop in _mp4_boxes(f, start, end):
+        if kind == path[0]:
+            return (payload, stop) if len(path) == 1 else _mp4_child(f, payload, stop, *path[1:])
+    return None
+
+
+def _mp4_track(f: BinaryIO, start: int, end: int, info: dict):
+    hdlr = _mp4_child(f, start, end, b"mdia", b"hdlr")
+    stsd = _mp4_child(f, start, end, b"mdia", b"minf", b"stbl", b"stsd")
+    if not hdlr or not stsd:
+        return
+    f.seek(hdlr[0] + 8)
+    handler = f.read(4)
+    # stsd: version/flags, entry count, then the first sample entry's size and format
+    f.seek(stsd[0] + 12)
+    codec = MP4_CODECS.get(f.read(4))
+
+    if handler == b"vide" and info["video_codec"] is None:
+        info["video_codec"] = codec
+        tkhd = _mp4_child(f, start, end, b"tkhd")
+        if tkhd:
+            f.seek(tkhd[0])
+            version = f.read(1)[0]
+            # Width and height are 16.16 fixed point at the end of the header
+            f.seek(tkhd[0] + (88 if version == 1 else 76))
+            width, height = struct.unpack(">II", _read_exact(f, 8))
+            info["width"], info["height"] = width >> 16 or None, height >> 16 or None
+    elif handler == b"soun" and info["audio_codec"] is None:
+        info["audio_codec"] = codec
+
+
+def probe_mp4(f: BinaryIO, size: int) -> dict:
+    info = _info("mp4")
+    ftyp = _mp4_child(f, 0, size, b"ftyp")
+    if ftyp:
+        f.seek(ftyp[0])
+        if f.read(4) == b"qt  ":
+            info["container"] = "mov"
+
+    # Walking top-level box headers seeks past mdat, so moov at the end of the file is cheap to reach
+    moov = _mp4_child(f, 0, size, b"moov")
+    if not moov:
+        raise ValueError("MP4 without a moov box")
+    for kind, payload, stop in _mp4_boxes(f, *moov):
+        if kind == b"mvhd":
+            f.seek(payload)
+            version = f.read(1)[0]
+            if version == 1:
+                f.seek(payload + 20)
+                timescale, duration = struct.unpack(">IQ", _read_exact(f, 12))
+            else:
+                f.seek(payload + 12)
+                timescale, duration = struct.unpack(">II", _read_exact(f, 8))
+            if timescale:
+                info["duration"] = duration / timescale
+        elif kind == b"trak":
+            _mp4_track(f, payload, stop, info)
+    return info
+
+
+# -- Matroska / WebM ---------------------------------------------------------
+
+def _ebml_vint(f: BinaryIO, keep_marker: bool) -> Tuple[Optional[int], int]:
+    """An EBML variable-length integer: (value, encoded length); None for an unknown size"""
+    first = _read_exact(f, 1)[0]
+    length = 1
+    mask = 0x80
+    while not first & mask:
+        mask >>= 1
+        length += 1
+        if length > 8:
+            raise ValueError("Bad EBML integer")
+    value = first if keep_marker else first & (mask - 1)
+    for byte in _read_exact(f, length - 1):
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return None, length
+    return value, length
+
+
+def _ebml_elements(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+    """(id, payload start, payload end) of the elements between start and end"""
+    pos = start
+    while pos < end:
+        f.seek(pos)
+        element_id, id_length = _ebml_vint(f, keep_marker=True)
+        size, size_length = _ebml_vint(f, keep_marker=False)
+        payload = pos + id_length + size_length
+        # Unknown sizes (live recordings) run to the end of the parent
+        stop = end if size is None else min(payload + size, end)
+        yield element_id, payload, stop
+        pos = stop
+
+
+def _ebml_uint(f: BinaryIO, start: int, end: int) -> int:
+    f.seek(start)
+    return int.from_bytes(f.read(end - start), "big")
+
+
+def _ebml_float(f: BinaryIO, start: int, end: int) -> Optional[float]:
+    f.seek(start)
+    data = f.read(end - start)
+    if len(data) == 4:
+        return struct.unpack(">f", data)[0]
+    if len(data) == 8:
+        return struct.unpack(">d", data)[0]
+    return None
+
+
+def _ebml_string(f: BinaryIO, start: int, end: int) -> str:
+    f.seek(start)
+    return f.read(end - start).rstrip(b"\x00").decode("ascii", "replace")
+
+
+def _matroska_info(f: BinaryIO, start: int, end: int, info: dict):
+    scale = 1_000_000
+    duration = None
+    for element_id, payload, stop in _ebml_elements(f, start, end):
+        if element_id == TIMECODE_SCALE:
+            scale = _ebml_uint(f, payload, stop)
+        elif element_id == DURATION:
+            duration = _ebml_float(f, payload, stop)
+    if duration:
+        info["duration"] = duration * scale / 1e9
+
+
+def _matroska_tracks(f: BinaryIO, start: int, end: int, info: dict):
+    for element_id, payload, stop in _ebml_elements(f, start, end):
+        if element_id != TRACK_ENTRY:
+            continue
+        track_type, codec, video = None, None, None
+        for child_id, child, child_stop in _ebml_elements(f, payload, stop):
+            if child_id == TRACK_TYPE:
+                track_type = _ebml_uint(f, child, child_stop)
+            elif child_id == CODEC_ID:
+                codec_id = _ebml_string(f, child, child_stop)
+                # A_AAC/MPEG4/LC and friends
+                codec = MATROSKA_CODECS.get(codec_id) or MATROSKA_CODECS.get(codec_id.split("/")[0])
+            elif child_id == VIDEO:
+                video = (child, child_stop)
+
+        if track_type == 1 and info["video_codec"] is None:
+            info["video_codec"] = codec
+            if video:
+                for child_id, child, child_stop in _ebml_elements(f, *video):
+                    if child_id == PIXEL_WIDTH:
+                        info["width"] = _ebml_uint(f, child, child_stop)
+                    elif child_id == PIXEL_HEIGHT:
+                        info["height"] = _ebml_uint(f, child, child_stop)
+        elif track_type == 2 and info["audio_codec"] is None:
+            info["audio_codec"] = codec
+
+
+def probe_matroska(f: BinaryIO, size: int) -> dict:
+    info = _info("matroska")
+    segment = None
+    for element_id, payload, stop in _ebml_elements(f, 0, size):
+        if element_id == 0x1A45DFA3:
+            for child_id, child, child_stop in _ebml_elements(f, payload, stop):
+                if child_id == DOC_TYPE and _ebml_string(f, child, child_stop) == "webm":
+                    info["container"] = "webm"
+        elif element_id == SEGMENT:
+            segment = (payload, stop)
+            break
+    if segment is None:
+        raise ValueError("Matroska file without a segment")
+
+    # Info and Tracks normally precede the first cluster; when a muxer put
+    # them after it, the seek head says where they are
+    found = {}
+    seeks = {}
+    for element_id, payload, stop in _ebml_elements(f, *segment):
+        if element_id in (INFO, TRACKS):
+            found[element_id] = (payload, stop)
+        elif element_id == SEEK_HEAD:
+            for seek_element, seek, seek_stop in _ebml_elements(f, payload, stop):
+                if seek_element != SEEK:
+                    continue
+                target = position = None
+                for child_id, child, child_stop in _ebml_elements(f, seek, seek_stop):
+                    if child_id == SEEK_ID:
+                        target = _ebml_uint(f, child, child_stop)
+                    elif child_id == SEEK_POSITION:
+                        position = _ebml_uint(f, child, child_stop)
+                if target in (INFO, TRACKS) and position is not None:
+                    seeks[target] = segment[0] + position
+        elif element_id == CLUSTER or len(found) == 2:
+            break
+
+    for target, position in seeks.items():
+        if target not in found:
+            element_id, payload, stop = next(_ebml_elements(f, position, segment[1]))
+            if element_id == target:
+                found[target] = (payload, stop)
+
+    if INFO in found:
+        _matroska_info(f, *found[INFO], info)
+    if TRACKS in found:
+        _matroska_tracks(f, *found[TRACKS], info)
+    return info
+
+
+# -- MP3 / FLAC --------------------------------------------------------------
+
+def _id3_end(f: BinaryIO) -> int:
+    """Offset just past a leading ID3v2 tag, 0 when there is none"""
+    f.seek(0)
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    # Syncsafe: 7 bits per byte
+    size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    return 10 + size + (10 if header[5] & 0x10 else 0)
+
+
+def _mp3_header(data: bytes, i: int) -> Optional[dict]:
+    if i + 4 > len(data) or data[i] != 0xFF or data[i + 1] & 0xE0 != 0xE0:
+        return None
+    version_bits = (data[i + 1] >> 3) & 3  # 3: MPEG-1, 2: MPEG-2, 0: MPEG-2.5
+    layer_bits = (data[i + 1] >> 1) & 3  # 1: layer III
+    bitrate_index = data[i + 2] >> 4
+    rate_index = (data[i + 2] >> 2) & 3
+    if version_bits == 1 or layer_bits != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version_bits == 3
+    bitrate = MP3_BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[rate_index] >> (0 if mpeg1 else 1 if version_bits == 2 else 2)
+    padding = (data[i + 2] >> 1) & 1
+    return {
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "samples": 1152 if mpeg1 else 576,
+        "length": (144 if mpeg1 else 72) * bitrate // sample_rate + padding,
+        # Side information size, after which a Xing/Info header would sit
+        "side_info": (32 if mpeg1 else 17) if data[i + 3] >> 6 != 3 else (17 if mpeg1 else 9),
+    }
+
+
+def probe_mp3(f: BinaryIO, size: int) -> dict:
+    start = _id3_end(f)
+    f.seek(start)
+    data = f.read(MP3_SYNC_WINDOW)
+    for i in range(len(data) - 4):
+        header = _mp3_header(data, i)
+        # A real frame is followed by another one; stray 0xFF bytes in tag padding aren't
+        if header and (i + header["length"] + 4 > len(data) or _mp3_header(data, i + header["length"])):
+            break
+    else:
+        raise ValueError("No MP3 frame found")
+
+    info = _info("mp3")
+    info["audio_codec"] = "mp3"
+    audio_bytes = size - start - i
+
+    # VBR files carry the frame count in a Xing/Info (or VBRI) header in the first frame
+    frames = None
+    xing = i + 4 + header["side_info"]
+    if data[xing:xing + 4] in (b"Xing", b"Info") and struct.unpack(">I", data[xing + 4:xing + 8])[0] & 1:
+        frames = struct.unpack(">I", data[xing + 8:xing + 12])[0]
+    elif data[i + 36:i + 40] == b"VBRI":
+        frames = struct.unpack(">I", data[i + 50:i + 54])[0]
+
+    if frames:
+        info["duration"] = frames * header["samples"] / header["sample_rate"]
+    else:
+        info["duration"] = audio_bytes * 8 / header["bitrate"]
+        info["bitrate_kbps"] = header["bitrate"] // 1000
+    return info
+
+
+def probe_flac(f: BinaryIO, size: int) -> dict:
+    f.seek(_id3_end(f))
+    if f.read(4) != b"fLaC":
+        raise ValueError("Not a FLAC file")
+    header = _read_exact(f, 4)
+    if header[0] & 0x7F != 0:
+        raise ValueError("FLAC without a STREAMINFO block")
+    streaminfo = _read_exact(f, 34)
+    # 20 bits sample rate, 3 bits channels, 5 bits sample size, 36 bits total samples
+    packed = int.from_bytes(streaminfo[10:18], "big")
+    sample_rate = packed >> 44
+    samples = packed & ((1 << 36) - 1)
+
+    info = _info("flac", samples / sample_rate if sample_rate and samples else None)
+    info["audio_codec"] = "flac"
+    return info
+
+
+# -- Entry points ------------------------------------------------------------
+
+def probe_headers(path: str) -> dict:
+    """Read duration and codecs from the container headers, without ffprobe"""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(12)
+        if head[:4] == EBML_MAGIC:
+            info = probe_matroska(f, size)
+        elif head[4:8] in MP4_TOP_LEVEL:
+            info = probe_mp4(f, size)
+        else:
+            f.seek(_id3_end(f))
+            info = probe_flac(f, size) if f.read(4) == b"fLaC" else probe_mp3(f, size)
+
+    if info["bitrate_kbps"] is None and info["duration"]:
+        info["bitrate_kbps"] = int(size * 8 / info["duration"] / 1000)
+    return info
+
+
+def _ffprobe_container(format_name: str, path: str) -> str:
+    names = format_name.split(",")
+    extension = os.path.splitext(path)[1].lower()
+    if "matroska" in names:
+        return "webm" if extension == ".webm" else "matroska"
+    if "mov" in names:
+        return "mov" if extension == ".mov" else "mp4"
+    return names[0]
+
+
+def probe_ffprobe(path: str, ffprobe: str, timeout: float) -> dict:
+    result = subprocess.run(
+        [ffprobe, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+        capture_output=True,
+        timeout=timeout,
+        check=True,
+    )
+    data = json.loads(result.stdout)
+    fmt = data.get("format") or {}
+    info = _info(_ffprobe_container(fmt.get("format_name", ""), path))
+    if fmt.get("duration"):
+        info["duration"] = float(fmt["duration"])
+    if fmt.get("bit_rate"):
+        info["bitrate_kbps"] = int(fmt["bit_rate"]) // 1000
+
+    for stream in data.get("streams") or []:
+        # Cover art is reported as a one-frame video stream
+        if (stream.get("disposition") or {}).get("attached_pic"):
+            continue
+        if stream.get("codec_type") == "video" and info["video_codec"] is None:
+            info["video_codec"] = stream.get("codec_name")
+            info["width"] = stream.get("width")
+            info["height"] = stream.get("height")
+        elif stream.get("codec_type") == "audio" and info["audio_codec"] is None:
+            info["audio_codec"] = stream.get("codec_name")
+    return info
+
+
+def probe_file(path: str, ffprobe: Optional[str], timeout: float) -> dict:
+    """Media info for one file, plus the (size, mtime) it describes.
+
+    ffprobe understands every container but costs a process per file; when
+    it is missing or fails, the header parser handles the common formats.
+    """
+    stat = os.stat(path)
+    info = None
+    ffprobe = ffprobe and shutil.which(ffprobe)
+    if ffprobe:
+        try:
+            info = probe_ffprobe(path, ffprobe, timeout)
+        except (subprocess.SubprocessError, ValueError, OSError):
+            info = None
+    if info is None:
+        try:
+            info = probe_headers(path)
+        except (ValueError, IndexError, struct.error) as e:
+            raise ValueError(f"Unreadable media headers: {e}") from None
+
+    info["file_size"] = stat.st_size
+    info["file_mtime"] = stat.st_mtime
+    return info
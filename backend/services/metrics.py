@@ -0,0 +1,382 @@
+import asyncio
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+
+from config import settings
+
+LATENCY_BUCKETS = (0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Set for the server when uvicorn runs several workers (the start scripts
+# do this): each worker then writes its values to files in that directory,
+# and a scrape served by any worker reads them all
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# Requests that matched no route share one label, so scanners probing
+# random paths can't create a time series per path
+UNMATCHED = "unmatched"
+
+REQUEST_LATENCY = Histogram(
+    "livetv_http_request_duration_seconds",
+    "Time until the response headers are sent, per route",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter("livetv_http_requests", "Completed requests", ["method", "route", "status"])
+REQUEST_DB_QUERIES = Histogram(
+    "livetv_http_request_db_queries",
+    "Database queries issued while handling a request",
+    ["route"],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_SECONDS = Histogram(
+    "livetv_http_request_db_seconds",
+    "Database time spent while handling a request",
+    ["route"],
+    buckets=QUERY_BUCKETS,
+)
+QUERY_LATENCY = Histogram(
+    "livetv_db_query_duration_seconds",
+    "Database statement execution time",
+    ["engine"],
+    buckets=QUERY_BUCKETS,
+)
+
+
+class _RequestDB:
+    """Query count and time of one request, accumulated by the engine hooks"""
+
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# Set by the middleware for the duration of a request. Sync handlers run in
+# threads with a copy of the context, so they update the same object.
+_request_db: ContextVar[Optional[_RequestDB]] = ContextVar("request_db", default=None)
+
+
+class MetricsMiddleware:
+    """Records latency, status and database use per route.
+
+    Plain ASGI rather than BaseHTTPMiddleware, which would buffer streamed
+    responses through an extra task. Latency is measured to the response
+    headers: a relayed channel or media download would otherwise record
+    the length of the stream. Database use is recorded when the response
+    completes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        db = _RequestDB()
+        token = _request_db.set(db)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                _series(scope["method"], _route(scope))[0].observe(time.perf_counter() - started)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_db.reset(token)
+            method, route = scope["method"], _route(scope)
+            _, db_queries, db_seconds = _series(method, route)
+            db_queries.observe(db.queries)
+            db_seconds.observe(db.seconds)
+            counter = _status_series.get((method, route, status))
+            if counter is None:
+                counter = _status_series[method, route, status] = REQUESTS.labels(method, route, str(status))
+            counter.inc()
+
+
+# Labelled children per route; labels() validates and locks on every call,
+# which costs more than the observation itself
+_route_series: Dict[Tuple[str, str], tuple] = {}
+_status_series: Dict[Tuple[str, str, int], Counter] = {}
+
+
+def _series(method: str, route: str) -> tuple:
+    series = _route_series.get((method, route))
+    if series is None:
+        series = _route_series[method, route] = (
+            REQUEST_LATENCY.labels(method, route),
+            REQUEST_DB_QUERIES.labels(route),
+            REQUEST_DB_SECONDS.labels(route),
+        )
+    return series
+
+
+def _route(scope) -> str:
+    # The router stores the matched route in the scope
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED) if route is not None else UNMATCHED
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    _query_series[conn.dialect.is_async].observe(elapsed)
+    db = _request_db.get()
+    if db is not None:
+        db.queries += 1
+        db.seconds += elapsed
+
+
+_query_series = {False: QUERY_LATENCY.labels("sync"), True: QUERY_LATENCY.labels("async")}
+
+
+def instrument_engine(engine):
+    """Time every statement run through an engine (an AsyncEngine's sync_engine for async ones)"""
+    if not event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def uninstrument_engine(engine):
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _hit_ratio(stats: dict) -> float:
+    lookups = stats["hits"] + stats["misses"]
+    return stats["hits"] / lookups if lookups else 0.0
+
+
+class ComponentCollector:
+    """Reads the components' own stats() when Prometheus scrapes.
+
+    Nothing on the streaming or caching paths is touched to produce these;
+    the counters they already keep are just exported.
+    """
+
+    def __init__(self):
+        self.job_depths: Dict[str, int] = {}
+
+    async def refresh(self):
+        """Gather the values that need I/O (queue depths live in Redis)"""
+        from services.jobs import job_manager
+
+        try:
+            self.job_depths = await job_manager.queue_depths()
+        except Exception as e:
+            print(f"Error reading job queue depths: {e}")
+
+    def collect(self):
+        from services.auth_cache import user_cache
+        from services.cache import response_cache
+        from services.export import export_cache
+        from services.hls import segment_cache
+        from services.http_clients import http_clients
+        from services.jobs import job_manager
+        from services.readiness import DEGRADED, UP, readiness
+        from services.relay import relay_manager
+        from services.thumbnails import image_cache
+        from services.transcode import transcode_manager
+        from services.xtream import _responses as xtream_responses
+
+        # Relays: live viewers per channel; bytes include hubs that have since closed
+        hubs = GaugeMetricFamily("livetv_relay_hubs", "Channel relays on this worker by role", labels=["role"])
+        viewers = GaugeMetricFamily("livetv_relay_viewers", "Viewers attached to a channel relay", labels=["channel_id"])
+        bytes_in = CounterMetricFamily("livetv_relay_upstream_bytes", "Bytes received per channel, from upstream or the owning worker", labels=["channel_id"])
+        bytes_out = CounterMetricFamily("livetv_relay_bytes", "Bytes relayed to viewers per channel", labels=["channel_id"])
+        dropped = CounterMetricFamily("livetv_relay_dropped_viewers", "Viewers dropped for falling behind", labels=["channel_id"])
+        roles = {}
+        for hub in relay_manager.stats():
+            viewers.add_metric([str(hub["channel_id"])], hub["subscribers"])
+            roles[hub["role"]] = roles.get(hub["role"], 0) + 1
+        for role, count in roles.items():
+            hubs.add_metric([str(role)], count)
+        for channel_id, totals in relay_manager.totals().items():
+            label = [str(channel_id)]
+            bytes_in.add_metric(label, totals["bytes_in"])
+            bytes_out.add_metric(label, totals["bytes_out"])
+            dropped.add_metric(label, totals["dropped"])
+        yield from (hubs, viewers, bytes_in, bytes_out, dropped)
+
+        transcode = transcode_manager.stats()
+        sessions = GaugeMetricFamily("livetv_transcode_sessions", "Running ffmpeg sessions", labels=["mode"])
+        sessions.add_metric(["transcode"], transcode["transcodes"])
+        sessions.add_metric(["remux"], transcode["remuxes"])
+        yield sessions
+        yield GaugeMetricFamily("livetv_transcode_slots", "Concurrent full transcodes allowed", value=transcode["slots"])
+        yield CounterMetricFamily("livetv_transcode_rejected", "Sessions refused for lack of a slot", value=transcode["rejected"])
+
+        caches = {
+            "response": response_cache.stats(),
+            "hls_segment": segment_cache.stats(),
+            "auth_token": user_cache.tokens.stats(),
+            "auth_user": user_cache.users.stats(),
+            "image": image_cache.stats()["refs"],
+            "export": export_cache.stats()["refs"],
+            "xtream": xtream_responses.stats(),
+        }
+        hits = CounterMetricFamily("livetv_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("livetv_cache_misses", "Cache misses", labels=["cache"])
+        ratio = GaugeMetricFamily("livetv_cache_hit_ratio", "Hits over lookups since start", labels=["cache"])
+        for name, stats in caches.items():
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            ratio.add_metric([name], _hit_ratio(stats))
+        yield from (hits, misses, ratio)
+
+        depth = GaugeMetricFamily("livetv_job_queue_depth", "Jobs waiting per type", labels=["type"])
+        for name, value in self.job_depths.items():
+            depth.add_metric([name], value)
+        running = GaugeMetricFamily("livetv_jobs_running", "Jobs running in this process per type", labels=["type"])
+        counts = dict.fromkeys(job_manager.types, 0)
+        for job in job_manager.running.values():
+            counts[job.type] = counts.get(job.type, 0) + 1
+        for name, value in counts.items():
+            running.add_metric([name], value)
+        yield from (depth, running)
+
+        active = GaugeMetricFamily("livetv_upstream_connections", "Open upstream connections per host", labels=["host"])
+        waiting = GaugeMetricFamily("livetv_upstream_waiting", "Requests waiting for a connection slot per host", labels=["host"])
+        errors = CounterMetricFamily("livetv_upstream_errors", "Failed upstream requests per host", labels=["host"])
+        for host, stats in http_clients.stats()["hosts"].items():
+            active.add_metric([host], stats["active"])
+            waiting.add_metric([host], stats["waiting"])
+            errors.add_metric([host], stats["errors"])
+        yield from (active, waiting, errors)
+
+        # From the last readiness run; a scrape doesn't trigger one
+        if readiness.last is not None:
+            up = GaugeMetricFamily("livetv_dependency_up", "Dependency answered at the last readiness check", labels=["dependency"])
+            latency = GaugeMetricFamily("livetv_dependency_latency_seconds", "Dependency check latency", labels=["dependency"])
+            for name, check in readiness.last["checks"].items():
+                if check["latency_ms"] is None:
+                    continue
+                up.add_metric([name], 1 if check["status"] in (UP, DEGRADED) else 0)
+                latency.add_metric([name], check["latency_ms"] / 1000)
+            yield from (up, latency)
+
+
+component_collector = ComponentCollector()
+REGISTRY.register(component_collector)
+
+# How a component gauge combines across workers in multiprocess mode; the
+# others are summed over the live workers
+GAUGE_MODES = {
+    "livetv_job_queue_depth": "livemax",  # read from Redis, the same in every worker
+    "livetv_dependency_up": "livemin",
+    "livetv_dependency_latency_seconds": "livemax",
+}
+# A ratio doesn't add up across workers; it follows from hits and misses
+UNPUBLISHED = {"livetv_cache_hit_ratio"}
+
+
+class ComponentPublisher:
+    """Copies the component collector's values into multiprocess metrics.
+
+    The components only know their own worker's relays, sessions and
+    caches, so each worker publishes them every metrics_publish_interval
+    seconds for scrapes that land on the others. Counters advance by the
+    change since the last publish, so they keep their totals after a
+    worker exits.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self._counted: Dict[tuple, float] = {}
+        self._gauged: Dict[str, set] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _metric(self, family):
+        metric = self.metrics.get(family.name)
+        if metric is None:
+            labels = getattr(family, "_labelnames", ())
+            # Not registered: in multiprocess mode scrapes read the files, and
+            # the registry already has the collector under these names
+            if family.type == "counter":
+                metric = Counter(family.name, family.documentation, labels, registry=None)
+            else:
+                mode = GAUGE_MODES.get(family.name, "livesum")
+                metric = Gauge(family.name, family.documentation, labels, registry=None, multiprocess_mode=mode)
+            self.metrics[family.name] = metric
+        return metric
+
+    def publish(self):
+        for family in component_collector.collect():
+            if family.name in UNPUBLISHED:
+                continue
+            metric = self._metric(family)
+            gauged = set()
+            for sample in family.samples:
+                if family.type == "counter" and not sample.name.endswith("_total"):
+                    continue
+                labels = tuple(sample.labels[name] for name in metric._labelnames)
+                child = metric.labels(*labels) if labels else metric
+                if family.type == "counter":
+                    last = self._counted.get((family.name, labels), 0.0)
+                    # Less than last time means the component's count restarted
+                    change = sample.value - last if sample.value >= last else sample.value
+                    if change:
+                        child.inc(change)
+                    self._counted[family.name, labels] = sample.value
+                else:
+                    child.set(sample.value)
+                    gauged.add(labels)
+            # A channel without viewers (or similar) drops out of the family; zero it
+            for labels in self._gauged.get(family.name, set()) - gauged:
+                metric.labels(*labels).set(0)
+            self._gauged[family.name] = gauged
+
+    async def start(self):
+        if MULTIPROCESS and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await component_collector.refresh()
+                self.publish()
+            except Exception as e:
+                print(f"Error publishing metrics: {e}")
+            await asyncio.sleep(settings.metrics_publish_interval)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if MULTIPROCESS:
+            # Drops this worker's live gauges; its counters stay in the totals
+            multiprocess.mark_process_dead(os.getpid())
+
+
+component_publisher = ComponentPublisher()
+
+
+async def render_metrics() -> tuple:
+    """Body and content type of a scrape"""
+    await component_collector.refresh()
+    if not MULTIPROCESS:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    component_publisher.publish()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
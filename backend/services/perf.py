@@ -0,0 +1,37 @@
+import resource
+import sys
+import time
+
+
+class ImportStats:
+    """Row counts and timings for a bulk import"""
+
+    def __init__(self):
+        self.rows = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "rows_per_sec": round(self.rows_per_sec, 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in megabytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Playlist
+from services.channels import bulk_insert_channels, sync_channels
+from services.m3u import file_content_hash, iter_m3u_file
+from services.perf import peak_rss_mb
+from services.xtream import entries_content_hash, fetch_xtream_entries, parse_xtream_path
+
+Progress = Optional[Callable[[int], None]]
+
+
+def _mark_imported(db: Session, playlist_id: int, content_hash: str):
+    db.query(Playlist).filter(Playlist.id == playlist_id).update({
+        "content_hash": content_hash,
+        "last_refreshed_at": datetime.utcnow(),
+    })
+
+
+def store_entries(playlist_id: int, entries: Iterable[dict], content_hash: str, progress: Progress = None) -> dict:
+    """Bulk insert the first import of a playlist in one transaction"""
+    db = SessionLocal()
+    try:
+        stats = bulk_insert_channels(db, playlist_id, entries, progress=progress)
+        _mark_imported(db, playlist_id, content_hash)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    print(
+        f"Imported {stats.rows} channels into playlist {playlist_id} "
+        f"({stats.rows_per_sec:.0f} rows/sec, peak RSS {peak_rss_mb():.0f} MB)"
+    )
+    return stats.as_dict()
+
+
+def sync_entries(playlist_id: int, entries: Iterable[dict], content_hash: str, progress: Progress = None) -> dict:
+    """Diff a playlist against its stored channels in one transaction"""
+    db = SessionLocal()
+    try:
+        stats = sync_channels(db, playlist_id, entries, progress=progress)
+        _mark_imported(db, playlist_id, content_hash)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return stats.as_dict()
+
+
+def import_m3u_playlist(playlist_id: int, file_path: str, progress: Progress = None) -> dict:
+    """Stream an M3U playlist from disk and bulk insert its channels"""
+    return store_entries(playlist_id, iter_m3u_file(file_path), file_content_hash(file_path), progress)
+
+
+async def import_xtream_playlist(playlist_id: int, url: str, username: str, password: str, progress: Progress = None) -> dict:
+    entries = await fetch_xtream_entries(url, username, password)
+    return await asyncio.to_thread(store_entries, playlist_id, entries, entries_content_hash(entries), progress)
+
+
+def _load_playlist(playlist_id: int):
+    db = SessionLocal()
+    try:
+        playlist = db.query(Playlist).filter(Playlist.id == playlist_id).first()
+        if playlist is None:
+            return None
+        return playlist.playlist_type, playlist.file_path, playlist.content_hash
+    finally:
+        db.close()
+
+
+async def refresh_playlist(playlist_id: int, force: bool = False, progress: Progress = None) -> dict:
+    """Re-read a playlist's source and apply it as a diff.
+
+    Skipped entirely when the source hashes to what was imported last time.
+    """
+    playlist = await asyncio.to_thread(_load_playlist, playlist_id)
+    if playlist is None:
+        raise ValueError(f"Playlist {playlist_id} not found")
+    playlist_type, file_path, previous_hash = playlist
+
+    if playlist_type == "m3u":
+        content_hash = await asyncio.to_thread(file_content_hash, file_path)
+        entries = iter_m3u_file(file_path)
+    elif playlist_type == "xtream":
+        credentials = parse_xtream_path(file_path)
+        if not credentials:
+            raise ValueError("Invalid Xtream playlist source")
+        # A forced refresh must see the panel's current lists, not cached ones
+        entries = await fetch_xtream_entries(*credentials, use_cache=not force)
+        content_hash = entries_content_hash(entries)
+    else:
+        raise ValueError(f"Invalid playlist type: {playlist_type}")
+
+    if not force and previous_hash == content_hash:
+        return {"skipped": True}
+
+    stats = await asyncio.to_thread(sync_entries, playlist_id, entries, content_hash, progress)
+    stats["skipped"] = False
+    return stats
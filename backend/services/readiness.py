@@ -0,0 +1,194 @@
+import asyncio
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import text
+
+from config import settings
+from database import async_engine
+from services.http_clients import http_clients
+from services.redis_pool import get_redis
+
+UP = "up"
+DEGRADED = "degraded"
+DOWN = "down"
+SKIPPED = "skipped"
+
+STARTED_AT = time.time()
+
+
+class CheckFailed(Exception):
+    pass
+
+
+class _Skip(Exception):
+    """The dependency isn't configured, so there is nothing to check"""
+
+
+async def check_database() -> dict:
+    """Time to check a connection out of the pool, then a round trip on it.
+
+    An exhausted pool shows up as a checkout that runs into the timeout.
+    """
+    started = time.perf_counter()
+    async with async_engine.connect() as conn:
+        checkout = time.perf_counter() - started
+        await conn.execute(text("SELECT 1"))
+    detail = {"checkout_ms": round(checkout * 1000, 2)}
+    pool = async_engine.pool
+    if hasattr(pool, "checkedout") and hasattr(pool, "size"):
+        detail.update(pool_size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+    return detail
+
+
+async def check_redis() -> dict:
+    if not settings.redis_enabled:
+        raise _Skip("Redis is disabled")
+    redis = await get_redis()
+    if redis is None:
+        raise CheckFailed("unreachable, using in-process fallback")
+    await redis.ping()
+    return {}
+
+
+def _media_path_status() -> dict:
+    if not os.path.isdir(settings.media_path):
+        raise CheckFailed(f"{settings.media_path} is not a directory")
+    if not os.access(settings.media_path, os.R_OK | os.X_OK):
+        raise CheckFailed(f"{settings.media_path} is not readable")
+    # Listing one entry proves the mount answers, not just that the mount point exists
+    with os.scandir(settings.media_path) as entries:
+        next(entries, None)
+    usage = shutil.disk_usage(settings.media_path)
+    return {"free_gb": round(usage.free / 1024 ** 3, 1)}
+
+
+# One thread of its own: a hung network mount blocks whatever thread calls
+# scandir until the mount answers, and the default executor is shared with
+# file responses, exports and the image cache
+_media_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="readiness-media")
+_media_probe: Optional[asyncio.Future] = None
+
+
+async def check_media() -> dict:
+    global _media_probe
+    if _media_probe is not None and not _media_probe.done():
+        # Still stuck since an earlier check timed out; don't pile another thread onto it
+        raise CheckFailed(f"{settings.media_path} has not answered an earlier check")
+    _media_probe = asyncio.get_running_loop().run_in_executor(_media_executor, _media_path_status)
+    # Shielded so a timeout abandons the wait but the probe stays pending until the thread returns
+    return await asyncio.shield(_media_probe)
+
+
+async def check_upstream() -> dict:
+    """Reachability of the configured provider URLs; any HTTP answer counts as reachable"""
+    if not settings.readiness_upstream_urls:
+        raise _Skip("no readiness_upstream_urls configured")
+
+    async def reach(url: str):
+        async with http_clients.stream("GET", url, profile="probe", retries=0) as response:
+            return response.status_code
+
+    results = await asyncio.gather(*(reach(url) for url in settings.readiness_upstream_urls), return_exceptions=True)
+    failed = [url for url, result in zip(settings.readiness_upstream_urls, results) if isinstance(result, BaseException)]
+    if failed:
+        raise CheckFailed(f"unreachable: {', '.join(failed)}")
+    return {"urls": len(results)}
+
+
+# name: (check, timeout setting, critical). A critical dependency that is
+# down makes the replica unready; the others only mark it degraded, since
+# the app falls back without Redis and a provider outage hits every replica.
+CHECKS: Dict[str, tuple] = {
+    "database": (check_database, "readiness_db_timeout", True),
+    "media": (check_media, "readiness_media_timeout", True),
+    "redis": (check_redis, "readiness_redis_timeout", False),
+    "upstream": (check_upstream, "readiness_upstream_timeout", False),
+}
+
+
+async def _run(check: Callable[[], Awaitable[dict]], timeout: float) -> dict:
+    started = time.perf_counter()
+    try:
+        detail = await asyncio.wait_for(check(), timeout)
+        status, error = UP, None
+    except _Skip as e:
+        return {"status": SKIPPED, "latency_ms": None, "detail": str(e)}
+    except asyncio.TimeoutError:
+        detail, status, error = {}, DOWN, f"timed out after {timeout:g}s"
+    except Exception as e:
+        detail, status, error = {}, DOWN, str(e) or e.__class__.__name__
+    latency = (time.perf_counter() - started) * 1000
+    if status == UP and latency > settings.readiness_slow_ms:
+        status = DEGRADED
+    result = {"status": status, "latency_ms": round(latency, 2)}
+    if detail:
+        result["detail"] = detail
+    if error:
+        result["error"] = error
+    return result
+
+
+class Readiness:
+    """Dependency checks, run concurrently and cached for readiness_cache_ttl.
+
+    However often orchestrators and load balancers poll, each replica runs
+    the checks at most once per TTL; pollers arriving while a run is in
+    progress wait for that run instead of starting another.
+    """
+
+    def __init__(self):
+        self.last: Optional[dict] = None
+        self._checked_at = 0.0
+        self._inflight: Optional[asyncio.Future] = None
+        self.runs = 0
+
+    async def get(self) -> dict:
+        if self.last is not None and time.monotonic() - self._checked_at < settings.readiness_cache_ttl:
+            return self.last
+        if self._inflight is not None:
+            return await asyncio.shield(self._inflight)
+
+        self._inflight = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._check()
+            self._inflight.set_result(result)
+            return result
+        except BaseException as e:
+            self._inflight.set_exception(e)
+            self._inflight.exception()  # retrieved; waiters re-raise it
+            raise
+        finally:
+            self._inflight = None
+
+    async def _check(self) -> dict:
+        names = list(CHECKS)
+        results = await asyncio.gather(*(
+            _run(check, getattr(settings, timeout)) for check, timeout, _ in CHECKS.values()
+        ))
+        checks = dict(zip(names, results))
+        if any(checks[name]["status"] == DOWN for name, (_, _, critical) in CHECKS.items() if critical):
+            status = "unready"
+        elif any(check["status"] in (DOWN, DEGRADED) for check in checks.values()):
+            status = DEGRADED
+        else:
+            status = "ready"
+        self.runs += 1
+        self._checked_at = time.monotonic()
+        self.last = {"status": status, "checked_at": time.time(), "checks": checks}
+        return self.last
+
+
+readiness = Readiness()
+
+
+def liveness() -> dict:
+    """The process is up and its event loop is answering.
+
+    Dependencies aren't consulted, so an outage elsewhere doesn't get
+    healthy replicas restarted.
+    """
+    return {"status": "alive", "uptime_seconds": round(time.time() - STARTED_AT, 1)}
@@ -0,0 +1,43 @@
+import time
+from typing import Optional
+
+import redis.asyncio as aioredis
+
+from config import settings
+
+# Redis is optional at runtime: when it can't be reached, callers fall back to
+# in-process state. A failed connection is retried after a short back-off
+# rather than on every call.
+RETRY_AFTER = 30.0
+
+_client: Optional[aioredis.Redis] = None
+_unavailable_until = 0.0
+
+
+async def get_redis() -> Optional[aioredis.Redis]:
+    """Shared async Redis client, or None when Redis is disabled or unreachable"""
+    global _client, _unavailable_until
+    if not settings.redis_enabled:
+        return None
+    if _client is not None:
+        return _client
+    if time.monotonic() < _unavailable_until:
+        return None
+
+    client = aioredis.from_url(settings.redis_url, socket_connect_timeout=2, health_check_interval=30)
+    try:
+        await client.ping()
+    except Exception as e:
+        print(f"Redis unavailable at {settings.redis_url}, using in-process fallback: {e}")
+        _unavailable_until = time.monotonic() + RETRY_AFTER
+        await client.close()
+        return None
+    _client = client
+    return _client
+
+
+async def close_redis():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,282 @@
+import asyncio
+import hashlib
+from collections import deque
+from typing import AsyncIterator, Dict, Optional
+
+from config import settings
+from services.cluster import acquire_lease, release_lease, renew_lease
+from services.http_clients import http_clients
+from services.redis_pool import get_redis
+
+# Per hub counters that are also kept per channel across hubs
+TOTALS = ("bytes_in", "bytes_out", "skips", "dropped")
+
+
+class RelayHub:
+    """One upstream connection for a channel, fanned out to any number of viewers.
+
+    The upstream reader appends chunks to a ring buffer bounded by bytes and
+    never waits for subscribers. Each subscriber keeps its own read position;
+    one that falls off the back of the buffer is moved forward to the oldest
+    chunk still held, and dropped after too many such skips.
+
+    With Redis, the upstream connection is shared across worker processes
+    and nodes too: the worker holding the channel's owner lease reads
+    upstream and publishes every chunk, and hubs on other workers follow
+    by subscribing instead of connecting. A follower whose owner dies
+    (its lease expires) takes over.
+    """
+
+    def __init__(self, manager: "RelayManager", channel_id: int, url: str):
+        self.manager = manager
+        self.channel_id = channel_id
+        self.url = url
+        self.buffer = deque()  # (sequence number, chunk)
+        self.buffered_bytes = 0
+        self.next_seq = 0
+        self.subscribers = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.skips = 0
+        self.dropped = 0
+        self.closed = False
+        self.role = None  # owner, follower, or local without Redis
+        tag = hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+        self._owner_key = f"relay:owner:{channel_id}:{tag}"
+        self._data_key = f"relay:data:{channel_id}:{tag}"
+        self._publish_failed = False
+        self._data = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        # Armed until the first viewer actually starts reading
+        self._idle_handle: Optional[asyncio.TimerHandle] = asyncio.get_running_loop().call_later(
+            settings.relay_idle_timeout, self._close_if_idle
+        )
+
+    async def _run(self):
+        try:
+            redis = await get_redis() if settings.relay_shared else None
+            if redis is None:
+                self.role = "local"
+                await self._pump()
+                return
+            while True:
+                if await acquire_lease(redis, self._owner_key, settings.relay_owner_ttl):
+                    self.role = "owner"
+                    await self._own(redis)
+                    return
+                self.role = "follower"
+                if not await self._follow(redis):
+                    return
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Relay upstream error for channel {self.channel_id}: {e}")
+        finally:
+            self._close()
+
+    async def _pump(self, redis=None):
+        async with http_clients.stream("GET", self.url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(settings.relay_chunk_size):
+                self._publish(chunk)
+                if redis is not None:
+                    await self._broadcast(redis, chunk)
+
+    async def _broadcast(self, redis, chunk: bytes):
+        try:
+            await redis.publish(self._data_key, chunk)
+        except Exception as e:
+            # Viewers on this worker keep playing; followers find the owner silent
+            if not self._publish_failed:
+                print(f"Error publishing relay chunks for channel {self.channel_id}: {e}")
+                self._publish_failed = True
+
+    async def _own(self, redis):
+        renewal = asyncio.create_task(self._renew(redis))
+        try:
+            await self._pump(redis)
+        finally:
+            renewal.cancel()
+            try:
+                # Tells followers the stream ended, rather than leaving them to assume this worker died
+                await redis.publish(self._data_key, b"")
+                await release_lease(redis, self._owner_key)
+            except Exception as e:
+                print(f"Error releasing relay lease for channel {self.channel_id}: {e}")
+
+    async def _renew(self, redis):
+        while True:
+            await asyncio.sleep(settings.relay_owner_ttl / 3)
+            try:
+                renewed = await renew_lease(redis, self._owner_key, settings.relay_owner_ttl)
+            except Exception as e:
+                print(f"Error renewing relay lease for channel {self.channel_id}: {e}")
+                continue
+            if not renewed:
+                # Another worker may own the upstream by now; ours must not stay open alongside
+                print(f"Relay lease for channel {self.channel_id} lost, closing upstream")
+                self._task.cancel()
+                return
+
+    async def _follow(self, redis) -> bool:
+        """Relay the owner's chunks; True when the owner is gone and this hub should take over"""
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(self._data_key)
+        try:
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=settings.relay_owner_ttl / 3)
+                if message is None:
+                    if not await redis.exists(self._owner_key):
+                        return True
+                    continue
+                if not message["data"]:
+                    return False  # the owner's upstream ended
+                self._publish(message["data"])
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+    def _publish(self, chunk: bytes):
+        self.buffer.append((self.next_seq, chunk))
+        self.next_seq += 1
+        self.buffered_bytes += len(chunk)
+        self.bytes_in += len(chunk)
+        while self.buffered_bytes > settings.relay_buffer_bytes and len(self.buffer) > 1:
+            _, evicted = self.buffer.popleft()
+            self.buffered_bytes -= len(evicted)
+        self._wake()
+
+    def _wake(self):
+        # Swap in a fresh event so waiters released now don't see a stale set()
+        event, self._data = self._data, asyncio.Event()
+        event.set()
+
+    def _close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._cancel_idle_timer()
+        self.manager._discard(self)
+        self._wake()
+
+    def _cancel_idle_timer(self):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+
+    def _close_if_idle(self):
+        self._idle_handle = None
+        if self.subscribers:
+            return
+        if self.role == "owner":
+            asyncio.create_task(self._close_unless_followed())
+        else:
+            self._task.cancel()
+
+    async def _close_unless_followed(self):
+        # Followers on other workers are subscribed to the chunks this hub publishes
+        try:
+            redis = await get_redis()
+            followers = (await redis.pubsub_numsub(self._data_key))[0][1] if redis is not None else 0
+        except Exception as e:
+            print(f"Error counting relay followers for channel {self.channel_id}: {e}")
+            followers = 0
+        if self.subscribers or self.closed:
+            return
+        if followers:
+            self._idle_handle = asyncio.get_running_loop().call_later(settings.relay_idle_timeout, self._close_if_idle)
+        else:
+            self._task.cancel()
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        self.subscribers += 1
+        self._cancel_idle_timer()
+
+        # Start a few chunks behind the live edge so playback can begin at once
+        seq = max(self.next_seq - settings.relay_preroll_chunks, self.buffer[0][0] if self.buffer else 0)
+        skips = 0
+        try:
+            while True:
+                if seq >= self.next_seq:
+                    if self.closed:
+                        return
+                    await self._data.wait()
+                    continue
+
+                oldest = self.buffer[0][0]
+                if seq < oldest:
+                    # Too slow to keep up; jump forward rather than hold the buffer back
+                    skips += 1
+                    self.skips += 1
+                    if skips > settings.relay_max_skips:
+                        self.dropped += 1
+                        return
+                    seq = oldest
+
+                chunk = self.buffer[seq - oldest][1]
+                seq += 1
+                self.bytes_out += len(chunk)
+                yield chunk
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.closed:
+                loop = asyncio.get_running_loop()
+                self._idle_handle = loop.call_later(settings.relay_idle_timeout, self._close_if_idle)
+
+    def stats(self) -> dict:
+        return {
+            "channel_id": self.channel_id,
+            "role": self.role,
+            "subscribers": self.subscribers,
+            "buffered_bytes": self.buffered_bytes,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "skips": self.skips,
+            "dropped": self.dropped,
+        }
+
+
+class RelayManager:
+    """Registry of live relay hubs, one per channel"""
+
+    def __init__(self):
+        self.hubs: Dict[int, RelayHub] = {}
+        # Counters of closed hubs, so per channel totals survive reconnects
+        self._closed_totals: Dict[int, Dict[str, int]] = {}
+
+    def subscribe(self, channel_id: int, url: str) -> AsyncIterator[bytes]:
+        hub = self.hubs.get(channel_id)
+        if hub is None or hub.closed or hub.url != url:
+            hub = RelayHub(self, channel_id, url)
+            self.hubs[channel_id] = hub
+        return hub.subscribe()
+
+    def _discard(self, hub: RelayHub):
+        if self.hubs.get(hub.channel_id) is hub:
+            del self.hubs[hub.channel_id]
+        # Taken at close: the few buffered chunks viewers still drain afterwards aren't counted
+        totals = self._closed_totals.setdefault(hub.channel_id, dict.fromkeys(TOTALS, 0))
+        for name in TOTALS:
+            totals[name] += getattr(hub, name)
+
+    def stats(self) -> list:
+        return [hub.stats() for hub in self.hubs.values()]
+
+    async def close(self):
+        """Stop every hub, releasing owner leases so other workers take over at once"""
+        tasks = [hub._task for hub in self.hubs.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def totals(self) -> Dict[int, Dict[str, int]]:
+        """Cumulative counters per channel since start, open and closed hubs together"""
+        totals = {channel_id: dict(values) for channel_id, values in self._closed_totals.items()}
+        for hub in self.hubs.values():
+            channel = totals.setdefault(hub.channel_id, dict.fromkeys(TOTALS, 0))
+            for name in TOTALS:
+                channel[name] += getattr(hub, name)
+        return totals
+
+
+relay_manager = RelayManager()
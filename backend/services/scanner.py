@@ -0,0 +1,234 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select, update
+
+from database import SessionLocal
+from models import Media
+from config import settings
+
+YEAR_RE = re.compile(r'[\[(. _-]((?:19|20)\d{2})(?:[\]). _-]|$)')
+EPISODE_RE = re.compile(r'\bS\d{1,2}\s?E\d{1,3}\b|\b\d{1,2}x\d{2}\b', re.IGNORECASE)
+
+# (path relative to the media root, size, mtime, inode)
+FileEntry = Tuple[str, int, float, int]
+
+
+class ScanProgress:
+    """Live counters for the current (or last) library scan"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.state = "idle"
+        self.started_at = None
+        self.finished_at = None
+        self.started = None
+        self.elapsed = 0.0
+        self.directories = 0
+        self.files_seen = 0
+        self.files_matched = 0
+        self.files_new = 0
+        self.files_changed = 0
+        self.files_unchanged = 0
+        self.files_removed = 0
+        self.errors = 0
+        self.error = None
+
+    @property
+    def running(self) -> bool:
+        return self.state == "running"
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started if self.running else self.elapsed
+        return {
+            "state": self.state,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": round(elapsed, 3),
+            "directories": self.directories,
+            "files_seen": self.files_seen,
+            "files_matched": self.files_matched,
+            "files_new": self.files_new,
+            "files_changed": self.files_changed,
+            "files_unchanged": self.files_unchanged,
+            "files_removed": self.files_removed,
+            "files_per_sec": round(self.files_seen / elapsed, 1) if elapsed > 0 else 0.0,
+            "errors": self.errors,
+            "error": self.error,
+        }
+
+
+scan_progress = ScanProgress()
+
+
+def _allowed_extensions() -> set:
+    return {ext.lower() for ext in settings.allowed_video_formats + settings.allowed_audio_formats}
+
+
+def _scan_directory(root: str, relative: str) -> Tuple[List[str], List[Tuple[str, os.stat_result]], int]:
+    """List one directory, returning (subdirectories, files with stat, error count)"""
+    subdirs, files, errors = [], [], 0
+    try:
+        with os.scandir(os.path.join(root, relative)) as entries:
+            for entry in entries:
+                path = os.path.join(relative, entry.name) if relative else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith('.'):
+                            subdirs.append(path)
+                    elif entry.is_file():
+                        files.append((path, entry.stat()))
+                except OSError:
+                    errors += 1
+    except OSError:
+        errors += 1
+    return subdirs, files, errors
+
+
+def walk_media_files(root: str, progress: ScanProgress, workers: int) -> Iterator[FileEntry]:
+    """Walk a directory tree with a thread pool, yielding files with allowed extensions.
+
+    Directory listings and stat calls are I/O bound, so on network storage
+    many directories in flight at once hide most of the round-trip latency.
+    """
+    extensions = _allowed_extensions()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="media-scan") as executor:
+        pending = {executor.submit(_scan_directory, root, "")}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                subdirs, files, errors = future.result()
+                for subdir in subdirs:
+                    pending.add(executor.submit(_scan_directory, root, subdir))
+                with progress.lock:
+                    progress.directories += 1
+                    progress.files_seen += len(files)
+                    progress.errors += errors
+                for path, stat in files:
+                    if os.path.splitext(path)[1].lower() in extensions:
+                        yield path, stat.st_size, stat.st_mtime, stat.st_ino
+
+
+def guess_media_info(relative_path: str) -> dict:
+    """Derive title, year and media type from a file name"""
+    stem, extension = os.path.splitext(os.path.basename(relative_path))
+    if extension.lower() in {ext.lower() for ext in settings.allowed_audio_formats}:
+        media_type = "music"
+    elif EPISODE_RE.search(stem):
+        media_type = "tv_show"
+    else:
+        media_type = "movie"
+
+    year = None
+    match = YEAR_RE.search(stem)
+    if match:
+        year = int(match.group(1))
+        stem = stem[:match.start()] or stem
+
+    title = re.sub(r'[._]+', ' ', stem).strip(' -[](') or stem
+    return {"title": title, "year": year, "media_type": media_type}
+
+
+def _load_index(db) -> Dict[str, Tuple[int, Optional[int], Optional[float], Optional[int]]]:
+    rows = db.execute(select(Media.id, Media.file_path, Media.file_size, Media.file_mtime, Media.file_inode))
+    return {row.file_path: (row.id, row.file_size, row.file_mtime, row.file_inode) for row in rows}
+
+
+def scan_media_library(
+    progress: ScanProgress = scan_progress,
+    batch_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    on_batch: Optional[Callable[[ScanProgress], None]] = None,
+):
+    """Reconcile the Media table with the files under settings.media_path.
+
+    Only files whose (size, mtime, inode) differ from the stored scan index
+    are touched, so a rescan of an unchanged library reads directory entries
+    and nothing else. Rows for files that have disappeared are removed.
+    """
+    batch_size = batch_size or settings.media_scan_batch_size
+    workers = workers or settings.media_scan_workers
+    root = settings.media_path
+
+    with progress.lock:
+        if progress.running:
+            raise RuntimeError("A media scan is already running")
+        progress.reset()
+        progress.state = "running"
+        progress.started_at = datetime.utcnow()
+        progress.started = time.perf_counter()
+
+    db = SessionLocal()
+    try:
+        index = _load_index(db)
+        inserts, updates = [], []
+
+        def flush():
+            if inserts:
+                db.execute(insert(Media), inserts)
+            if updates:
+                db.execute(update(Media), updates)
+            db.commit()
+            inserts.clear()
+            updates.clear()
+            if on_batch:
+                on_batch(progress)
+
+        for path, size, mtime, inode in walk_media_files(root, progress, workers):
+            progress.files_matched += 1
+            existing = index.pop(path, None)
+            if existing is None:
+                inserts.append({
+                    **guess_media_info(path),
+                    "file_path": path,
+                    "file_size": size,
+                    "file_mtime": mtime,
+                    "file_inode": inode,
+                })
+                progress.files_new += 1
+            elif existing[1:] != (size, mtime, inode):
+                updates.append({
+                    "id": existing[0],
+                    "file_size": size,
+                    "file_mtime": mtime,
+                    "file_inode": inode,
+                    "probed_at": None,  # probe results describe the old version
+                })
+                progress.files_changed += 1
+            else:
+                progress.files_unchanged += 1
+
+            if len(inserts) + len(updates) >= batch_size:
+                flush()
+        flush()
+
+        # Whatever is left in the index was not found on disk. Skip the purge when
+        # nothing matched at all so an unmounted share doesn't wipe the library.
+        if index and progress.files_matched and os.path.isdir(root):
+            stale_ids = [entry[0] for entry in index.values()]
+            for start in range(0, len(stale_ids), batch_size):
+                db.execute(delete(Media).where(Media.id.in_(stale_ids[start:start + batch_size])))
+            db.commit()
+            progress.files_removed = len(stale_ids)
+
+        progress.state = "completed"
+    except Exception as e:
+        db.rollback()
+        progress.state = "failed"
+        progress.error = str(e) or type(e).__name__
+        print(f"Error scanning media library: {e}")
+        raise
+    finally:
+        progress.finished_at = datetime.utcnow()
+        progress.elapsed = time.perf_counter() - progress.started
+        db.close()
+
+    return progress.as_dict()
@@ -0,0 +1,268 @@
+import asyncio
+import heapq
+import math
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, literal, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database import SessionLocal, async_engine
+from models import LiveTVChannel, Media
+from services.cache import CHANNELS, MEDIA, response_cache
+
+NON_WORD_RE = re.compile(r"[^\w]+")
+
+# Must match the expression indexes created by migration 008 exactly, or
+# PostgreSQL won't use them
+CHANNEL_VECTOR = "to_tsvector('simple', coalesce(live_tv_channels.name, '') || ' ' || coalesce(live_tv_channels.category, ''))"
+MEDIA_VECTOR = "to_tsvector('simple', coalesce(media.title, '') || ' ' || coalesce(media.description, ''))"
+
+EMPTY = array("I")
+
+# Ids per IN (...) when fetching fallback candidates; old SQLite allows 999 parameters
+LOOKUP_BATCH = 900
+
+
+def normalize(text: str) -> List[str]:
+    """Lowercased, accent-stripped words"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return [word for word in NON_WORD_RE.sub(" ", text).replace("_", " ").split() if word]
+
+
+def trigrams(words: Sequence[str], prefix: bool = False) -> set:
+    """pg_trgm style trigrams: each word padded with two spaces in front and one behind.
+
+    With `prefix` the last word gets no trailing pad, so a partly typed word
+    matches the start of longer words (autocomplete).
+    """
+    grams = set()
+    for i, word in enumerate(words):
+        padded = "  " + word + ("" if prefix and i == len(words) - 1 else " ")
+        for j in range(len(padded) - 2):
+            grams.add(padded[j:j + 3])
+    return grams
+
+
+class NgramIndex:
+    """In-process trigram index, the search backend when PostgreSQL isn't available.
+
+    Scores are the fraction of query trigrams a document contains, like
+    pg_trgm's word_similarity, so misspellings still match on the trigrams
+    they get right.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, array] = {}
+        self.lengths: Dict[int, int] = {}
+
+    def add(self, doc_id: int, *fields: Optional[str]):
+        """Index a document. Ids must be added in ascending order (postings stay sorted)."""
+        words = normalize(" ".join(field for field in fields if field))
+        self.lengths[doc_id] = sum(len(word) for word in words)
+        for gram in trigrams(words):
+            postings = self.postings.get(gram)
+            if postings is None:
+                postings = self.postings[gram] = array("I")
+            postings.append(doc_id)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def search(self, query: str, limit: int, prefix: bool = False) -> List[Tuple[int, float]]:
+        grams = trigrams(normalize(query), prefix)
+        if not grams:
+            return []
+        lists = sorted((self.postings.get(gram, EMPTY) for gram in grams), key=len)
+        need = max(1, math.ceil(len(grams) * settings.search_similarity_threshold))
+
+        # Any document sharing `need` trigrams appears in at least one of the
+        # len(grams) - need + 1 shortest lists, so only those produce
+        # candidates. A longer (common trigram) list is counted wholesale when
+        # that is cheap, otherwise candidates are looked up in it by bisection.
+        split = len(grams) - need + 1
+        counts = Counter()
+        for postings in lists[:split]:
+            counts.update(postings)
+        candidates = list(counts)
+        for postings in lists[split:]:
+            if len(postings) <= len(candidates) * 16:
+                counts.update(postings)
+                continue
+            for doc_id in candidates:
+                i = bisect_left(postings, doc_id)
+                if i < len(postings) and postings[i] == doc_id:
+                    counts[doc_id] += 1
+
+        lengths = self.lengths
+        best = heapq.nlargest(
+            limit,
+            (doc_id for doc_id, shared in counts.items() if shared >= need),
+            key=lambda doc_id: (counts[doc_id], -lengths[doc_id], -doc_id),
+        )
+        return [(doc_id, counts[doc_id] / len(grams)) for doc_id in best]
+
+
+def _load_channels(index: NgramIndex):
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(LiveTVChannel.id, LiveTVChannel.name, LiveTVChannel.category)
+            .where(LiveTVChannel.is_active == True)
+            .order_by(LiveTVChannel.id)
+            .execution_options(yield_per=10000)
+        )
+        for doc_id, name, category in rows:
+            index.add(doc_id, name, category)
+    finally:
+        db.close()
+
+
+def _load_media(index: NgramIndex):
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(Media.id, Media.title, Media.description)
+            .order_by(Media.id)
+            .execution_options(yield_per=10000)
+        )
+        for doc_id, title, description in rows:
+            index.add(doc_id, title, description)
+    finally:
+        db.close()
+
+
+class FallbackIndexes:
+    """One NgramIndex per namespace, rebuilt when the namespace's cache version moves"""
+
+    def __init__(self):
+        self._indexes: Dict[str, Tuple[int, NgramIndex]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def get(self, namespace: str, load: Callable[[NgramIndex], None]) -> NgramIndex:
+        version = await response_cache.version(namespace)
+        current = self._indexes.get(namespace)
+        if current is not None and current[0] == version:
+            return current[1]
+
+        lock = self._locks.setdefault(namespace, asyncio.Lock())
+        async with lock:
+            current = self._indexes.get(namespace)
+            if current is not None and current[0] == version:
+                return current[1]
+            index = NgramIndex()
+            await asyncio.to_thread(load, index)
+            self._indexes[namespace] = (version, index)
+            return index
+
+
+fallback_indexes = FallbackIndexes()
+
+
+def _use_postgres() -> bool:
+    return async_engine.dialect.name == "postgresql"
+
+
+def _tsquery(words: Sequence[str], prefix: bool):
+    # With `prefix` the last word may be partly typed, as in the fallback's
+    # trigrams; the words are normalized so they carry no tsquery syntax
+    terms = list(words)
+    if prefix:
+        terms[-1] += ":*"
+    return func.to_tsquery(literal_column("'simple'::regconfig"), " & ".join(terms))
+
+
+async def _search(
+    db: AsyncSession,
+    model,
+    text_column,
+    vector: str,
+    namespace: str,
+    load: Callable[[NgramIndex], None],
+    q: str,
+    skip: int,
+    limit: int,
+    filters: Iterable,
+    prefix: bool,
+) -> List[Tuple[object, float]]:
+    words = normalize(q)
+    if not words:
+        return []
+
+    if _use_postgres():
+        # Same cut-off as the fallback; transaction-local, so pooled connections aren't affected
+        await db.execute(select(func.set_config(
+            "pg_trgm.word_similarity_threshold", str(settings.search_similarity_threshold), True
+        )))
+        tsquery = _tsquery(words, prefix)
+        query_text = " ".join(words)
+        score = func.greatest(
+            func.word_similarity(query_text, text_column),
+            func.ts_rank_cd(literal_column(vector), tsquery),
+        ).label("score")
+        result = await db.execute(
+            select(model, score)
+            .where(
+                or_(literal(query_text).op("<%")(text_column), literal_column(vector).op("@@")(tsquery)),
+                *filters,
+            )
+            .order_by(score.desc(), model.id)
+            .offset(skip)
+            .limit(limit)
+        )
+        return [(row[0], float(row[1])) for row in result]
+
+    # The index knows nothing of the filters, so rank a window of candidates,
+    # filter them in SQL and widen the window until the page is full or the
+    # matches run out. A wider window's ranking starts with the narrower
+    # one's (ties are broken by id), so only the new part is looked up.
+    index = await fallback_indexes.get(namespace, load)
+    wanted = skip + limit
+    window = settings.search_max_candidates
+    hits = []
+    seen = 0
+    while True:
+        ranked = index.search(q, window, prefix)
+        batch = ranked[seen:]
+        for start in range(0, len(batch), LOOKUP_BATCH):
+            chunk = batch[start:start + LOOKUP_BATCH]
+            rows = (await db.scalars(select(model).where(model.id.in_([doc_id for doc_id, _ in chunk]), *filters))).all()
+            by_id = {row.id: row for row in rows}
+            hits += [(by_id[doc_id], score) for doc_id, score in chunk if doc_id in by_id]
+        seen = len(ranked)
+        if len(hits) >= wanted or len(ranked) < window:
+            return hits[skip:wanted]
+        window *= 2
+
+
+async def search_channels(
+    db: AsyncSession,
+    q: str,
+    skip: int = 0,
+    limit: int = 50,
+    filters: Iterable = (),
+    prefix: bool = False,
+) -> List[Tuple[LiveTVChannel, float]]:
+    """Active channels matching `q` on name and category, best first"""
+    filters = [LiveTVChannel.is_active == True, *filters]
+    return await _search(db, LiveTVChannel, LiveTVChannel.name, CHANNEL_VECTOR, CHANNELS, _load_channels,
+                         q, skip, limit, filters, prefix)
+
+
+async def search_media(
+    db: AsyncSession,
+    q: str,
+    skip: int = 0,
+    limit: int = 50,
+    filters: Iterable = (),
+    prefix: bool = False,
+) -> List[Tuple[Media, float]]:
+    """Media matching `q` on title and description, best first"""
+    return await _search(db, Media, Media.title, MEDIA_VECTOR, MEDIA, _load_media,
+                         q, skip, limit, filters, prefix)
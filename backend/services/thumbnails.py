@@ -0,0 +1,263 @@
+import asyncio
+import hashlib
+import hmac
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from PIL import Image, UnidentifiedImageError
+
+from config import settings
+from services import imaging
+from services.cache import TTLCache
+from services.http_clients import http_clients
+
+# Part of every cache key; bump it when the generated output changes so
+# everything is regenerated instead of served stale
+CACHE_VERSION = 1
+
+SIZES: Dict[str, Dict[str, Tuple[int, int]]] = {
+    "logo": {"sm": (64, 64), "md": (128, 128), "lg": (256, 256)},
+    "thumbnail": {
+        "sm": tuple(settings.thumbnail_size),
+        "lg": (settings.thumbnail_size[0] * 2, settings.thumbnail_size[1] * 2),
+    },
+}
+
+# The URL names a channel or media item rather than the content, so it is
+# revalidated (cheaply, by ETag) instead of cached forever
+CACHE_CONTROL = "public, max-age=86400, stale-while-revalidate=604800"
+
+IMAGE_ERRORS = (
+    httpx.HTTPError, UnidentifiedImageError, Image.DecompressionBombError,
+    subprocess.TimeoutExpired, OSError, ValueError,
+)
+
+
+class ImageUnavailable(Exception):
+    pass
+
+
+def _signature(kind: str, entity_id: int, size: str) -> str:
+    message = f"image:{kind}:{entity_id}:{size}".encode("utf-8")
+    return hmac.new(settings.jwt_secret.encode("utf-8"), message, hashlib.sha256).hexdigest()[:32]
+
+
+def image_url(kind: str, entity_id: int, size: str) -> str:
+    """Signed URL for a generated image.
+
+    <img> tags can't send bearer tokens, so the signature authorizes the
+    request. It doesn't expire, which keeps list responses cacheable.
+    """
+    return f"/api/images/{kind}/{entity_id}/{size}.webp?sig={_signature(kind, entity_id, size)}"
+
+
+def verify_image_signature(kind: str, entity_id: int, size: str, signature: str) -> bool:
+    return hmac.compare_digest(_signature(kind, entity_id, size), signature)
+
+
+class ImageCache:
+    """Content-addressed disk cache of generated WebP images.
+
+    Blobs are stored under the SHA-256 of their bytes, which is also their
+    strong ETag, so identical outputs (one logo shared by a channel's HD,
+    SD and backup feeds) are stored once. A ref file per source (logo URL
+    or media file version, plus size) names the blob generated from it.
+    Images are generated once per ref, concurrent requests for the same one
+    share the work, and the CPU-heavy part runs in a process pool.
+    """
+
+    def __init__(self):
+        self.root = settings.image_cache_dir or os.path.join(settings.media_path, ".cache", "images")
+        self._refs = TTLCache(10000, 300)
+        self._failures = TTLCache(10000, settings.image_failure_ttl)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.generated = 0
+        self.failed = 0
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], f"{digest}.webp")
+
+    def _ref_path(self, key: str) -> str:
+        return os.path.join(self.root, "refs", key[:2], key)
+
+    def _read_ref(self, key: str, max_age: Optional[float]) -> Optional[str]:
+        path = self._ref_path(key)
+        try:
+            if max_age is not None and os.path.getmtime(path) + max_age < time.time():
+                return None
+            with open(path) as f:
+                digest = f.read().strip()
+        except OSError:
+            return None
+        return digest if os.path.exists(self.blob_path(digest)) else None
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def _store(self, key: str, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        blob = self.blob_path(digest)
+        if not os.path.exists(blob):
+            self._write_atomic(blob, data)
+        self._write_atomic(self._ref_path(key), digest.encode("ascii"))
+        return digest
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs an event loop and thread pools is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=settings.image_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def run(self, fn: Callable, *args):
+        """Run an imaging function in the process pool"""
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor(), fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge image); start a fresh pool next time
+            self._pool = None
+            raise ImageUnavailable("Image worker crashed")
+
+    async def get(self, key: str, make: Callable[[], Awaitable[Optional[bytes]]], max_age: Optional[float] = None) -> str:
+        """Digest of the image for `key`, generating it with `make` if needed"""
+        digest = self._refs.get(key)
+        if digest is not None:
+            return digest
+        if self._failures.get(key):
+            raise ImageUnavailable()
+
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            digest = await asyncio.to_thread(self._read_ref, key, max_age)
+            if digest is None:
+                try:
+                    data = await make()
+                except IMAGE_ERRORS as e:
+                    print(f"Error generating image {key}: {e}")
+                    data = None
+                if not data:
+                    self.failed += 1
+                    self._failures.set(key, True)
+                    raise ImageUnavailable()
+                digest = await asyncio.to_thread(self._store, key, data)
+                self.generated += 1
+            self._refs.set(key, digest)
+            future.set_result(digest)
+            return digest
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved; waiters re-raise it
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "root": self.root,
+            "workers": settings.image_workers,
+            "generated": self.generated,
+            "failed": self.failed,
+            "refs": self._refs.stats(),
+        }
+
+
+image_cache = ImageCache()
+
+
+def _key(*parts) -> str:
+    return hashlib.sha256(":".join(str(part) for part in (CACHE_VERSION, *parts)).encode("utf-8")).hexdigest()
+
+
+async def _download(url: str) -> bytes:
+    async with http_clients.stream("GET", url, profile="api") as response:
+        response.raise_for_status()
+        data = bytearray()
+        async for chunk in response.aiter_bytes():
+            data += chunk
+            if len(data) > settings.logo_max_bytes:
+                raise ValueError(f"Logo larger than {settings.logo_max_bytes} bytes")
+    return bytes(data)
+
+
+async def logo_digest(logo_url: str, size: str) -> str:
+    """Resized WebP of a channel logo, fetched from its host at most once per logo_refresh_hours"""
+    box = SIZES["logo"][size]
+
+    async def make():
+        data = await _download(logo_url)
+        return await image_cache.run(imaging.resize_image, data, box, False, settings.image_webp_quality)
+
+    return await image_cache.get(_key("logo", logo_url, box), make, max_age=settings.logo_refresh_hours * 3600)
+
+
+def _media_source(path: Optional[str]) -> Optional[str]:
+    if not path:
+        return None
+    return path if os.path.isabs(path) else os.path.join(settings.media_path, path)
+
+
+async def thumbnail_digest(media, size: str) -> str:
+    """WebP thumbnail of a media item: its sidecar image when it has one, else a video frame"""
+    box = SIZES["thumbnail"][size]
+    sidecar = _media_source(media.thumbnail_path)
+    if sidecar and os.path.exists(sidecar):
+        source = ("sidecar", sidecar, os.path.getmtime(sidecar))
+    elif media.media_type != "music":
+        # file_size and file_mtime change whenever the scanner sees a new version of the file
+        source = ("frame", _media_source(media.file_path), media.file_size, media.file_mtime)
+    else:
+        raise ImageUnavailable()
+
+    async def make():
+        if source[0] == "sidecar":
+            data = await asyncio.to_thread(_read_file, sidecar)
+            return await image_cache.run(imaging.resize_image, data, box, True, settings.image_webp_quality)
+        # A tenth of the way in skips black frames and opening titles
+        at = min(media.duration * 0.1, 300.0) if media.duration else 10.0
+        return await image_cache.run(imaging.video_frame, source[1], at, box, settings.image_webp_quality, settings.ffmpeg_path)
+
+    return await image_cache.get(_key("thumbnail", *source, box), make)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def image_response(request: Request, digest: str) -> Response:
+    """Serve a cached image with its content hash as a strong ETag"""
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(image_cache.blob_path(digest), media_type="image/webp", headers=headers)
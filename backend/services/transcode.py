@@ -0,0 +1,470 @@
+import asyncio
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import tempfile
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from config import settings
+from services.redis_pool import get_redis
+
+# What browsers decode natively inside HLS MPEG-TS segments
+BROWSER_VIDEO_CODECS = {"h264"}
+BROWSER_AUDIO_CODECS = {"aac", "mp3"}
+
+# Output profiles: (max height, video kbps); "original" keeps the source
+# resolution and remuxes whenever the source codecs allow it
+QUALITIES = {
+    "original": (1080, 6000),
+    "720p": (720, 3000),
+    "480p": (480, 1500),
+}
+
+SEGMENT_SECONDS = 4
+PLAYLIST = "index.m3u8"
+
+
+class TranscodeError(Exception):
+    pass
+
+
+class TranscodeBusy(TranscodeError):
+    """Every transcode slot is taken"""
+
+
+def plan(video_codec: Optional[str], audio_codec: Optional[str], quality: str, assume_h264: bool = False) -> dict:
+    """Decide what ffmpeg has to do with a source.
+
+    Video is copied (a remux, nearly free) when it is already H.264 and the
+    original quality was asked for; otherwise it is re-encoded. Audio is
+    re-encoded to AAC unless browsers can already play it, which costs
+    little either way. `assume_h264` is for live channels, whose codecs
+    aren't known up front and are nearly always H.264.
+    """
+    h264 = video_codec in BROWSER_VIDEO_CODECS or (video_codec is None and assume_h264)
+    remux = quality == "original" and h264
+    return {
+        "mode": "remux" if remux else "transcode",
+        "copy_video": remux,
+        "copy_audio": audio_codec in BROWSER_AUDIO_CODECS,
+        "quality": quality,
+    }
+
+
+def ffmpeg_args(source: str, session_dir: str, steps: dict, live: bool) -> List[str]:
+    max_height, kbps = QUALITIES[steps["quality"]]
+    args = [settings.ffmpeg_path, "-loglevel", "error"]
+    # A piped channel comes from the relay, which is always MPEG-TS
+    args += ["-f", "mpegts"] if source == "pipe:0" else ["-nostdin"]
+    args += ["-i", source, "-map", "0:v:0", "-map", "0:a:0?"]
+
+    if steps["copy_video"]:
+        args += ["-c:v", "copy"]
+    else:
+        args += [
+            "-c:v", "libx264", "-preset", settings.transcode_preset, "-pix_fmt", "yuv420p",
+            "-vf", f"scale=-2:'min({max_height},ih)'",
+            "-b:v", f"{kbps}k", "-maxrate", f"{kbps}k", "-bufsize", f"{kbps * 2}k",
+            # A keyframe at every segment boundary, so segments split exactly on hls_time
+            "-force_key_frames", f"expr:gte(t,n_forced*{SEGMENT_SECONDS})",
+            "-threads", str(settings.transcode_threads),
+        ]
+    args += ["-c:a", "copy"] if steps["copy_audio"] else ["-c:a", "aac", "-b:a", "160k", "-ac", "2"]
+
+    args += ["-f", "hls", "-hls_time", str(SEGMENT_SECONDS)]
+    if live:
+        # A sliding window; old segments are deleted so a channel left open can't fill the disk
+        args += ["-hls_list_size", "10", "-hls_flags", "delete_segments+omit_endlist"]
+    else:
+        # Growing playlist of the whole file; ENDLIST is added when ffmpeg finishes
+        args += ["-hls_list_size", "0", "-hls_playlist_type", "event"]
+    args += ["-hls_segment_filename", os.path.join(session_dir, "seg%05d.ts"), os.path.join(session_dir, PLAYLIST)]
+    return args
+
+
+class _HLSOutput:
+    """The playlist and segments a session writes to its directory"""
+
+    id: str
+    directory: str
+    steps: dict
+
+    def playlist_path(self) -> str:
+        return os.path.join(self.directory, PLAYLIST)
+
+    def playlist_url(self) -> str:
+        return f"/api/transcode/{self.id}/{PLAYLIST}"
+
+    def as_dict(self) -> dict:
+        """What a viewer gets back when opening or joining the session"""
+        return {
+            "session_id": self.id,
+            "playlist_url": self.playlist_url(),
+            "mode": self.steps["mode"],
+            "quality": self.steps["quality"],
+        }
+
+    def _check_running(self):
+        pass
+
+    async def wait_ready(self, timeout: float):
+        """Wait until the playlist lists its first segment"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with open(self.playlist_path()) as f:
+                    if "#EXTINF" in f.read():
+                        return
+            except FileNotFoundError:
+                pass
+            self._check_running()
+            await asyncio.sleep(0.2)
+        raise TranscodeError("Timed out waiting for the first segment")
+
+
+class TranscodeSession(_HLSOutput):
+    """One ffmpeg process writing HLS for a (source, quality), shared by every viewer of it"""
+
+    def __init__(self, key: Tuple, steps: dict, directory: str):
+        self.id = secrets.token_urlsafe(16)
+        self.key = key
+        self.steps = steps
+        self.directory = directory
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.started_at = time.time()
+        self.last_access = time.monotonic()
+        self.viewers = set()
+        self._stderr: deque = deque(maxlen=20)
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def weight(self) -> int:
+        """Transcode slots used; a remux only copies packets"""
+        return 0 if self.steps["copy_video"] else 1
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    def touch(self, viewer: Optional[str] = None):
+        self.last_access = time.monotonic()
+        if viewer:
+            self.viewers.add(viewer)
+
+    async def start(self, args: List[str], feed: Optional[AsyncIterator[bytes]] = None):
+        self.process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.PIPE if feed is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        self._tasks.append(asyncio.create_task(self._drain_stderr()))
+        if feed is not None:
+            self._tasks.append(asyncio.create_task(self._feed(feed)))
+
+    async def _drain_stderr(self):
+        # Read continuously: a full stderr pipe would block ffmpeg
+        async for line in self.process.stderr:
+            self._stderr.append(line.decode("utf-8", "replace").rstrip())
+
+    async def _feed(self, chunks: AsyncIterator[bytes]):
+        """Pipe a relayed live stream into ffmpeg's stdin"""
+        try:
+            async for chunk in chunks:
+                self.process.stdin.write(chunk)
+                await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            await chunks.aclose()
+            if not self.process.stdin.is_closing():
+                self.process.stdin.close()
+
+    def _check_running(self):
+        if not self.running:
+            raise TranscodeError(self.error() or f"ffmpeg exited with {self.process.returncode}")
+
+    def error(self) -> Optional[str]:
+        return "\n".join(self._stderr) or None
+
+    async def stop(self):
+        if self.running:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), 5)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.to_thread(shutil.rmtree, self.directory, True)
+
+    def stats(self) -> dict:
+        return {
+            "id": self.id,
+            "source": self.key[0],
+            "mode": self.steps["mode"],
+            "quality": self.steps["quality"],
+            "running": self.running,
+            "returncode": self.process.returncode if self.process else None,
+            "viewers": len(self.viewers),
+            "idle_seconds": round(time.monotonic() - self.last_access, 1),
+            "started_at": self.started_at,
+        }
+
+
+class RemoteSession(_HLSOutput):
+    """A session another worker runs, served from its directory.
+
+    Workers on one node share transcode_dir; across nodes it has to be on
+    shared storage for this to find the files.
+    """
+
+    def __init__(self, session_id: str, info: dict):
+        self.id = session_id
+        self.directory = info["directory"]
+        self.steps = {"mode": info["mode"], "quality": info["quality"]}
+
+
+def transcode_slots() -> int:
+    """Concurrent full transcodes this worker may run.
+
+    The default splits the machine's cores between the uvicorn workers
+    (WEB_CONCURRENCY) so that N workers don't oversubscribe one node N times.
+    """
+    if settings.transcode_max_sessions:
+        return settings.transcode_max_sessions
+    workers = max(1, int(os.environ.get("WEB_CONCURRENCY") or 1))
+    return max(1, (os.cpu_count() or 1) // max(1, settings.transcode_threads) // workers)
+
+
+def _source_key(key: Tuple) -> str:
+    return "transcode:source:" + hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+
+
+class TranscodeManager:
+    """Starts, shares and reaps ffmpeg HLS sessions.
+
+    Viewers of the same source and quality join the running session
+    instead of starting another encoder. Full transcodes are capped at
+    transcode_slots(); remuxes only by transcode_max_remux. A session
+    nobody has fetched from for transcode_idle_timeout is stopped and its
+    scratch directory removed.
+
+    With Redis, sessions are registered so viewers arriving at another
+    worker join them too, and any worker can serve their files; fetches
+    through other workers count as access for the idle timeout.
+    """
+
+    def __init__(self):
+        self.root = settings.transcode_dir or os.path.join(tempfile.gettempdir(), "livetv-transcode")
+        self.sessions: Dict[str, TranscodeSession] = {}
+        self._by_key: Dict[Tuple, TranscodeSession] = {}
+        self._lock = asyncio.Lock()
+        self._reaper: Optional[asyncio.Task] = None
+        self.started = 0
+        self.rejected = 0
+
+    def get(self, session_id: str) -> Optional[TranscodeSession]:
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.touch()
+        return session
+
+    async def locate(self, session_id: str):
+        """This worker's session, or one registered by another worker, marked as accessed"""
+        session = self.get(session_id)
+        if session is not None:
+            return session
+        redis = await get_redis()
+        if redis is None:
+            return None
+        try:
+            info = await redis.get(f"transcode:session:{session_id}")
+            if info is None:
+                return None
+            await redis.set(f"transcode:access:{session_id}", time.time(), ex=self._registry_ttl())
+        except Exception as e:
+            print(f"Error looking up transcode session {session_id}: {e}")
+            return None
+        return RemoteSession(session_id, json.loads(info))
+
+    @staticmethod
+    def _registry_ttl() -> int:
+        return int(settings.transcode_idle_timeout * 2) + 10
+
+    async def _join_remote(self, key: Tuple) -> Optional[RemoteSession]:
+        redis = await get_redis()
+        if redis is None:
+            return None
+        try:
+            session_id = await redis.get(_source_key(key))
+        except Exception as e:
+            print(f"Error looking up transcode sessions in Redis: {e}")
+            return None
+        if session_id is None:
+            return None
+        session = await self.locate(session_id.decode() if isinstance(session_id, bytes) else session_id)
+        return session if session is not None and os.path.isdir(session.directory) else None
+
+    async def _announce(self, session: TranscodeSession):
+        redis = await get_redis()
+        if redis is None:
+            return
+        info = {"directory": session.directory, "mode": session.steps["mode"], "quality": session.steps["quality"]}
+        ttl = self._registry_ttl()
+        try:
+            pipe = redis.pipeline(transaction=False)
+            pipe.set(f"transcode:session:{session.id}", json.dumps(info), ex=ttl)
+            pipe.set(_source_key(session.key), session.id, ex=ttl)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Error registering transcode session {session.id}: {e}")
+
+    async def _retract(self, session: TranscodeSession):
+        redis = await get_redis()
+        if redis is None:
+            return
+        try:
+            await redis.delete(f"transcode:session:{session.id}", f"transcode:access:{session.id}")
+            if await redis.get(_source_key(session.key)) in (session.id, session.id.encode()):
+                await redis.delete(_source_key(session.key))
+        except Exception as e:
+            print(f"Error unregistering transcode session {session.id}: {e}")
+
+    async def _idle_seconds(self, session: TranscodeSession, redis) -> float:
+        idle = time.monotonic() - session.last_access
+        if redis is not None and idle > settings.transcode_idle_timeout:
+            # Viewers may be fetching through other workers
+            try:
+                accessed = await redis.get(f"transcode:access:{session.id}")
+            except Exception:
+                accessed = None
+            if accessed is not None:
+                idle = min(idle, time.time() - float(accessed))
+        return idle
+
+    def _in_use(self) -> Tuple[int, int]:
+        # A finished file transcode still serves its segments but no longer uses a slot
+        running = [session for session in self.sessions.values() if session.running]
+        transcodes = sum(session.weight for session in running)
+        return transcodes, len(running) - transcodes
+
+    async def open(
+        self,
+        source: str,
+        steps: dict,
+        viewer: str,
+        live: bool = False,
+        feed=None,
+    ) -> TranscodeSession:
+        """Join the session for (source, quality) or start one.
+
+        `feed` is a zero-argument callable returning the bytes to pipe into
+        ffmpeg (a relayed channel), or None to let ffmpeg read `source`.
+        """
+        if shutil.which(settings.ffmpeg_path) is None:
+            raise TranscodeError("ffmpeg is not installed")
+        key = (source, steps["quality"], steps["mode"])
+        async with self._lock:
+            session = self._by_key.get(key)
+            # A finished file transcode keeps serving; a live one that ended, or any failed one, is replaced
+            if session is not None and not (session.running or (not live and session.process.returncode == 0)):
+                await self._remove(session)
+                session = None
+            if session is not None:
+                session.touch(viewer)
+            else:
+                session = await self._join_remote(key) or await self._start(key, source, steps, viewer, live, feed)
+
+        # Joiners wait too, so nobody is handed a playlist that doesn't exist yet
+        try:
+            await session.wait_ready(settings.transcode_start_timeout)
+        except TranscodeError:
+            async with self._lock:
+                if self.sessions.get(session.id) is session:
+                    await self._remove(session)
+            raise
+        return session
+
+    async def _start(self, key: Tuple, source: str, steps: dict, viewer: str, live: bool, feed) -> TranscodeSession:
+        transcodes, remuxes = self._in_use()
+        if (not steps["copy_video"] and transcodes >= transcode_slots()) or (
+            steps["copy_video"] and remuxes >= settings.transcode_max_remux
+        ):
+            self.rejected += 1
+            raise TranscodeBusy("All transcode slots are in use")
+
+        os.makedirs(self.root, exist_ok=True)
+        session = TranscodeSession(key, steps, tempfile.mkdtemp(prefix="session-", dir=self.root))
+        session.touch(viewer)
+        self.sessions[session.id] = session
+        self._by_key[key] = session
+        self.started += 1
+        self._ensure_reaper()
+        try:
+            await session.start(
+                ffmpeg_args("pipe:0" if feed else source, session.directory, steps, live),
+                feed() if feed else None,
+            )
+        except OSError as e:
+            await self._remove(session)
+            raise TranscodeError(f"Could not start ffmpeg: {e}")
+        await self._announce(session)
+        return session
+
+    async def _remove(self, session: TranscodeSession):
+        self.sessions.pop(session.id, None)
+        if self._by_key.get(session.key) is session:
+            del self._by_key[session.key]
+        await self._retract(session)
+        await session.stop()
+
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def _reap(self):
+        while self.sessions:
+            await asyncio.sleep(min(10.0, settings.transcode_idle_timeout))
+            redis = await get_redis()
+            async with self._lock:
+                for session in list(self.sessions.values()):
+                    if await self._idle_seconds(session, redis) > settings.transcode_idle_timeout:
+                        print(f"Stopping idle transcode session {session.id} ({session.key[0]})")
+                        await self._remove(session)
+                    else:
+                        await self._announce(session)  # keeps the registration from expiring
+
+    async def stop(self, session_id: str) -> bool:
+        async with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return False
+            await self._remove(session)
+            return True
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        async with self._lock:
+            for session in list(self.sessions.values()):
+                await self._remove(session)
+
+    def stats(self) -> dict:
+        transcodes, remuxes = self._in_use()
+        return {
+            "slots": transcode_slots(),
+            "transcodes": transcodes,
+            "remuxes": remuxes,
+            "started": self.started,
+            "rejected": self.rejected,
+            "sessions": [session.stats() for session in self.sessions.values()],
+        }
+
+
+transcode_manager = TranscodeManager()
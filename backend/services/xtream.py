@@ -0,0 +1,237 @@
+import asyncio
+import base64
+import binascii
+import codecs
+import hashlib
+import json
+import re
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from config import settings
+from services.cache import TTLCache
+from services.http_clients import http_clients
+
+LIVE_STREAM_RE = re.compile(r"/live/[^/]+/[^/]+/(\d+)\.\w+$")
+
+_decoder = json.JSONDecoder()
+
+# Decoded player_api.php responses, keyed by account and query
+_responses = TTLCache(settings.xtream_cache_size, settings.xtream_cache_ttl)
+
+
+def parse_xtream_path(file_path: str) -> Optional[Tuple[str, str, str]]:
+    """Split an xtream://{url}/{username}/{password} path into its parts"""
+    if not file_path.startswith("xtream://"):
+        return None
+    parts = file_path[len("xtream://"):].rsplit("/", 2)
+    if len(parts) != 3:
+        return None
+    return parts[0], parts[1], parts[2]
+
+
+def stream_id_from_url(url: str) -> Optional[int]:
+    """The stream id of a live URL built by XtreamClient.live_url"""
+    match = LIVE_STREAM_RE.search(url)
+    return int(match.group(1)) if match else None
+
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Yield the items of a top-level JSON array as its bytes arrive.
+
+    Only the item being received is buffered, so a 100 MB stream list never
+    exists as one string. A body that isn't an array (panels answer `{}` or
+    `null` for an empty list) is decoded whole and yields nothing unless it
+    is a list.
+    """
+    text = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    pos = 0
+    started = False
+    done = False
+
+    async for chunk in chunks:
+        buffer += text.decode(chunk)
+        if not started:
+            stripped = buffer.lstrip()
+            if not stripped:
+                continue
+            if stripped[0] != "[":
+                async for more in chunks:
+                    buffer += text.decode(more)
+                value = json.loads(buffer + text.decode(b"", final=True))
+                for item in value if isinstance(value, list) else ():
+                    yield item
+                return
+            started = True
+            pos = buffer.index("[") + 1
+
+        while not done:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == "]":
+                done = True
+                break
+            try:
+                item, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # the item continues in the next chunk
+            if not isinstance(item, (dict, list, str)) and (end == len(buffer) or buffer[end] not in " \t\r\n,]"):
+                break  # a number or literal may continue in the next chunk ("3." then "25")
+            pos = end
+            yield item
+
+        # Drop what has been decoded so the buffer only holds the current item
+        buffer = buffer[pos:]
+        pos = 0
+
+    if started and not done:
+        raise ValueError("Truncated JSON array in response")
+
+
+def _decode_text(value: Optional[str]) -> Optional[str]:
+    """get_short_epg returns titles and descriptions base64 encoded"""
+    if not value:
+        return value
+    try:
+        return base64.b64decode(value, validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError):
+        return value
+
+
+def _timestamp(value) -> Optional[datetime]:
+    try:
+        return datetime.fromtimestamp(int(value), tz=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+class XtreamClient:
+    """player_api.php client for one Xtream Codes account.
+
+    List responses are decoded as they stream in and cached for
+    xtream_cache_ttl, so a refresh shortly after an import doesn't
+    download the provider's lists again.
+    """
+
+    def __init__(self, url: str, username: str, password: str, use_cache: bool = True):
+        self.base_url = url.rstrip("/")
+        self.username = username
+        self.password = password
+        self.use_cache = use_cache
+
+    def _api_url(self, action: Optional[str] = None, **params) -> str:
+        query = {"username": self.username, "password": self.password}
+        if action:
+            query["action"] = action
+        query.update({key: value for key, value in params.items() if value is not None})
+        return f"{self.base_url}/player_api.php?{urlencode(query)}"
+
+    async def _call(self, action: Optional[str] = None, as_list: bool = True, ttl: Optional[float] = None, **params):
+        url = self._api_url(action, **params)
+        if self.use_cache:
+            cached = _responses.get(url)
+            if cached is not None:
+                return cached
+
+        async with http_clients.stream("GET", url, profile="api") as response:
+            response.raise_for_status()
+            if as_list:
+                value = [item async for item in iter_json_array(response.aiter_bytes())]
+            else:
+                value = json.loads(await response.aread())
+
+        _responses.set(url, value, ttl)
+        return value
+
+    async def account_info(self) -> dict:
+        """user_info and server_info; raises ValueError when the panel rejects the login"""
+        info = await self._call(as_list=False, ttl=60)
+        if not isinstance(info, dict) or not (info.get("user_info") or {}).get("auth"):
+            raise ValueError("Xtream login failed")
+        return info
+
+    async def live_categories(self) -> List[dict]:
+        return await self._call("get_live_categories")
+
+    async def live_streams(self, category_id: Optional[str] = None) -> List[dict]:
+        return await self._call("get_live_streams", category_id=category_id)
+
+    async def vod_categories(self) -> List[dict]:
+        return await self._call("get_vod_categories")
+
+    async def vod_streams(self, category_id: Optional[str] = None) -> List[dict]:
+        return await self._call("get_vod_streams", category_id=category_id)
+
+    async def series(self, category_id: Optional[str] = None) -> List[dict]:
+        return await self._call("get_series", category_id=category_id)
+
+    async def short_epg(self, stream_id: int, limit: int = 4) -> List[dict]:
+        data = await self._call(
+            "get_short_epg", as_list=False, ttl=settings.xtream_epg_cache_ttl, stream_id=stream_id, limit=limit
+        )
+        listings = data.get("epg_listings", []) if isinstance(data, dict) else []
+        return [
+            {
+                "title": _decode_text(listing.get("title")),
+                "description": _decode_text(listing.get("description")),
+                "start_time": _timestamp(listing.get("start_timestamp")),
+                "end_time": _timestamp(listing.get("stop_timestamp")),
+            }
+            for listing in listings
+        ]
+
+    def live_url(self, stream_id, extension: Optional[str] = None) -> str:
+        extension = extension or settings.xtream_live_format
+        return f"{self.base_url}/live/{self.username}/{self.password}/{stream_id}.{extension}"
+
+    def vod_url(self, stream_id, extension: Optional[str] = None) -> str:
+        return f"{self.base_url}/movie/{self.username}/{self.password}/{stream_id}.{extension or 'mp4'}"
+
+    async def _per_category(self, categories: List[dict], fetch) -> List[Tuple[dict, List[dict]]]:
+        """Fetch one list per category, a bounded number at a time, in category order"""
+        semaphore = asyncio.Semaphore(settings.xtream_concurrency)
+
+        async def one(category):
+            async with semaphore:
+                return category, await fetch(category.get("category_id"))
+
+        return await asyncio.gather(*(one(category) for category in categories))
+
+    async def live_entries(self) -> List[dict]:
+        """Every live stream as a playlist entry, ordered by category"""
+        await self.account_info()
+        categories = await self.live_categories()
+        results = await self._per_category(categories, self.live_streams)
+
+        entries = []
+        seen = set()
+        for category, streams in results:
+            for stream in streams:
+                stream_id = stream.get("stream_id")
+                # Newer panels list a stream under each of its categories
+                if stream_id is None or stream_id in seen:
+                    continue
+                seen.add(stream_id)
+                entries.append({
+                    "name": stream.get("name") or "Unknown",
+                    "url": self.live_url(stream_id),
+                    "tvg_id": stream.get("epg_channel_id") or None,
+                    "logo_url": stream.get("stream_icon") or None,
+                    "category": category.get("category_name") or None,
+                    "language": None,
+                    "country": None,
+                })
+        return entries
+
+
+async def fetch_xtream_entries(url: str, username: str, password: str, use_cache: bool = True) -> List[dict]:
+    """Fetch live channels from the Xtream Codes API as playlist entries"""
+    return await XtreamClient(url, username, password, use_cache).live_entries()
+
+
+def entries_content_hash(entries: List[dict]) -> str:
+    return hashlib.sha256(json.dumps(entries, sort_keys=True).encode("utf-8")).hexdigest()
@@ -116,7 +116,7 @@ const LiveTVGrid = ({ channels }) => {
           <LogoContainer>
             {channel.logo_url ? (
               <Logo 
-                src={channel.logo_url} 
+                src={channel.logo_proxy_url || channel.logo_url} 
                 alt={channel.name}
                 onError={(e) => {
                   e.target.style.display = 'none';
@@ -114,9 +114,9 @@ const MediaGrid = ({ media, type }) => {
       {media.map((item) => (
         <MediaCard key={item.id} to={`/player/${type}/${item.id}`}>
           <ThumbnailContainer>
-            {item.thumbnail_path ? (
+            {item.thumbnail_url ? (
               <Thumbnail 
-                src={`/api/media/${item.id}/thumbnail`} 
+                src={item.thumbnail_url} 
                 alt={item.title}
                 onError={(e) => {
                   e.target.style.display = 'none';